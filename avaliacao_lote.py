@@ -0,0 +1,240 @@
+# avaliacao_lote.py
+# Avaliação em lote do RAG (ollama_rag.py) contra o LLM puro (ollama_pure.py) sobre um arquivo
+# JSON Lines de perguntas, por exemplo:
+#   {"id": "q1", "pergunta": "A ciprofloxacina interage com a teofilina?"}
+# (também são aceites as chaves 'question' e 'query'; sem 'id', usa-se o número da linha).
+#
+# As perguntas são processadas em lotes: os embeddings de cada lote são gerados num único
+# encode, a recuperação corre num pool de threads e as chamadas ao Ollama são assíncronas,
+# limitadas a --concorrencia pedidos simultâneos. Cada resultado é acrescentado ao arquivo de
+# saída logo que fica pronto, com a resposta, os chunk_ids recuperados e as latências de cada
+# etapa; ao reiniciar, as perguntas já avaliadas com sucesso são saltadas.
+
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import os
+import time
+
+import instrumentacao
+import ollama_cliente
+import ollama_pure
+import ollama_rag
+from drugbank_jsonl import escrever_registro, ler_registros
+
+# --- Configurações ---
+tamanho_lote = 32
+max_concorrencia_llm = 4
+max_threads_recuperacao = 4
+# Modos avaliados por pergunta
+MODOS = ('rag', 'puro')
+
+
+def texto_da_pergunta(registro):
+    return registro.get('pergunta') or registro.get('question') or registro.get('query')
+
+
+def ler_perguntas(caminho):
+    """Gera {'id', 'pergunta'} a partir do arquivo de perguntas, ignorando linhas sem texto."""
+    for numero, registro in enumerate(ler_registros(caminho), start=1):
+        texto = texto_da_pergunta(registro)
+        if not texto:
+            print(f"Aviso: registro {numero} sem pergunta. Ignorado.")
+            continue
+        yield {'id': str(registro.get('id', numero)), 'pergunta': texto}
+
+
+def ids_concluidos(caminho):
+    """IDs das perguntas já avaliadas sem erro num arquivo de resultados anterior."""
+    if not os.path.exists(caminho):
+        return set()
+    concluidos = set()
+    with open(caminho, 'r', encoding='utf-8') as f:
+        for linha in f:
+            try:
+                registro = json.loads(linha)
+            except json.JSONDecodeError:
+                # Linha cortada a meio por uma interrupção: essa pergunta volta a ser avaliada
+                continue
+            if not registro.get('erro'):
+                concluidos.add(registro['id'])
+    return concluidos
+
+
+def terminar_linha(caminho):
+    """Garante que o arquivo de resultados acaba em '\\n' antes de lhe acrescentar registros."""
+    if os.path.exists(caminho) and os.path.getsize(caminho):
+        with open(caminho, 'rb+') as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b'\n':
+                f.write(b'\n')
+
+
+def lotes(iteravel, tamanho):
+    lote = []
+    for item in iteravel:
+        lote.append(item)
+        if len(lote) == tamanho:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+class AvaliadorLote:
+    """Avalia as perguntas nos modos pedidos e escreve um registro de resultados por pergunta."""
+
+    def __init__(self, saida, modos=MODOS, concorrencia=max_concorrencia_llm, threads=max_threads_recuperacao):
+        self.saida = saida
+        self.modos = modos
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=threads, thread_name_prefix='avaliacao')
+        self.llm_semaforo = asyncio.Semaphore(concorrencia)
+        self.llm_cliente = ollama_cliente.criar_cliente_async()
+        self.avaliadas = 0
+        self.erros = 0
+
+    async def _gerar(self, model, messages, metricas):
+        async with self.llm_semaforo:
+            return "".join([token async for token in ollama_cliente.achat_stream(
+                self.llm_cliente, model, messages, metricas)])
+
+    async def avaliar_rag(self, pergunta, query_embedding):
+        loop = asyncio.get_running_loop()
+        inicio = time.perf_counter()
+        ids, chunks, metadatas, distances = await loop.run_in_executor(
+            self.executor, ollama_rag.recuperar_chunks, pergunta, query_embedding)
+        resultado = {'chunk_ids': ids, 'recuperacao_s': time.perf_counter() - inicio}
+        if not chunks:
+            resultado['resposta'] = ollama_rag.resposta_sem_contexto
+            return resultado
+
+        metricas = {}
+        # Só há cache de respostas com --cache-respostas (ollama_rag.answer_cache é None sem a opção)
+        resposta_em_cache = ollama_rag.obter_resposta_em_cache(ids, query_embedding, metricas)
+        if resposta_em_cache is not None:
+            resultado['resposta'] = resposta_em_cache
+            resultado['metricas'] = metricas
+            return resultado
+
+        messages = ollama_rag.construir_mensagens(pergunta, chunks, metadatas, distances, metricas)
+        resultado['resposta'] = await self._gerar(ollama_rag.llm_model_name, messages, metricas)
+        resultado['metricas'] = metricas
+        if ollama_rag.answer_cache is not None:
+            ollama_rag.answer_cache.guardar(ollama_rag.llm_model_name, ids, query_embedding, resultado['resposta'])
+        return resultado
+
+    async def avaliar_puro(self, pergunta):
+        metricas = {}
+        messages = ollama_cliente.mensagens_chat(ollama_pure.system_prompt_pure, pergunta)
+        resposta = await self._gerar(ollama_pure.llm_model_name, messages, metricas)
+        return {'resposta': resposta, 'metricas': metricas}
+
+    async def avaliar(self, item, query_embedding, embedding_s):
+        """Avalia uma pergunta nos dois modos em paralelo e escreve o resultado."""
+        registro = {'id': item['id'], 'pergunta': item['pergunta']}
+        tarefas = {}
+        if 'rag' in self.modos:
+            tarefas['rag'] = self.avaliar_rag(item['pergunta'], query_embedding)
+        if 'puro' in self.modos:
+            tarefas['puro'] = self.avaliar_puro(item['pergunta'])
+
+        resultados = await asyncio.gather(*tarefas.values(), return_exceptions=True)
+        for modo, resultado in zip(tarefas, resultados):
+            if isinstance(resultado, Exception):
+                registro['erro'] = f"{modo}: {resultado}"
+            else:
+                registro[modo] = resultado
+        if 'rag' in registro:
+            registro['rag']['embedding_s'] = embedding_s
+
+        escrever_registro(self.saida, registro)
+        self.saida.flush()
+        self.avaliadas += 1
+        if registro.get('erro'):
+            self.erros += 1
+
+    async def executar(self, perguntas, tamanho=tamanho_lote):
+        """Processa os lotes; o embedding do lote seguinte sobrepõe-se às chamadas ao LLM do anterior."""
+        loop = asyncio.get_running_loop()
+        pendentes = set()
+        for lote in lotes(perguntas, tamanho):
+            embeddings = [None] * len(lote)
+            embedding_s = 0.0
+            if 'rag' in self.modos:
+                inicio = time.perf_counter()
+                embeddings = await loop.run_in_executor(
+                    self.executor, ollama_rag.embeddings_das_queries, [item['pergunta'] for item in lote])
+                # Tempo do encode em lote repartido pelas perguntas do lote
+                embedding_s = (time.perf_counter() - inicio) / len(lote)
+
+            for item, embedding in zip(lote, embeddings):
+                pendentes.add(asyncio.create_task(self.avaliar(item, embedding, embedding_s)))
+
+            # No máximo um lote fica em curso no LLM enquanto o seguinte é preparado
+            while len(pendentes) > tamanho:
+                _, pendentes = await asyncio.wait(pendentes, return_when=asyncio.FIRST_COMPLETED)
+            print(f"Perguntas avaliadas: {self.avaliadas} (erros: {self.erros})")
+
+        if pendentes:
+            await asyncio.wait(pendentes)
+        for tarefa in pendentes:
+            tarefa.result()
+
+    def fechar(self):
+        self.executor.shutdown(wait=False)
+
+
+async def avaliar_arquivo(args):
+    modos = MODOS if args.modo == 'ambos' else (args.modo,)
+    concluidos = ids_concluidos(args.output)
+    if concluidos:
+        print(f"Retomando: {len(concluidos)} perguntas já avaliadas em {args.output} serão saltadas.")
+    perguntas = (item for item in ler_perguntas(args.input) if item['id'] not in concluidos)
+
+    if 'rag' in modos:
+        # As respostas em cache não refletiriam o desempenho real do LLM
+        ollama_rag.usar_answer_cache = args.cache_respostas
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, ollama_rag.inicializar)
+
+    inicio = time.perf_counter()
+    terminar_linha(args.output)
+    with open(args.output, 'a', encoding='utf-8') as saida:
+        avaliador = AvaliadorLote(saida, modos, concorrencia=args.concorrencia, threads=args.threads)
+        try:
+            await avaliador.executar(perguntas, tamanho=args.lote)
+        finally:
+            avaliador.fechar()
+
+    decorrido = time.perf_counter() - inicio
+    taxa = avaliador.avaliadas / decorrido if decorrido else 0.0
+    print(f"\nAvaliação concluída: {avaliador.avaliadas} perguntas em {decorrido:.1f}s "
+          f"({taxa:.2f} perguntas/s), {avaliador.erros} com erro. Resultados em {args.output}")
+    print(f"Latência por etapa:\n{instrumentacao.registo.formatar()}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Avaliação em lote do RAG contra o LLM puro.")
+    parser.add_argument('--input', required=True, help="Arquivo JSON Lines com as perguntas ('-' para stdin).")
+    parser.add_argument('--output', default='avaliacao_resultados.jsonl',
+                        help="Arquivo JSON Lines de resultados (acrescentado; permite retomar).")
+    parser.add_argument('--modo', choices=['ambos', 'rag', 'puro'], default='ambos')
+    parser.add_argument('--lote', type=int, default=tamanho_lote, help="Perguntas por lote de embeddings.")
+    parser.add_argument('--concorrencia', type=int, default=max_concorrencia_llm,
+                        help="Pedidos simultâneos máximos ao Ollama.")
+    parser.add_argument('--threads', type=int, default=max_threads_recuperacao,
+                        help="Threads para o encode e as buscas no ChromaDB.")
+    parser.add_argument('--cache-respostas', action='store_true',
+                        help="Usar a cache de respostas do RAG (desligada por padrão na avaliação).")
+    args = parser.parse_args(argv)
+    instrumentacao.configurar_logging()
+
+    try:
+        asyncio.run(avaliar_arquivo(args))
+    except KeyboardInterrupt:
+        print("Avaliação interrompida; execute de novo para retomar.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+# Micro-benchmark de extract_antibiotic_data sobre um XML sintético com a estrutura do DrugBank.
+# Compara a implementação original (find/findall por campo) com o extrator compilado
+# de drugbank_json.py e verifica que ambos produzem exatamente os mesmos dados.
+#
+#   python bench_drugbank_json.py --drugs 500 --interactions 200
+
+import argparse
+import time
+
+import lxml.etree as etree
+
+from drugbank_json import DB_NAMESPACE, NS_MAP, extract_antibiotic_data
+
+
+def gerar_drug_xml(i, n_interacoes, n_produtos, n_alvos, n_dosagens):
+    """Gera o XML de um <drug> sintético com os campos lidos pelo extrator."""
+    partes = [
+        '<drug type="small molecule">',
+        f'<drugbank-id primary="true">DB{i:05d}</drugbank-id>',
+        f'<drugbank-id>APRD{i:05d}</drugbank-id>',
+        f'<name>Droga {i}</name>',
+        f'<description>Descrição sintética da droga {i}. ' + 'Texto longo. ' * 20 + '</description>',
+        f'<cas-number>{i}-00-0</cas-number>',
+        '<unii>ABCDEF1234</unii>',
+        '<groups><group>approved</group><group>investigational</group></groups>',
+        '<indication>Infeções bacterianas.</indication>',
+        '<pharmacodynamics>Farmacodinâmica.</pharmacodynamics>',
+        '<mechanism-of-action>Inibe a síntese da parede celular.</mechanism-of-action>',
+        '<toxicity>Toxicidade baixa.</toxicity>',
+        '<metabolism>Metabolizado pelo CYP3A4.</metabolism>',
+        '<absorption>Bem absorvido.</absorption>',
+        '<half-life>1 hora</half-life>',
+        '<protein-binding>20%</protein-binding>',
+        '<route-of-elimination>Renal.</route-of-elimination>',
+        '<volume-of-distribution>0.3 L/kg</volume-of-distribution>',
+        '<clearance>200 mL/min</clearance>',
+        '<classification><description/><direct-parent>Penicilinas</direct-parent>'
+        '<subclass>Lactamas</subclass><alternative-parent>Beta-lactamas</alternative-parent>'
+        '<substituent>Amida</substituent><substituent>Tiazolidina</substituent></classification>',
+        '<synonyms>' + ''.join(f'<synonym language="english">Sinónimo {i}-{k}</synonym>' for k in range(5)) + '</synonyms>',
+        '<products>' + ''.join(
+            f'<product><name>Produto {k}</name><labeller>Lab {k}</labeller><ndc-id/><dosage-form>Tablet</dosage-form>'
+            f'<strength>500 mg</strength><route>Oral</route><generic>true</generic><approved>true</approved>'
+            f'<country>US</country></product>'
+            for k in range(n_produtos)) + '</products>',
+        '<categories>' + ''.join(
+            f'<category><category>Anti-Bacterial Agents {k}</category><mesh-id>D{k:06d}</mesh-id></category>'
+            for k in range(10)) + '</categories>',
+        '<affected-organisms><affected-organism>Humans and other mammals</affected-organism></affected-organisms>',
+        '<dosages>' + ''.join(
+            f'<dosage><form>Tablet</form><route>Oral</route><strength>{k * 100} mg</strength></dosage>'
+            for k in range(n_dosagens)) + '</dosages>',
+        '<food-interactions><food-interaction>Tomar com alimentos.</food-interaction></food-interactions>',
+        '<drug-interactions>' + ''.join(
+            f'<drug-interaction><drugbank-id>DB{k:05d}</drugbank-id><name>Droga {k}</name>'
+            f'<description>O risco de efeitos adversos aumenta quando a Droga {i} é combinada com a Droga {k}.</description>'
+            f'</drug-interaction>'
+            for k in range(n_interacoes)) + '</drug-interactions>',
+        '<external-identifiers><external-identifier><resource>ChEBI</resource><identifier>12345</identifier>'
+        '</external-identifier><external-identifier><resource>PubChem Compound</resource><identifier>678</identifier>'
+        '</external-identifier></external-identifiers>',
+        '<targets>' + ''.join(
+            f'<target position="{k}"><id>BE{k:07d}</id><name>Alvo {k}</name><polypeptide id="P{k:05d}" source="Swiss-Prot">'
+            f'<name>Proteína {k}</name><external-identifiers>'
+            f'<external-identifier><resource>HUGO Gene Nomenclature Committee (HGNC)</resource><identifier>HGNC:{k}</identifier></external-identifier>'
+            f'<external-identifier><resource>UniProtKB</resource><identifier>P{k:05d}</identifier></external-identifier>'
+            f'</external-identifiers></polypeptide></target>'
+            for k in range(n_alvos)) + '</targets>',
+        '</drug>',
+    ]
+    return ''.join(partes)
+
+
+def gerar_xml(n_drugs, n_interacoes, n_produtos, n_alvos, n_dosagens):
+    """Gera um documento <drugbank> sintético com n_drugs elementos <drug>."""
+    drugs = ''.join(gerar_drug_xml(i, n_interacoes, n_produtos, n_alvos, n_dosagens) for i in range(n_drugs))
+    return f'<drugbank xmlns="{DB_NAMESPACE}" version="5.1">{drugs}</drugbank>'.encode('utf-8')
+
+
+def _safe_extract_text_referencia(element, xpath, namespace_map):
+    """Extrai texto de um elemento usando XPath, retornando None se não encontrado."""
+    found_element = element.find(xpath, namespace_map)
+    if found_element is not None and found_element.text:
+        return found_element.text.strip()
+    return None
+
+
+def extract_antibiotic_data_referencia(drug_element):
+    """Implementação original (find/findall com tags formatadas a cada chamada), usada como referência."""
+    drug_data = {}
+
+    # 1. Informações Essenciais
+    # Encontrar o drugbank-id primário
+    primary_id_elem = drug_element.find('{%s}drugbank-id[@primary="true"]' % DB_NAMESPACE)
+    drug_data['drugbank_id'] = primary_id_elem.text.strip() if primary_id_elem is not None and primary_id_elem.text else None
+    if not drug_data['drugbank_id']:  # Se não encontrou primário, pega o primeiro disponível
+        any_id_elem = drug_element.find('{%s}drugbank-id' % DB_NAMESPACE)
+        drug_data['drugbank_id'] = any_id_elem.text.strip() if any_id_elem is not None and any_id_elem.text else None
+
+    drug_data['name'] = _safe_extract_text_referencia(drug_element, '{%s}name' % DB_NAMESPACE, NS_MAP)
+    drug_data['description'] = _safe_extract_text_referencia(drug_element, '{%s}description' % DB_NAMESPACE, NS_MAP)
+    drug_data['cas_number'] = _safe_extract_text_referencia(drug_element, '{%s}cas-number' % DB_NAMESPACE, NS_MAP)
+    drug_data['unii'] = _safe_extract_text_referencia(drug_element, '{%s}unii' % DB_NAMESPACE, NS_MAP)
+    drug_data['indication'] = _safe_extract_text_referencia(drug_element, '{%s}indication' % DB_NAMESPACE, NS_MAP)
+    drug_data['toxicity'] = _safe_extract_text_referencia(drug_element, '{%s}toxicity' % DB_NAMESPACE, NS_MAP)
+
+    # Grupos
+    groups = []
+    groups_elem = drug_element.find('{%s}groups' % DB_NAMESPACE)
+    if groups_elem is not None:
+        for group_elem in groups_elem.findall('{%s}group' % DB_NAMESPACE):
+            if group_elem.text:
+                groups.append(group_elem.text.strip())
+    drug_data['groups'] = groups
+
+    # Categorias
+    categories = []
+    categories_elem = drug_element.find('{%s}categories' % DB_NAMESPACE)
+    if categories_elem is not None:
+        for category_elem in categories_elem.findall('{%s}category' % DB_NAMESPACE):
+            cat_name_elem = category_elem.find('{%s}category' % DB_NAMESPACE)
+            if cat_name_elem is not None and cat_name_elem.text:
+                categories.append(cat_name_elem.text.strip())
+    drug_data['categories'] = categories
+
+    # Organismos Afetados
+    affected_organisms = []
+    affected_organisms_elem = drug_element.find('{%s}affected-organisms' % DB_NAMESPACE)
+    if affected_organisms_elem is not None:
+        for organism_elem in affected_organisms_elem.findall('{%s}affected-organism' % DB_NAMESPACE):
+            if organism_elem.text:
+                affected_organisms.append(organism_elem.text.strip())
+    drug_data['affected_organisms'] = affected_organisms
+
+    # 2. Informações para Interações (ADME, Mecanismo)
+    drug_data['pharmacodynamics'] = _safe_extract_text_referencia(drug_element, '{%s}pharmacodynamics' % DB_NAMESPACE, NS_MAP)
+    drug_data['mechanism_of_action'] = _safe_extract_text_referencia(drug_element, '{%s}mechanism-of-action' % DB_NAMESPACE, NS_MAP)
+    drug_data['metabolism'] = _safe_extract_text_referencia(drug_element, '{%s}metabolism' % DB_NAMESPACE, NS_MAP)
+    drug_data['absorption'] = _safe_extract_text_referencia(drug_element, '{%s}absorption' % DB_NAMESPACE, NS_MAP)
+    drug_data['half_life'] = _safe_extract_text_referencia(drug_element, '{%s}half-life' % DB_NAMESPACE, NS_MAP)
+    drug_data['protein_binding'] = _safe_extract_text_referencia(drug_element, '{%s}protein-binding' % DB_NAMESPACE, NS_MAP)
+    drug_data['route_of_elimination'] = _safe_extract_text_referencia(drug_element, '{%s}route-of-elimination' % DB_NAMESPACE, NS_MAP)
+    drug_data['volume_of_distribution'] = _safe_extract_text_referencia(drug_element, '{%s}volume-of-distribution' % DB_NAMESPACE, NS_MAP)
+    drug_data['clearance'] = _safe_extract_text_referencia(drug_element, '{%s}clearance' % DB_NAMESPACE, NS_MAP)
+
+    # 3. Interações Diretas
+    # Interações Medicamentosas
+    drug_interactions = []
+    drug_interactions_elem = drug_element.find('{%s}drug-interactions' % DB_NAMESPACE)
+    if drug_interactions_elem is not None:
+        for interaction_elem in drug_interactions_elem.findall('{%s}drug-interaction' % DB_NAMESPACE):
+            interacting_id_elem = interaction_elem.find('{%s}drugbank-id' % DB_NAMESPACE)
+            interacting_name_elem = interaction_elem.find('{%s}name' % DB_NAMESPACE)
+            description_elem = interaction_elem.find('{%s}description' % DB_NAMESPACE)
+
+            interaction_detail = {
+                'drugbank_id': interacting_id_elem.text.strip() if interacting_id_elem is not None and interacting_id_elem.text else None,
+                'name': interacting_name_elem.text.strip() if interacting_name_elem is not None and interacting_name_elem.text else None,
+                'description': description_elem.text.strip() if description_elem is not None and description_elem.text else None,
+            }
+            if any(interaction_detail.values()):  # Adiciona apenas se tiver pelo menos um campo preenchido
+                drug_interactions.append(interaction_detail)
+    drug_data['drug_interactions'] = drug_interactions
+
+    # Interações com Alimentos
+    food_interactions = []
+    food_interactions_elem = drug_element.find('{%s}food-interactions' % DB_NAMESPACE)
+    if food_interactions_elem is not None:
+        for fi_elem in food_interactions_elem.findall('{%s}food-interaction' % DB_NAMESPACE):
+            if fi_elem.text:
+                food_interactions.append(fi_elem.text.strip())
+    drug_data['food_interactions'] = food_interactions
+
+    # 4. Alvos
+    targets = []
+    targets_elem = drug_element.find('{%s}targets' % DB_NAMESPACE)
+    if targets_elem is not None:
+        for target_elem in targets_elem.findall('{%s}target' % DB_NAMESPACE):
+            # A estrutura interna de target pode ser complexa, aqui pegamos apenas o ID UniProt se existir
+            polypeptide_elem = target_elem.find('{%s}polypeptide' % DB_NAMESPACE)
+            if polypeptide_elem is not None:
+                uniprot_id_elem = polypeptide_elem.find(
+                    '{%s}external-identifiers/{%s}external-identifier[{%s}resource="UniProtKB"]/{%s}identifier' % (
+                        DB_NAMESPACE, DB_NAMESPACE, DB_NAMESPACE, DB_NAMESPACE))
+                name_elem = polypeptide_elem.find('{%s}name' % DB_NAMESPACE)
+                target_detail = {
+                    'uniprot_id': uniprot_id_elem.text.strip() if uniprot_id_elem is not None and uniprot_id_elem.text else None,
+                    'name': name_elem.text.strip() if name_elem is not None and name_elem.text else None
+                }
+                if any(target_detail.values()):
+                    targets.append(target_detail)
+    drug_data['targets'] = targets
+
+    # 5. Dosagens
+    dosages = []
+    dosages_elem = drug_element.find('{%s}dosages' % DB_NAMESPACE)
+    if dosages_elem is not None:
+        for dosage_elem in dosages_elem.findall('{%s}dosage' % DB_NAMESPACE):
+            form = _safe_extract_text_referencia(dosage_elem, '{%s}form' % DB_NAMESPACE, NS_MAP)
+            route = _safe_extract_text_referencia(dosage_elem, '{%s}route' % DB_NAMESPACE, NS_MAP)
+            strength = _safe_extract_text_referencia(dosage_elem, '{%s}strength' % DB_NAMESPACE, NS_MAP)
+            dosage_detail = {'form': form, 'route': route, 'strength': strength}
+            if any(dosage_detail.values()):
+                dosages.append(dosage_detail)
+    drug_data['dosages'] = dosages
+    
+    # 6. Produtos - Incluindo labeller
+    products = []
+    products_elem = drug_element.find('{%s}products' % DB_NAMESPACE)
+    if products_elem is not None:
+        for product_elem in products_elem.findall('{%s}product' % DB_NAMESPACE):
+            product_detail = {
+                'name': _safe_extract_text_referencia(product_elem, '{%s}name' % DB_NAMESPACE, NS_MAP),
+                'labeller': _safe_extract_text_referencia(product_elem, '{%s}labeller' % DB_NAMESPACE, NS_MAP), 
+                'dosage_form': _safe_extract_text_referencia(product_elem, '{%s}dosage-form' % DB_NAMESPACE, NS_MAP),
+                'strength': _safe_extract_text_referencia(product_elem, '{%s}strength' % DB_NAMESPACE, NS_MAP),
+                'route': _safe_extract_text_referencia(product_elem, '{%s}route' % DB_NAMESPACE, NS_MAP),
+                'generic': _safe_extract_text_referencia(product_elem, '{%s}generic' % DB_NAMESPACE, NS_MAP),
+                'approved': _safe_extract_text_referencia(product_elem, '{%s}approved' % DB_NAMESPACE, NS_MAP),
+                'country': _safe_extract_text_referencia(product_elem, '{%s}country' % DB_NAMESPACE, NS_MAP)
+            }
+            if any(product_detail.values()):
+                products.append(product_detail)
+    drug_data['products'] = products
+
+    # 7. Sinônimos
+    synonyms = []
+    synonyms_elem = drug_element.find('{%s}synonyms' % DB_NAMESPACE)
+    if synonyms_elem is not None:
+        for synonym_elem in synonyms_elem.findall('{%s}synonym' % DB_NAMESPACE):
+            if synonym_elem.text:
+                synonyms.append(synonym_elem.text.strip())
+    drug_data['synonyms'] = synonyms
+
+    # 8. Classificação
+    classification = {}
+    classification_elem = drug_element.find('{%s}classification' % DB_NAMESPACE)
+    if classification_elem is not None:
+        classification['subclass'] = _safe_extract_text_referencia(classification_elem, '{%s}subclass' % DB_NAMESPACE, NS_MAP)
+        classification['alternative_parent'] = _safe_extract_text_referencia(classification_elem,
+                                                                 '{%s}alternative-parent' % DB_NAMESPACE, NS_MAP)
+        classification['substituent'] = _safe_extract_text_referencia(classification_elem, '{%s}substituent' % DB_NAMESPACE,
+                                                           NS_MAP)
+    if any(classification.values()):
+        drug_data['classification'] = classification
+    else:
+         drug_data['classification'] = None # Or an empty dict {} if you prefer
+
+
+    # 9. IDs Externos 
+    external_identifiers = []
+    ext_ids_elem = drug_element.find('{%s}external-identifiers' % DB_NAMESPACE)
+    if ext_ids_elem is not None:
+        for ext_id_elem in ext_ids_elem.findall('{%s}external-identifier' % DB_NAMESPACE):
+            resource = _safe_extract_text_referencia(ext_id_elem, '{%s}resource' % DB_NAMESPACE, NS_MAP)
+            identifier = _safe_extract_text_referencia(ext_id_elem, '{%s}identifier' % DB_NAMESPACE, NS_MAP)
+            if resource and identifier:
+                external_identifiers.append({'resource': resource, 'identifier': identifier})
+    drug_data['external_identifiers'] = external_identifiers
+
+    return drug_data
+
+
+def medir(funcao, drugs, repeticoes):
+    """Devolve o melhor tempo médio por drug (em microssegundos) em `repeticoes` passagens."""
+    melhor = float('inf')
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        for drug in drugs:
+            funcao(drug)
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor / len(drugs) * 1e6
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Micro-benchmark do extrator de drugbank_json.py.")
+    parser.add_argument('--drugs', type=int, default=200)
+    parser.add_argument('--interactions', type=int, default=200)
+    parser.add_argument('--products', type=int, default=30)
+    parser.add_argument('--targets', type=int, default=5)
+    parser.add_argument('--dosages', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    raiz = etree.fromstring(gerar_xml(args.drugs, args.interactions, args.products, args.targets, args.dosages))
+    drugs = list(raiz)
+    print(f"XML sintético: {len(drugs)} drugs, {args.interactions} interações, {args.products} produtos, "
+          f"{args.targets} alvos e {args.dosages} dosagens por drug")
+
+    for drug in drugs:
+        if extract_antibiotic_data(drug) != extract_antibiotic_data_referencia(drug):
+            raise SystemExit(f"Resultados diferentes para {drug[0].text}")
+    print("Saídas idênticas nas duas implementações.")
+
+    antes = medir(extract_antibiotic_data_referencia, drugs, args.repeat)
+    depois = medir(extract_antibiotic_data, drugs, args.repeat)
+    print(f"Original (find/findall): {antes:9.1f} µs/drug")
+    print(f"Compilado (uma passagem): {depois:9.1f} µs/drug")
+    print(f"Speedup: {antes / depois:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,18 @@
+# configuracao.py
+# Caminhos partilhados por todas as etapas do pipeline. Os valores padrão são relativos
+# ao diretório de trabalho e podem ser mudados com variáveis de ambiente, sem editar os
+# scripts (por exemplo num servidor Linux ou noutra máquina Windows):
+#   RAG_DATA_DIR   diretório dos arquivos intermédios (dataset, chunks, índice de pares)
+#   DRUGBANK_XML   arquivo XML completo do DrugBank
+#   CHROMA_DB_PATH diretório do ChromaDB (e dos índices BM25/.npy/caches guardados nele)
+
+import os
+
+diretorio_dados = os.environ.get('RAG_DATA_DIR', '.')
+
+xml_file_path = os.environ.get('DRUGBANK_XML', os.path.join('Projeto', 'drugbank.xml'))
+dataset_path = os.path.join(diretorio_dados, 'antibiotics_dataset.jsonl')
+snapshot_path = os.path.join(diretorio_dados, 'antibiotics_snapshot')
+chunks_path = os.path.join(diretorio_dados, 'antibiotics_chunks.jsonl')
+indice_pares_path = os.path.join(diretorio_dados, 'interacoes_pares.sqlite')
+chroma_db_path = os.environ.get('CHROMA_DB_PATH', os.path.join(diretorio_dados, 'chroma_db'))
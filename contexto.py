@@ -0,0 +1,127 @@
+# contexto.py
+# Montagem do contexto enviado ao LLM a partir dos chunks recuperados, dentro de um orçamento
+# de tokens. A avaliação do prompt é a maior parte da latência do Mistral em CPU e cresce com o
+# tamanho do contexto, por isso antes de o montar:
+#   - a mesma interação vista dos dois lados (A->B e B->A) só entra uma vez;
+#   - chunks quase iguais do mesmo tipo (texto repetido) são descartados;
+#   - os chunks são ordenados pela pontuação e incluídos enquanto cabem no orçamento;
+#   - cada chunk leva um cabeçalho curto em vez do cabeçalho longo com a distância.
+
+import math
+import re
+
+# Aproximação de caracteres por token do tokenizer do Mistral em texto português/inglês
+caracteres_por_token = 3.5
+
+# Similaridade de Jaccard (conjuntos de palavras) a partir da qual dois chunks do mesmo tipo
+# são considerados duplicados
+limiar_duplicado = 0.85
+
+_RE_PALAVRA = re.compile(r"\w+")
+
+
+def estimar_tokens(texto):
+    """Estimativa do número de tokens de um texto para o LLM."""
+    return math.ceil(len(texto) / caracteres_por_token)
+
+
+def cabecalho_original(i, metadata, distance):
+    """Cabeçalho longo usado antes da montagem com orçamento (serve de referência para a poupança)."""
+    distancia = f"{distance:.4f}" if distance is not None else "N/A"
+    return (f"### Informação do Dataset (Chunk {i+1} - Tipo: {metadata.get('chunk_type', 'N/A')}, "
+            f"ID DrugBank: {metadata.get('drugbank_id', 'N/A')}, Distância: {distancia}):\n")
+
+
+def cabecalho_compacto(i, metadata):
+    """Cabeçalho curto: número do chunk e tipo (o ID DrugBank já aparece no próprio texto)."""
+    return f"[{i+1}] {metadata.get('chunk_type', 'N/A')}\n"
+
+
+def _jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _chave_interacao(metadata):
+    """Chave que identifica uma interação medicamentosa independentemente do lado de onde é vista."""
+    if metadata.get('chunk_type') != 'drug_interaction':
+        return None
+    id_a, id_b = metadata.get('drugbank_id'), metadata.get('interacting_drug_id')
+    if not id_a or not id_b:
+        return None
+    return frozenset((id_a, id_b))
+
+
+def construir_contexto(chunks, metadatas, distances, orcamento_tokens, ordenar_por_distancia=True):
+    """
+    Monta o texto do contexto dentro de `orcamento_tokens`. Os chunks são ordenados pela distância
+    (quando todos a têm; senão mantêm a ordem da recuperação, ex.: fusão RRF). Com
+    `ordenar_por_distancia=False` mantêm sempre a ordem recebida (ex.: após o re-ranking).
+    Devolve (contexto, estatisticas).
+    """
+    tokens_originais = estimar_tokens("\n\n".join(
+        f"{cabecalho_original(i, metadata, distance)}{chunk}\n"
+        for i, (chunk, metadata, distance) in enumerate(zip(chunks, metadatas, distances))))
+
+    ordem = list(range(len(chunks)))
+    if ordenar_por_distancia and all(distance is not None for distance in distances):
+        ordem.sort(key=lambda i: distances[i])
+
+    partes = []
+    tokens_usados = 0
+    interacoes_vistas = set()
+    palavras_incluidas = []  # (chunk_type, conjunto de palavras) dos chunks já incluídos
+    descartados = {'interacao_repetida': 0, 'quase_duplicado': 0, 'orcamento': 0}
+
+    for i in ordem:
+        chunk, metadata = chunks[i].strip(), metadatas[i]
+
+        chave = _chave_interacao(metadata)
+        if chave is not None and chave in interacoes_vistas:
+            descartados['interacao_repetida'] += 1
+            continue
+
+        chunk_type = metadata.get('chunk_type')
+        palavras = set(_RE_PALAVRA.findall(chunk.casefold()))
+        if any(tipo == chunk_type and _jaccard(palavras, outras) >= limiar_duplicado
+               for tipo, outras in palavras_incluidas):
+            descartados['quase_duplicado'] += 1
+            continue
+
+        parte = cabecalho_compacto(len(partes), metadata) + chunk
+        tokens = estimar_tokens(parte) + 1  # + separador
+        if tokens_usados + tokens > orcamento_tokens:
+            if partes:
+                # Continua: um chunk mais curto ainda pode caber
+                descartados['orcamento'] += 1
+                continue
+            # O primeiro chunk nunca fica de fora; é cortado para caber no orçamento
+            parte = parte[:int(orcamento_tokens * caracteres_por_token)]
+            tokens = estimar_tokens(parte)
+
+        partes.append(parte)
+        tokens_usados += tokens
+        if chave is not None:
+            interacoes_vistas.add(chave)
+        palavras_incluidas.append((chunk_type, palavras))
+
+    contexto = "\n\n".join(partes)
+    estatisticas = {
+        'chunks_recuperados': len(chunks),
+        'chunks_usados': len(partes),
+        'descartados': descartados,
+        'tokens_originais': tokens_originais,
+        'tokens_contexto': estimar_tokens(contexto),
+    }
+    estatisticas['tokens_poupados'] = max(0, tokens_originais - estatisticas['tokens_contexto'])
+    return contexto, estatisticas
+
+
+def formatar_estatisticas(estatisticas):
+    """Resumo legível da montagem do contexto."""
+    descartados = estatisticas['descartados']
+    return (f"Contexto: {estatisticas['chunks_usados']}/{estatisticas['chunks_recuperados']} chunks, "
+            f"~{estatisticas['tokens_contexto']} tokens (~{estatisticas['tokens_poupados']} poupados) | "
+            f"descartados: {descartados['interacao_repetida']} interações repetidas, "
+            f"{descartados['quase_duplicado']} quase duplicados, {descartados['orcamento']} fora do orçamento")
@@ -0,0 +1,144 @@
+# divisor_chunks.py
+# Divisão de chunks maiores que a sequência máxima do modelo de embedding.
+#
+# O all-MiniLM-L6-v2 só vê os primeiros 256 word-pieces de cada texto: o resto de um
+# chunk longo (ex.: 'products' com todos os produtos, ou 'summary' com a descrição e a
+# indicação completas) seria truncado no encode, sem nunca poder ser recuperado. Estes
+# chunks são divididos em partes sobrepostas que cabem no modelo:
+#   - cada parte tem o id '{chunk_id}#n' (estável entre indexações) e os metadados do
+#     chunk original, mais parent_chunk_id, part, total_parts e a posição (char_start,
+#     char_end) do seu texto no conteúdo original;
+#   - as partes a partir da segunda começam com a primeira linha do original (nome e ID
+#     da droga), para não perderem o contexto; prefix_chars é o tamanho desse prefixo;
+#   - na recuperação, juntar_partes volta a unir as partes do mesmo chunk encontradas na
+#     mesma busca, sem repetir o texto sobreposto.
+
+# Tokens partilhados por duas partes consecutivas
+sobreposicao_tokens = 32
+# Fração máxima de cada parte ocupada pela primeira linha repetida
+fracao_max_cabecalho = 0.25
+
+CAMPOS_PARTE = ('parent_chunk_id', 'part', 'total_parts', 'char_start', 'char_end', 'prefix_chars')
+
+
+def max_tokens_do_modelo(embedding_model):
+    """Tokens de texto que cabem no modelo ([CLS] e [SEP] ocupam duas posições)."""
+    return embedding_model.max_seq_length - 2
+
+
+def _offsets(tokenizer, texto):
+    return tokenizer(texto, add_special_tokens=False, return_offsets_mapping=True,
+                     truncation=False)['offset_mapping']
+
+
+def _janelas(total, max_tokens, tokens_cabecalho, sobreposicao):
+    """Intervalos [inicio, fim) de tokens de cada parte; a primeira não leva cabeçalho."""
+    janelas = []
+    inicio = 0
+    while True:
+        tamanho = max_tokens if not janelas else max_tokens - tokens_cabecalho
+        fim = min(inicio + tamanho, total)
+        janelas.append((inicio, fim))
+        if fim == total:
+            return janelas
+        inicio = fim - min(sobreposicao, tamanho // 2)
+
+
+def dividir_chunk(chunk, tokenizer, max_tokens, sobreposicao=None):
+    """Gera o chunk tal como está se couber em max_tokens; senão, as suas partes sobrepostas."""
+    texto = chunk['content']
+    # Cada token cobre pelo menos um caractere: textos curtos nem precisam de ser tokenizados
+    if len(texto) <= max_tokens:
+        yield chunk
+        return
+    offsets = _offsets(tokenizer, texto)
+    if len(offsets) <= max_tokens:
+        yield chunk
+        return
+
+    if sobreposicao is None:
+        sobreposicao = sobreposicao_tokens
+    cabecalho = texto.split('\n', 1)[0]
+    tokens_cabecalho = len(_offsets(tokenizer, cabecalho))
+    if '\n' not in texto or tokens_cabecalho > max_tokens * fracao_max_cabecalho:
+        cabecalho, tokens_cabecalho = '', 0
+    prefixo = cabecalho + '\n' if cabecalho else ''
+
+    janelas = _janelas(len(offsets), max_tokens, tokens_cabecalho, sobreposicao)
+    for n, (inicio, fim) in enumerate(janelas):
+        char_start = 0 if n == 0 else offsets[inicio][0]
+        char_end = offsets[fim - 1][1]
+        parte = dict(chunk)
+        parte.update({
+            'chunk_id': f"{chunk['chunk_id']}#{n}",
+            'parent_chunk_id': chunk['chunk_id'],
+            'part': n,
+            'total_parts': len(janelas),
+            'char_start': char_start,
+            'char_end': char_end,
+            'prefix_chars': 0 if n == 0 else len(prefixo),
+            'content': texto[char_start:char_end] if n == 0 else prefixo + texto[char_start:char_end],
+        })
+        yield parte
+
+
+def dividir_chunks(chunks, tokenizer, max_tokens, sobreposicao=None):
+    """Aplica dividir_chunk a um stream de chunks. Devolve um gerador."""
+    for chunk in chunks:
+        yield from dividir_chunk(chunk, tokenizer, max_tokens, sobreposicao)
+
+
+def _juntar_textos(partes):
+    """Texto das partes (metadata, documento) de um chunk, pela ordem, sem o texto sobreposto."""
+    partes = sorted(partes, key=lambda p: p[0]['part'])
+    metadata, documento = partes[0]
+    texto = documento
+    fim = metadata['char_end']
+    for metadata, documento in partes[1:]:
+        corpo = documento[metadata['prefix_chars']:]
+        if metadata['char_start'] <= fim:
+            texto += corpo[fim - metadata['char_start']:]
+        else:
+            texto += "\n[...]\n" + corpo
+        fim = max(fim, metadata['char_end'])
+    return texto
+
+
+def juntar_partes(ids, documentos, metadatas, distancias):
+    """
+    Une as partes do mesmo chunk original encontradas numa busca num só resultado, na
+    posição da primeira, com o id do original e a menor distância das partes. Recebe e
+    devolve (ids, documentos, metadatas, distancias), como recuperar_chunks.
+    """
+    irmaos = {}
+    for metadata in metadatas:
+        pai = (metadata or {}).get('parent_chunk_id')
+        if pai is not None:
+            irmaos[pai] = irmaos.get(pai, 0) + 1
+    if all(n == 1 for n in irmaos.values()):
+        return ids, documentos, metadatas, distancias
+
+    resultado = ([], [], [], [])
+    posicoes = {}
+    partes = {}
+    for chunk_id, documento, metadata, distancia in zip(ids, documentos, metadatas, distancias):
+        pai = (metadata or {}).get('parent_chunk_id')
+        if pai is None or irmaos[pai] == 1:
+            for lista, valor in zip(resultado, (chunk_id, documento, metadata, distancia)):
+                lista.append(valor)
+            continue
+        if pai not in posicoes:
+            posicoes[pai] = len(resultado[0])
+            partes[pai] = []
+            resultado[0].append(pai)
+            resultado[1].append(None)
+            resultado[2].append({k: v for k, v in metadata.items() if k not in CAMPOS_PARTE})
+            resultado[3].append(distancia)
+        partes[pai].append((metadata, documento))
+        i = posicoes[pai]
+        if distancia is not None and (resultado[3][i] is None or distancia < resultado[3][i]):
+            resultado[3][i] = distancia
+
+    for pai, i in posicoes.items():
+        resultado[1][i] = _juntar_textos(partes[pai])
+    return resultado
@@ -1,250 +1,313 @@
-import json
+import argparse
+import collections
+import multiprocessing
 import os
+import sys
 
-# Caminho para o arquivo JSON gerado na etapa anterior
-json_file_path = 'antibiotics_dataset.json'
-# Caminho para o arquivo onde salvaremos os chunks
-output_chunks_path = 'antibiotics_chunks.json'
+import configuracao
+from drugbank_jsonl import abrir_saida, escrever_registro
+from drugbank_snapshot import ler_dataset
+from indice_interacoes import EscritorIndicePares
 
-# Lista para armazenar todos os chunks gerados
-all_chunks = []
+# Dataset gerado na etapa anterior: o snapshot colunar é usado se existir, senão o JSON Lines ('-' para stdin)
+snapshot_path = configuracao.snapshot_path
+json_file_path = configuracao.dataset_path
+# Caminho para o arquivo onde salvaremos os chunks ('-' para stdout)
+output_chunks_path = configuracao.chunks_path
+# Caminho para o índice exato de interações por par de drogas (construído junto com os chunks)
+indice_pares_path = configuracao.indice_pares_path
 
-print(f"Lendo dados do arquivo: {json_file_path}")
+# Número de processos que geram os chunks (1 = tudo no processo principal)
+num_workers = 1
+# Número de medicamentos enviados de cada vez a um processo do pool
+tamanho_lote = 32
 
-if not os.path.exists(json_file_path):
-    print(f"Erro: Arquivo JSON não encontrado em {json_file_path}")
-else:
+# Funções que geram os chunks de um tipo de informação, pela ordem em que são aplicadas.
+# Cada uma recebe um registro do dataset e gera zero ou mais chunks; para adicionar um
+# novo tipo de chunk basta decorar uma função com @construtor_chunks.
+CONSTRUTORES = []
+
+# Campos do dataset lidos pelos construtores e pelo índice de pares (só estas colunas são
+# lidas de um snapshot); um construtor que use um campo novo deve acrescentá-lo aqui
+CAMPOS_CHUNKS = [
+    'drugbank_id', 'name', 'synonyms', 'description', 'indication', 'groups', 'categories',
+    'affected_organisms', 'pharmacodynamics', 'mechanism_of_action', 'metabolism', 'absorption',
+    'half_life', 'protein_binding', 'route_of_elimination', 'volume_of_distribution', 'clearance',
+    'toxicity', 'drug_interactions', 'food_interactions', 'targets', 'dosages', 'products',
+    'classification', 'external_identifiers',
+]
+
+
+def construtor_chunks(funcao):
+    """Regista uma função geradora de chunks em CONSTRUTORES."""
+    CONSTRUTORES.append(funcao)
+    return funcao
+
+
+def _chunk(drug, chunk_type, chunk_id, partes, **extra):
+    """Monta um chunk com os campos comuns; o conteúdo é a junção das linhas em `partes`."""
+    drugbank_id = drug.get('drugbank_id', 'N/A')
+    chunk = {
+        'chunk_id': f"{drugbank_id}_{chunk_id}", # ID consistente (o mesmo em cada execução)
+        'drugbank_id': drugbank_id,
+        'name': drug.get('name', 'N/A'),
+        'chunk_type': chunk_type,
+    }
+    chunk.update(extra)
+    chunk['content'] = "\n".join(partes).strip()
+    return chunk
+
+
+def _cabecalho(drug):
+    return f"{drug.get('name', 'N/A')} (ID DrugBank: {drug.get('drugbank_id', 'N/A')})"
+
+
+def _linhas_rotuladas(origem, campos, prefixo=""):
+    """Linhas 'Rótulo: valor' para os campos preenchidos de `origem`, pela ordem de `campos`."""
+    return [f"{prefixo}{rotulo}: {origem[campo]}" for campo, rotulo in campos if origem.get(campo)]
+
+
+# 1. Chunk de Resumo/Visão Geral
+@construtor_chunks
+def chunk_resumo(drug):
+    partes = [f"Nome: {_cabecalho(drug)}"]
+    partes += _linhas_rotuladas(drug, [('description', "Descrição"), ('indication', "Indicação")])
+    for campo, rotulo in [('groups', "Grupos"), ('categories', "Categorias"), ('affected_organisms', "Organismos Afetados")]:
+        if drug.get(campo):
+            partes.append(f"{rotulo}: {', '.join(drug[campo])}")
+    yield _chunk(drug, 'summary', 'summary', partes)
+
+
+# 2. Chunk de Farmacologia
+@construtor_chunks
+def chunk_farmacologia(drug):
+    partes = _linhas_rotuladas(drug, [
+        ('pharmacodynamics', "Farmacodinâmica"),
+        ('mechanism_of_action', "Mecanismo de Ação"),
+    ])
+    if partes:
+        yield _chunk(drug, 'pharmacology', 'pharmacology', partes)
+
+
+# 3. Chunk de Farmacocinética (ADME)
+@construtor_chunks
+def chunk_farmacocinetica(drug):
+    partes = _linhas_rotuladas(drug, [
+        ('metabolism', "Metabolismo"),
+        ('absorption', "Absorção"),
+        ('half_life', "Meia-vida"),
+        ('protein_binding', "Ligação Proteica"),
+        ('route_of_elimination', "Via de Eliminação"),
+        ('volume_of_distribution', "Volume de Distribuição"),
+        ('clearance', "Clearance"),
+    ])
+    if partes:
+        yield _chunk(drug, 'pharmacokinetics', 'pharmacokinetics', partes)
+
+
+# 4. Chunk de Toxicidade
+@construtor_chunks
+def chunk_toxicidade(drug):
+    if (drug.get('toxicity') or '').strip():
+        yield _chunk(drug, 'toxicity', 'toxicity', [f"Toxicidade/Efeitos Adversos: {drug['toxicity'].strip()}"])
+
+
+# 5. Chunks de Interações Medicamentosas
+@construtor_chunks
+def chunks_interacoes(drug):
+    for i, interaction in enumerate(drug.get('drug_interactions') or []):
+        # Prioriza o drugbank_id da droga interagente para unicidade, mas sempre inclui o índice
+        outro_id = interaction.get('drugbank_id')
+        sufixo = f"{outro_id}_{i}" if outro_id else f"idx{i}"
+        outro_nome = interaction.get('name', 'N/A')
+        outro_id_texto = interaction.get('drugbank_id', 'N/A')
+        if outro_nome == 'N/A' and outro_id_texto == 'N/A' and not interaction.get('description'):
+            continue # Interação sem nenhuma informação
+        partes = [f"Interação Medicamentosa de {_cabecalho(drug)} com {outro_nome} (ID DrugBank: {outro_id_texto})."]
+        if interaction.get('description'):
+            partes.append(f"Descrição: {interaction['description'].strip()}")
+        yield _chunk(drug, 'drug_interaction', f"drug_interaction_{sufixo}", partes,
+                     interacting_drug_id=outro_id,
+                     interacting_drug_name=interaction.get('name'))
+
+
+# 6. Chunks de Interações Alimentares
+@construtor_chunks
+def chunks_interacoes_alimentares(drug):
+    for i, fi in enumerate(drug.get('food_interactions') or []):
+        if fi.strip():
+            yield _chunk(drug, 'food_interaction', f"food_interaction_{i}",
+                         [f"Interação Alimentar de {_cabecalho(drug)}: {fi.strip()}"])
+
+
+# 7. Chunks de Alvos Moleculares
+@construtor_chunks
+def chunks_alvos(drug):
+    for i, target in enumerate(drug.get('targets') or []):
+        # Prioriza o uniprot_id, mas sempre inclui o índice para unicidade
+        uniprot_id = target.get('uniprot_id')
+        sufixo = f"{uniprot_id}_{i}" if uniprot_id else f"idx{i}"
+        linhas = _linhas_rotuladas(target, [('name', "Nome do Alvo"), ('uniprot_id', "ID UniProt")])
+        if linhas:
+            yield _chunk(drug, 'target', f"target_{sufixo}", [f"Alvo Molecular de {_cabecalho(drug)}."] + linhas,
+                         target_name=target.get('name'),
+                         target_uniprot_id=uniprot_id)
+
+
+# 8. Chunks de Dosagens
+@construtor_chunks
+def chunks_dosagens(drug):
+    for i, dosage in enumerate(drug.get('dosages') or []):
+        linhas = _linhas_rotuladas(dosage, [('form', "Forma"), ('route', "Via"), ('strength', "Concentração/Força")])
+        if linhas:
+            yield _chunk(drug, 'dosage', f"dosage_{i}", [f"Dosagem para {_cabecalho(drug)} (Entrada {i+1})."] + linhas,
+                         dosage_form=dosage.get('form'),
+                         dosage_route=dosage.get('route'))
+
+
+# 9. Chunk de Produtos
+@construtor_chunks
+def chunk_produtos(drug):
+    if not drug.get('products'):
+        return
+    partes = [f"Produtos que contêm {_cabecalho(drug)}:"]
+    for product in drug['products']:
+        partes.append(f"- Nome: {product.get('name', 'N/A')}")
+        partes += _linhas_rotuladas(product, [
+            ('labeller', "Fabricante"),
+            ('ndc_id', "NDC ID"),
+            ('dosage_form', "Forma de Dosagem"),
+        ], prefixo="  ")
+    yield _chunk(drug, 'products', 'products', partes)
+
+
+# 10. Chunk de Sinônimos
+@construtor_chunks
+def chunk_sinonimos(drug):
+    sinonimos = ", ".join(drug.get('synonyms') or [])
+    if sinonimos.strip():
+        yield _chunk(drug, 'synonyms', 'synonyms', [f"Sinônimos para {_cabecalho(drug)}:", sinonimos])
+
+
+# 11. Chunk de Classificação
+@construtor_chunks
+def chunk_classificacao(drug):
+    linhas = _linhas_rotuladas(drug.get('classification') or {}, [
+        ('kingdom', "Reino"),
+        ('superclass', "Superclasse"),
+        ('class', "Classe"),
+        ('subclass', "Subclasse"),
+        ('direct_parent', "Parentesco Direto"),
+    ], prefixo="  ")
+    if linhas:
+        yield _chunk(drug, 'classification', 'classification', [f"Classificação para {_cabecalho(drug)}:"] + linhas)
+
+
+# 12. Chunk de IDs Externos
+@construtor_chunks
+def chunk_ids_externos(drug):
+    linhas = [f"- {ext_id['resource']}: {ext_id['identifier']}"
+              for ext_id in drug.get('external_identifiers') or []
+              if ext_id.get('resource') and ext_id.get('identifier')]
+    if linhas:
+        yield _chunk(drug, 'external_identifiers', 'external_identifiers',
+                     [f"Identificadores Externos para {_cabecalho(drug)}:"] + linhas)
+
+
+def chunks_do_medicamento(drug):
+    """Gera os chunks de texto de um antibiótico (um registro do dataset)."""
+    for construtor in CONSTRUTORES:
+        yield from construtor(drug)
+
+
+def _chunks_do_lote(lote):
+    """Executado nos processos do pool: gera os chunks de cada medicamento do lote."""
+    return [list(chunks_do_medicamento(drug)) for drug in lote]
+
+
+def _lotes(drugs):
+    lote = []
+    for drug in drugs:
+        lote.append(drug)
+        if len(lote) == tamanho_lote:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def chunks_por_medicamento(drugs, workers=1):
+    """Gera (drug, chunks) para cada medicamento de `drugs`, pela ordem de entrada.
+
+    Com workers > 1 os chunks são gerados num pool de processos, em lotes de tamanho_lote
+    medicamentos consumidos pela ordem de submissão (saída determinística); o número de
+    lotes pendentes é limitado para a leitura em streaming não acumular o dataset em memória.
+    """
+    if workers <= 1:
+        for drug in drugs:
+            yield drug, list(chunks_do_medicamento(drug))
+        return
+
+    max_pendentes = workers * 4
+    with multiprocessing.Pool(processes=workers) as pool:
+        pendentes = collections.deque()
+        for lote in _lotes(drugs):
+            pendentes.append((lote, pool.apply_async(_chunks_do_lote, (lote,))))
+            while len(pendentes) >= max_pendentes:
+                lote_pronto, resultado = pendentes.popleft()
+                yield from zip(lote_pronto, resultado.get())
+        while pendentes:
+            lote_pronto, resultado = pendentes.popleft()
+            yield from zip(lote_pronto, resultado.get())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Divide o dataset de antibióticos em chunks de texto.")
+    parser.add_argument('--input', default=snapshot_path if os.path.isdir(snapshot_path) else json_file_path,
+                        help="Arquivo JSON Lines ou diretório do snapshot do dataset ('-' para stdin).")
+    parser.add_argument('--output', default=output_chunks_path,
+                        help="Arquivo JSON Lines de chunks ('-' para stdout).")
+    parser.add_argument('--workers', type=int, default=num_workers,
+                        help="Número de processos para gerar os chunks (1 = sem paralelismo).")
+    parser.add_argument('--indice-pares', default=indice_pares_path,
+                        help="Arquivo SQLite do índice de interações por par ('' para não construir).")
+    args = parser.parse_args(argv)
+
+    print(f"Lendo dados do arquivo: {args.input}", file=sys.stderr)
+    # Verificado antes de abrir a saída: um caminho errado não pode apagar os chunks anteriores
+    if args.input != '-' and not os.path.exists(args.input):
+        print(f"Erro: Arquivo JSON não encontrado em {args.input}", file=sys.stderr)
+        return 1
+
+    indice_pares = None
     try:
-        with open(json_file_path, 'r', encoding='utf-8') as f:
-            antibiotics_data = json.load(f)
-
-        print(f"Arquivo lido com sucesso. Processando {len(antibiotics_data)} antibióticos em chunks...")
-
-        for drug in antibiotics_data:
-            drugbank_id = drug.get('drugbank_id', 'N/A')
-            name = drug.get('name', 'N/A')
-
-            # --- Criar Chunks para cada tipo de informação ---
-
-            # 1. Chunk de Resumo/Visão Geral
-            summary_text = f"Nome: {name} (ID DrugBank: {drugbank_id})\n"
-            if drug.get('description'): summary_text += f"Descrição: {drug['description']}\n"
-            if drug.get('indication'): summary_text += f"Indicação: {drug['indication']}\n"
-            if drug.get('groups'): summary_text += f"Grupos: {', '.join(drug['groups'])}\n"
-            if drug.get('categories'): summary_text += f"Categorias: {', '.join(drug['categories'])}\n"
-            if drug.get('affected_organisms'): summary_text += f"Organismos Afetados: {', '.join(drug['affected_organisms'])}\n"
-
-            if summary_text.strip(): # Adiciona apenas se houver conteúdo relevante
-                all_chunks.append({
-                    'chunk_id': f"{drugbank_id}_summary", # ID consistente (um por droga)
-                    'drugbank_id': drugbank_id,
-                    'name': name,
-                    'chunk_type': 'summary',
-                    'content': summary_text.strip()
-                })
-
-            # 2. Chunk de Farmacologia
-            pharmacology_text = ""
-            if drug.get('pharmacodynamics'): pharmacology_text += f"Farmacodinâmica: {drug['pharmacodynamics']}\n"
-            if drug.get('mechanism_of_action'): pharmacology_text += f"Mecanismo de Ação: {drug['mechanism_of_action']}\n"
-
-            if pharmacology_text.strip():
-                all_chunks.append({
-                    'chunk_id': f"{drugbank_id}_pharmacology", 
-                    'drugbank_id': drugbank_id,
-                    'name': name,
-                    'chunk_type': 'pharmacology',
-                    'content': pharmacology_text.strip()
-                })
-
-            # 3. Chunk de Farmacocinética (ADME)
-            adme_text = ""
-            if drug.get('metabolism'): adme_text += f"Metabolismo: {drug['metabolism']}\n"
-            if drug.get('absorption'): adme_text += f"Absorção: {drug['absorption']}\n"
-            if drug.get('half_life'): adme_text += f"Meia-vida: {drug['half_life']}\n"
-            if drug.get('protein_binding'): adme_text += f"Ligação Proteica: {drug['protein_binding']}\n"
-            if drug.get('route_of_elimination'): adme_text += f"Via de Eliminação: {drug['route_of_elimination']}\n"
-            if drug.get('volume_of_distribution'): adme_text += f"Volume de Distribuição: {drug['volume_of_distribution']}\n"
-            if drug.get('clearance'): adme_text += f"Clearance: {drug['clearance']}\n"
-
-            if adme_text.strip():
-                all_chunks.append({
-                    'chunk_id': f"{drugbank_id}_pharmacokinetics", 
-                    'drugbank_id': drugbank_id,
-                    'name': name,
-                    'chunk_type': 'pharmacokinetics',
-                    'content': adme_text.strip()
-                })
-
-            # 4. Chunk de Toxicidade
-            if drug.get('toxicity'):
-                all_chunks.append({
-                    'chunk_id': f"{drugbank_id}_toxicity", 
-                    'drugbank_id': drugbank_id,
-                    'name': name,
-                    'chunk_type': 'toxicity',
-                    'content': f"Toxicidade/Efeitos Adversos: {drug['toxicity'].strip()}"
-                })
-
-            # 5. Chunks de Interações Medicamentosas 
-            if drug.get('drug_interactions'):
-                for i, interaction in enumerate(drug['drug_interactions']):
-                    # Prioriza o drugbank_id da droga interaginete para unicidade, mas sempre inclui o índice
-                    interaction_id_suffix = interaction.get('drugbank_id')
-                    if interaction_id_suffix:
-                        chunk_id_suffix = f"{interaction_id_suffix}_{i}"
-                    else: # Se não houver drugbank_id para a interação
-                        chunk_id_suffix = f"idx{i}"
-
-                    interaction_text = f"Interação Medicamentosa de {name} (ID DrugBank: {drugbank_id}) com {interaction.get('name', 'N/A')} (ID DrugBank: {interaction.get('drugbank_id', 'N/A')}).\n"
-                    if interaction.get('description'):
-                        interaction_text += f"Descrição: {interaction['description'].strip()}"
-
-                    if interaction_text.strip() != f"Interação Medicamentosa de {name} (ID DrugBank: {drugbank_id}) com N/A (ID DrugBank: N/A).":
-                        all_chunks.append({
-                            'chunk_id': f"{drugbank_id}_drug_interaction_{chunk_id_suffix}", # ID consistente e único
-                            'drugbank_id': drugbank_id,
-                            'name': name,
-                            'chunk_type': 'drug_interaction',
-                            'interacting_drug_id': interaction.get('drugbank_id'),
-                            'interacting_drug_name': interaction.get('name'),
-                            'content': interaction_text.strip()
-                        })
-
-            # 6. Chunks de Interações Alimentares 
-            if drug.get('food_interactions'):
-                for i, fi in enumerate(drug['food_interactions']):
-                    if fi.strip():
-                        all_chunks.append({
-                            'chunk_id': f"{drugbank_id}_food_interaction_{i}", 
-                            'drugbank_id': drugbank_id,
-                            'name': name,
-                            'chunk_type': 'food_interaction',
-                            'content': f"Interação Alimentar de {name} (ID DrugBank: {drugbank_id}): {fi.strip()}"
-                        })
-
-            # 7. Chunks de Alvos Moleculares 
-            if drug.get('targets'):
-                for i, target in enumerate(drug['targets']):
-                    # Prioriza o uniprot_id, mas sempre inclui o índice para unicidade
-                    target_uniprot_id = target.get('uniprot_id')
-                    if target_uniprot_id:
-                        chunk_id_suffix = f"{target_uniprot_id}_{i}"
-                    else:
-                        chunk_id_suffix = f"idx{i}" # Fallback para índice se não houver UniProt ID
-
-                    target_text = f"Alvo Molecular de {name} (ID DrugBank: {drugbank_id}).\n"
-                    if target.get('name'): target_text += f"Nome do Alvo: {target['name']}\n"
-                    if target_uniprot_id: target_text += f"ID UniProt: {target_uniprot_id}\n"
-                    
-
-                    if target_text.strip() != f"Alvo Molecular de {name} (ID DrugBank: {drugbank_id}).":
-                        all_chunks.append({
-                            'chunk_id': f"{drugbank_id}_target_{chunk_id_suffix}", 
-                            'drugbank_id': drugbank_id,
-                            'name': name,
-                            'chunk_type': 'target',
-                            'target_name': target.get('name'),
-                            'target_uniprot_id': target_uniprot_id,
-                            'content': target_text.strip()
-                        })
-
-            # 8. Chunks de Dosagens 
-            if drug.get('dosages'):
-                for i, dosage in enumerate(drug['dosages']):
-                    dosage_text = f"Dosagem para {name} (ID DrugBank: {drugbank_id}) (Entrada {i+1}).\n"
-                    if dosage.get('form'): dosage_text += f"Forma: {dosage['form']}\n"
-                    if dosage.get('route'): dosage_text += f"Via: {dosage['route']}\n"
-                    if dosage.get('strength'): dosage_text += f"Concentração/Força: {dosage['strength']}\n"
-
-                    if dosage_text.strip() != f"Dosagem para {name} (ID DrugBank: {drugbank_id}) (Entrada {i+1}).":
-                        all_chunks.append({
-                            'chunk_id': f"{drugbank_id}_dosage_{i}", 
-                            'drugbank_id': drugbank_id,
-                            'name': name,
-                            'chunk_type': 'dosage',
-                            'dosage_form': dosage.get('form'),
-                            'dosage_route': dosage.get('route'),
-                            'content': dosage_text.strip()
-                        })
-
-            # 9. Chunk de Produtos 
-            if drug.get('products'):
-                products_text = f"Produtos que contêm {name} (ID DrugBank: {drugbank_id}):\n"
-                for i, product in enumerate(drug['products']): # Adiciona loop para garantir a inclusão de todos os produtos
-                    products_text += f"- Nome: {product.get('name', 'N/A')}\n"
-                    if product.get('labeller'): products_text += f"  Fabricante: {product['labeller']}\n"
-                    if product.get('ndc_id'): products_text += f"  NDC ID: {product['ndc_id']}\n"
-                    if product.get('dosage_form'): products_text += f"  Forma de Dosagem: {product['dosage_form']}\n"
-                
-                if products_text.strip() != f"Produtos que contêm {name} (ID DrugBank: {drugbank_id}):":
-                    all_chunks.append({
-                        'chunk_id': f"{drugbank_id}_products", 
-                        'drugbank_id': drugbank_id,
-                        'name': name,
-                        'chunk_type': 'products',
-                        'content': products_text.strip()
-                    })
-
-            # 10. Chunk de Sinônimos
-            if drug.get('synonyms'):
-                synonyms_text = f"Sinônimos para {name} (ID DrugBank: {drugbank_id}):\n"
-                synonyms_text += ", ".join(drug['synonyms'])
-                
-                if synonyms_text.strip() != f"Sinônimos para {name} (ID DrugBank: {drugbank_id}):":
-                    all_chunks.append({
-                        'chunk_id': f"{drugbank_id}_synonyms", 
-                        'drugbank_id': drugbank_id,
-                        'name': name,
-                        'chunk_type': 'synonyms',
-                        'content': synonyms_text.strip()
-                    })
-
-            # 11. Chunk de Classificação
-            if drug.get('classification'):
-                classification_text = f"Classificação para {name} (ID DrugBank: {drugbank_id}):\n"
-                if drug['classification'].get('kingdom'): classification_text += f"  Reino: {drug['classification']['kingdom']}\n"
-                if drug['classification'].get('superclass'): classification_text += f"  Superclasse: {drug['classification']['superclass']}\n"
-                if drug['classification'].get('class'): classification_text += f"  Classe: {drug['classification']['class']}\n"
-                if drug['classification'].get('subclass'): classification_text += f"  Subclasse: {drug['classification']['subclass']}\n"
-                if drug['classification'].get('direct_parent'): classification_text += f"  Parentesco Direto: {drug['classification']['direct_parent']}\n"
-
-                if classification_text.strip() != f"Classificação para {name} (ID DrugBank: {drugbank_id}):":
-                    all_chunks.append({
-                        'chunk_id': f"{drugbank_id}_classification", 
-                        'drugbank_id': drugbank_id,
-                        'name': name,
-                        'chunk_type': 'classification',
-                        'content': classification_text.strip()
-                    })
-                    
-            # 12. Chunk de IDs Externos
-            if drug.get('external_identifiers'):
-                ext_ids_text = f"Identificadores Externos para {name} (ID DrugBank: {drugbank_id}):\n"
-                for i, ext_id in enumerate(drug['external_identifiers']):
-                    if ext_id.get('resource') and ext_id.get('identifier'):
-                        ext_ids_text += f"- {ext_id['resource']}: {ext_id['identifier']}\n"
-
-                if ext_ids_text.strip() != f"Identificadores Externos para {name} (ID DrugBank: {drugbank_id}):":
-                    all_chunks.append({
-                        'chunk_id': f"{drugbank_id}_external_identifiers", 
-                        'drugbank_id': drugbank_id,
-                        'name': name,
-                        'chunk_type': 'external_identifiers',
-                        'content': ext_ids_text.strip()
-                    })
-        # --- Fim do processamento ---
-
-        print(f"Processamento concluído. Total de chunks criados: {len(all_chunks)}")
-
-        # Salvar os chunks em um arquivo JSON
-        try:
-            with open(output_chunks_path, 'w', encoding='utf-8') as f:
-                json.dump(all_chunks, f, indent=4, ensure_ascii=False)
-            print(f"Chunks salvos (opcional) em {output_chunks_path}")
-        except Exception as e:
-            print(f"Erro ao salvar o arquivo de chunks: {e}")
+        with abrir_saida(args.output) as saida:
+            indice_pares = EscritorIndicePares(args.indice_pares) if args.indice_pares else None
+            total_drugs = 0
+            total_chunks = 0
+            # Cada antibiótico é lido, dividido em chunks e escrito antes de passar ao seguinte
+            for drug, chunks in chunks_por_medicamento(ler_dataset(args.input, CAMPOS_CHUNKS), workers=args.workers):
+                total_drugs += 1
+                for chunk in chunks:
+                    escrever_registro(saida, chunk)
+                total_chunks += len(chunks)
+                if indice_pares is not None:
+                    indice_pares.adicionar(drug, chunks)
+
+            print(f"Processamento concluído. {total_drugs} antibióticos, total de chunks criados: {total_chunks}")
+            print(f"Chunks salvos em {args.output}")
+            if indice_pares is not None:
+                indice_pares.fechar()
+                print(f"Índice de interações por par ({indice_pares.total_pares} pares) salvo em {args.indice_pares}")
 
     except Exception as e:
-        print(f"Ocorreu um erro durante o processamento do JSON: {e}")
-        print("Certifique-se de que o arquivo JSON está bem formado.")
\ No newline at end of file
+        if indice_pares is not None:
+            indice_pares.descartar()
+        print(f"Ocorreu um erro durante o processamento do JSON: {e}", file=sys.stderr)
+        print("Certifique-se de que o arquivo JSON está bem formado. Os arquivos anteriores não foram alterados.",
+              file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
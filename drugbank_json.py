@@ -1,10 +1,27 @@
 import lxml.etree as etree
+import argparse
+import collections
+import contextlib
+import multiprocessing
 import os
-import json
+import re
+import shutil
+import sys
+
+import configuracao
+from drugbank_jsonl import abrir_saida, escrever_registro
+from drugbank_snapshot import EscritorSnapshot
 
 # Defina o caminho para o seu arquivo DrugBank XML
-xml_file_path = 'Projeto\drugbank.xml'  
-output_json_path = 'antibiotics_dataset.json'  
+xml_file_path = configuracao.xml_file_path
+output_json_path = configuracao.dataset_path
+# Snapshot colunar do mesmo dataset (drugbank_snapshot.py), lido pelas etapas seguintes sem parse de JSON
+snapshot_path = configuracao.snapshot_path
+
+# Número de processos que executam extract_antibiotic_data (1 = tudo no processo principal)
+num_workers = 1
+# Número de elementos <drug> serializados enviados de cada vez a um processo do pool
+tamanho_lote = 16
 
 # Namespace do DrugBank
 DB_NAMESPACE = "http://www.drugbank.ca"
@@ -18,6 +35,104 @@ ANTIBIOTIC_KEYWORDS = [
     "Carbapenems", "Monobactams",
 ]
 
+# Classes terapêuticas que podem ser extraídas: nome -> termos procurados nas categorias de
+# cada <drug> (substring, sem distinção de maiúsculas). Um <drug> pode pertencer a várias.
+CLASSES_TERAPEUTICAS = {
+    'antibiotics': ANTIBIOTIC_KEYWORDS,
+    'antifungals': ["Antifungal", "Echinocandins", "Polyenes"],
+    'anticoagulants': ["Anticoagulants", "Antithrombins", "Vitamin K Antagonists", "Factor Xa Inhibitors", "Heparin"],
+    'antivirals': ["Antiviral Agents", "Antivirals", "Anti-Retroviral Agents", "HIV Protease Inhibitors"],
+}
+# Classes extraídas por omissão (todas num único passe sobre o XML)
+classes_extraidas = ['antibiotics']
+
+
+def _tag(nome):
+    """Nome qualificado ('{namespace}nome') de uma tag do DrugBank."""
+    return '{%s}%s' % (DB_NAMESPACE, nome)
+
+
+# --- Tags e XPath pré-compilados ---
+# Construídos uma única vez na importação, em vez de formatar '{%s}...' % DB_NAMESPACE
+# para cada drug, interação, produto e dosagem.
+TAG_DRUG = _tag('drug')
+TAG_DRUGBANK_ID = _tag('drugbank-id')
+TAG_NAME = _tag('name')
+TAG_CATEGORY = _tag('category')
+TAG_CATEGORIES = _tag('categories')
+TAG_DRUG_INTERACTION = _tag('drug-interaction')
+TAG_TARGET = _tag('target')
+TAG_POLYPEPTIDE = _tag('polypeptide')
+TAG_DOSAGE = _tag('dosage')
+TAG_PRODUCT = _tag('product')
+TAG_EXTERNAL_IDENTIFIER = _tag('external-identifier')
+
+XPATH_UNIPROT_ID = etree.XPath(
+    'db:external-identifiers/db:external-identifier[db:resource="UniProtKB"]/db:identifier',
+    namespaces=NS_MAP,
+)
+
+# Campos de texto simples, filhos diretos de <drug>: tag -> chave no dicionário
+CAMPOS_TEXTO_DRUG = {
+    _tag('name'): 'name',
+    _tag('description'): 'description',
+    _tag('cas-number'): 'cas_number',
+    _tag('unii'): 'unii',
+    _tag('indication'): 'indication',
+    _tag('toxicity'): 'toxicity',
+    _tag('pharmacodynamics'): 'pharmacodynamics',
+    _tag('mechanism-of-action'): 'mechanism_of_action',
+    _tag('metabolism'): 'metabolism',
+    _tag('absorption'): 'absorption',
+    _tag('half-life'): 'half_life',
+    _tag('protein-binding'): 'protein_binding',
+    _tag('route-of-elimination'): 'route_of_elimination',
+    _tag('volume-of-distribution'): 'volume_of_distribution',
+    _tag('clearance'): 'clearance',
+}
+
+# Listas de texto simples: tag do contentor -> (tag dos itens, chave no dicionário)
+LISTAS_TEXTO_DRUG = {
+    _tag('groups'): (_tag('group'), 'groups'),
+    _tag('affected-organisms'): (_tag('affected-organism'), 'affected_organisms'),
+    _tag('food-interactions'): (_tag('food-interaction'), 'food_interactions'),
+    _tag('synonyms'): (_tag('synonym'), 'synonyms'),
+}
+
+CAMPOS_NOME = {TAG_NAME: 'name'}
+CAMPOS_INTERACAO = {_tag('drugbank-id'): 'drugbank_id', _tag('name'): 'name', _tag('description'): 'description'}
+CAMPOS_DOSAGEM = {_tag('form'): 'form', _tag('route'): 'route', _tag('strength'): 'strength'}
+CAMPOS_PRODUTO = {
+    _tag('name'): 'name',
+    _tag('labeller'): 'labeller',
+    _tag('dosage-form'): 'dosage_form',
+    _tag('strength'): 'strength',
+    _tag('route'): 'route',
+    _tag('generic'): 'generic',
+    _tag('approved'): 'approved',
+    _tag('country'): 'country',
+}
+CAMPOS_CLASSIFICACAO = {
+    _tag('subclass'): 'subclass',
+    _tag('alternative-parent'): 'alternative_parent',
+    _tag('substituent'): 'substituent',
+}
+CAMPOS_ID_EXTERNO = {_tag('resource'): 'resource', _tag('identifier'): 'identifier'}
+
+# Chaves do dicionário de cada drug, pela ordem em que são gravadas no dataset
+CHAVES_DRUG = [
+    'drugbank_id', 'name', 'description', 'cas_number', 'unii', 'indication', 'toxicity',
+    'groups', 'categories', 'affected_organisms',
+    'pharmacodynamics', 'mechanism_of_action', 'metabolism', 'absorption', 'half_life',
+    'protein_binding', 'route_of_elimination', 'volume_of_distribution', 'clearance',
+    'drug_interactions', 'food_interactions', 'targets', 'dosages', 'products', 'synonyms',
+    'classification', 'external_identifiers',
+]
+CHAVES_LISTA = {
+    'groups', 'categories', 'affected_organisms', 'drug_interactions', 'food_interactions',
+    'targets', 'dosages', 'products', 'synonyms', 'external_identifiers',
+}
+
 
 def safe_extract_text(element, xpath, namespace_map):
     """Extrai texto de um elemento usando XPath, retornando None se não encontrado."""
@@ -27,237 +142,372 @@ def safe_extract_text(element, xpath, namespace_map):
     return None
 
 
-def extract_antibiotic_data(drug_element):
-    """Extrai os dados relevantes de um elemento <drug>."""
-    drug_data = {}
-
-    # 1. Informações Essenciais
-    # Encontrar o drugbank-id primário
-    primary_id_elem = drug_element.find('{%s}drugbank-id[@primary="true"]' % DB_NAMESPACE)
-    drug_data['drugbank_id'] = primary_id_elem.text.strip() if primary_id_elem is not None and primary_id_elem.text else None
-    if not drug_data['drugbank_id']:  # Se não encontrou primário, pega o primeiro disponível
-        any_id_elem = drug_element.find('{%s}drugbank-id' % DB_NAMESPACE)
-        drug_data['drugbank_id'] = any_id_elem.text.strip() if any_id_elem is not None and any_id_elem.text else None
-
-    drug_data['name'] = safe_extract_text(drug_element, '{%s}name' % DB_NAMESPACE, NS_MAP)
-    drug_data['description'] = safe_extract_text(drug_element, '{%s}description' % DB_NAMESPACE, NS_MAP)
-    drug_data['cas_number'] = safe_extract_text(drug_element, '{%s}cas-number' % DB_NAMESPACE, NS_MAP)
-    drug_data['unii'] = safe_extract_text(drug_element, '{%s}unii' % DB_NAMESPACE, NS_MAP)
-    drug_data['indication'] = safe_extract_text(drug_element, '{%s}indication' % DB_NAMESPACE, NS_MAP)
-    drug_data['toxicity'] = safe_extract_text(drug_element, '{%s}toxicity' % DB_NAMESPACE, NS_MAP)
-
-    # Grupos
-    groups = []
-    groups_elem = drug_element.find('{%s}groups' % DB_NAMESPACE)
-    if groups_elem is not None:
-        for group_elem in groups_elem.findall('{%s}group' % DB_NAMESPACE):
-            if group_elem.text:
-                groups.append(group_elem.text.strip())
-    drug_data['groups'] = groups
-
-    # Categorias
-    categories = []
-    categories_elem = drug_element.find('{%s}categories' % DB_NAMESPACE)
-    if categories_elem is not None:
-        for category_elem in categories_elem.findall('{%s}category' % DB_NAMESPACE):
-            cat_name_elem = category_elem.find('{%s}category' % DB_NAMESPACE)
-            if cat_name_elem is not None and cat_name_elem.text:
-                categories.append(cat_name_elem.text.strip())
-    drug_data['categories'] = categories
-
-    # Organismos Afetados
-    affected_organisms = []
-    affected_organisms_elem = drug_element.find('{%s}affected-organisms' % DB_NAMESPACE)
-    if affected_organisms_elem is not None:
-        for organism_elem in affected_organisms_elem.findall('{%s}affected-organism' % DB_NAMESPACE):
-            if organism_elem.text:
-                affected_organisms.append(organism_elem.text.strip())
-    drug_data['affected_organisms'] = affected_organisms
-
-    # 2. Informações para Interações (ADME, Mecanismo)
-    drug_data['pharmacodynamics'] = safe_extract_text(drug_element, '{%s}pharmacodynamics' % DB_NAMESPACE, NS_MAP)
-    drug_data['mechanism_of_action'] = safe_extract_text(drug_element, '{%s}mechanism-of-action' % DB_NAMESPACE, NS_MAP)
-    drug_data['metabolism'] = safe_extract_text(drug_element, '{%s}metabolism' % DB_NAMESPACE, NS_MAP)
-    drug_data['absorption'] = safe_extract_text(drug_element, '{%s}absorption' % DB_NAMESPACE, NS_MAP)
-    drug_data['half_life'] = safe_extract_text(drug_element, '{%s}half-life' % DB_NAMESPACE, NS_MAP)
-    drug_data['protein_binding'] = safe_extract_text(drug_element, '{%s}protein-binding' % DB_NAMESPACE, NS_MAP)
-    drug_data['route_of_elimination'] = safe_extract_text(drug_element, '{%s}route-of-elimination' % DB_NAMESPACE, NS_MAP)
-    drug_data['volume_of_distribution'] = safe_extract_text(drug_element, '{%s}volume-of-distribution' % DB_NAMESPACE, NS_MAP)
-    drug_data['clearance'] = safe_extract_text(drug_element, '{%s}clearance' % DB_NAMESPACE, NS_MAP)
-
-    # 3. Interações Diretas
-    # Interações Medicamentosas
-    drug_interactions = []
-    drug_interactions_elem = drug_element.find('{%s}drug-interactions' % DB_NAMESPACE)
-    if drug_interactions_elem is not None:
-        for interaction_elem in drug_interactions_elem.findall('{%s}drug-interaction' % DB_NAMESPACE):
-            interacting_id_elem = interaction_elem.find('{%s}drugbank-id' % DB_NAMESPACE)
-            interacting_name_elem = interaction_elem.find('{%s}name' % DB_NAMESPACE)
-            description_elem = interaction_elem.find('{%s}description' % DB_NAMESPACE)
-
-            interaction_detail = {
-                'drugbank_id': interacting_id_elem.text.strip() if interacting_id_elem is not None and interacting_id_elem.text else None,
-                'name': interacting_name_elem.text.strip() if interacting_name_elem is not None and interacting_name_elem.text else None,
-                'description': description_elem.text.strip() if description_elem is not None and description_elem.text else None,
-            }
-            if any(interaction_detail.values()):  # Adiciona apenas se tiver pelo menos um campo preenchido
-                drug_interactions.append(interaction_detail)
-    drug_data['drug_interactions'] = drug_interactions
-
-    # Interações com Alimentos
-    food_interactions = []
-    food_interactions_elem = drug_element.find('{%s}food-interactions' % DB_NAMESPACE)
-    if food_interactions_elem is not None:
-        for fi_elem in food_interactions_elem.findall('{%s}food-interaction' % DB_NAMESPACE):
-            if fi_elem.text:
-                food_interactions.append(fi_elem.text.strip())
-    drug_data['food_interactions'] = food_interactions
-
-    # 4. Alvos
-    targets = []
-    targets_elem = drug_element.find('{%s}targets' % DB_NAMESPACE)
-    if targets_elem is not None:
-        for target_elem in targets_elem.findall('{%s}target' % DB_NAMESPACE):
-            # A estrutura interna de target pode ser complexa, aqui pegamos apenas o ID UniProt se existir
-            polypeptide_elem = target_elem.find('{%s}polypeptide' % DB_NAMESPACE)
-            if polypeptide_elem is not None:
-                uniprot_id_elem = polypeptide_elem.find(
-                    '{%s}external-identifiers/{%s}external-identifier[{%s}resource="UniProtKB"]/{%s}identifier' % (
-                        DB_NAMESPACE, DB_NAMESPACE, DB_NAMESPACE, DB_NAMESPACE))
-                name_elem = polypeptide_elem.find('{%s}name' % DB_NAMESPACE)
+def _texto(elem):
+    """Texto de um elemento sem espaços nas pontas, ou None se estiver vazio."""
+    return elem.text.strip() if elem.text else None
+
+
+def _primeiros_textos(elem, campos):
+    """Percorre os filhos de `elem` uma vez e devolve o texto do primeiro filho de cada tag em `campos`."""
+    valores = dict.fromkeys(campos.values())
+    vistos = set()
+    for filho in elem:
+        chave = campos.get(filho.tag)
+        if chave is not None and chave not in vistos:
+            vistos.add(chave)
+            valores[chave] = _texto(filho)
+    return valores
+
+
+def _lista_de_registros(elem, tag_item, campos, drug_data, chave):
+    """Adiciona a drug_data[chave] um registro por filho `tag_item` que tenha pelo menos um campo preenchido."""
+    registros = drug_data[chave]
+    for item in elem:
+        if item.tag == tag_item:
+            registro = _primeiros_textos(item, campos)
+            if any(registro.values()):  # Adiciona apenas se tiver pelo menos um campo preenchido
+                registros.append(registro)
+
+
+def _extrair_categorias(elem, drug_data):
+    categories = drug_data['categories']
+    for category_elem in elem:
+        if category_elem.tag == TAG_CATEGORY:
+            for cat_name_elem in category_elem:
+                if cat_name_elem.tag == TAG_CATEGORY:
+                    if cat_name_elem.text:
+                        categories.append(cat_name_elem.text.strip())
+                    break
+
+
+def _extrair_interacoes(elem, drug_data):
+    _lista_de_registros(elem, TAG_DRUG_INTERACTION, CAMPOS_INTERACAO, drug_data, 'drug_interactions')
+
+
+def _extrair_alvos(elem, drug_data):
+    targets = drug_data['targets']
+    for target_elem in elem:
+        if target_elem.tag != TAG_TARGET:
+            continue
+        # A estrutura interna de target pode ser complexa, aqui pegamos apenas o ID UniProt se existir
+        for polypeptide_elem in target_elem:
+            if polypeptide_elem.tag == TAG_POLYPEPTIDE:
+                uniprot_ids = XPATH_UNIPROT_ID(polypeptide_elem)
                 target_detail = {
-                    'uniprot_id': uniprot_id_elem.text.strip() if uniprot_id_elem is not None and uniprot_id_elem.text else None,
-                    'name': name_elem.text.strip() if name_elem is not None and name_elem.text else None
+                    'uniprot_id': _texto(uniprot_ids[0]) if uniprot_ids else None,
+                    'name': _primeiros_textos(polypeptide_elem, CAMPOS_NOME)['name'],
                 }
                 if any(target_detail.values()):
                     targets.append(target_detail)
-    drug_data['targets'] = targets
-
-    # 5. Dosagens
-    dosages = []
-    dosages_elem = drug_element.find('{%s}dosages' % DB_NAMESPACE)
-    if dosages_elem is not None:
-        for dosage_elem in dosages_elem.findall('{%s}dosage' % DB_NAMESPACE):
-            form = safe_extract_text(dosage_elem, '{%s}form' % DB_NAMESPACE, NS_MAP)
-            route = safe_extract_text(dosage_elem, '{%s}route' % DB_NAMESPACE, NS_MAP)
-            strength = safe_extract_text(dosage_elem, '{%s}strength' % DB_NAMESPACE, NS_MAP)
-            dosage_detail = {'form': form, 'route': route, 'strength': strength}
-            if any(dosage_detail.values()):
-                dosages.append(dosage_detail)
-    drug_data['dosages'] = dosages
-    
-    # 6. Produtos - Incluindo labeller
-    products = []
-    products_elem = drug_element.find('{%s}products' % DB_NAMESPACE)
-    if products_elem is not None:
-        for product_elem in products_elem.findall('{%s}product' % DB_NAMESPACE):
-            product_detail = {
-                'name': safe_extract_text(product_elem, '{%s}name' % DB_NAMESPACE, NS_MAP),
-                'labeller': safe_extract_text(product_elem, '{%s}labeller' % DB_NAMESPACE, NS_MAP), 
-                'dosage_form': safe_extract_text(product_elem, '{%s}dosage-form' % DB_NAMESPACE, NS_MAP),
-                'strength': safe_extract_text(product_elem, '{%s}strength' % DB_NAMESPACE, NS_MAP),
-                'route': safe_extract_text(product_elem, '{%s}route' % DB_NAMESPACE, NS_MAP),
-                'generic': safe_extract_text(product_elem, '{%s}generic' % DB_NAMESPACE, NS_MAP),
-                'approved': safe_extract_text(product_elem, '{%s}approved' % DB_NAMESPACE, NS_MAP),
-                'country': safe_extract_text(product_elem, '{%s}country' % DB_NAMESPACE, NS_MAP)
-            }
-            if any(product_detail.values()):
-                products.append(product_detail)
-    drug_data['products'] = products
-
-    # 7. Sinônimos
-    synonyms = []
-    synonyms_elem = drug_element.find('{%s}synonyms' % DB_NAMESPACE)
-    if synonyms_elem is not None:
-        for synonym_elem in synonyms_elem.findall('{%s}synonym' % DB_NAMESPACE):
-            if synonym_elem.text:
-                synonyms.append(synonym_elem.text.strip())
-    drug_data['synonyms'] = synonyms
-
-    # 8. Classificação
-    classification = {}
-    classification_elem = drug_element.find('{%s}classification' % DB_NAMESPACE)
-    if classification_elem is not None:
-        classification['subclass'] = safe_extract_text(classification_elem, '{%s}subclass' % DB_NAMESPACE, NS_MAP)
-        classification['alternative_parent'] = safe_extract_text(classification_elem,
-                                                                 '{%s}alternative-parent' % DB_NAMESPACE, NS_MAP)
-        classification['substituent'] = safe_extract_text(classification_elem, '{%s}substituent' % DB_NAMESPACE,
-                                                           NS_MAP)
+                break
+
+
+def _extrair_dosagens(elem, drug_data):
+    _lista_de_registros(elem, TAG_DOSAGE, CAMPOS_DOSAGEM, drug_data, 'dosages')
+
+
+def _extrair_produtos(elem, drug_data):
+    _lista_de_registros(elem, TAG_PRODUCT, CAMPOS_PRODUTO, drug_data, 'products')
+
+
+def _extrair_classificacao(elem, drug_data):
+    classification = _primeiros_textos(elem, CAMPOS_CLASSIFICACAO)
     if any(classification.values()):
         drug_data['classification'] = classification
-    else:
-         drug_data['classification'] = None # Or an empty dict {} if you prefer
 
 
-    # 9. IDs Externos 
-    external_identifiers = []
-    ext_ids_elem = drug_element.find('{%s}external-identifiers' % DB_NAMESPACE)
-    if ext_ids_elem is not None:
-        for ext_id_elem in ext_ids_elem.findall('{%s}external-identifier' % DB_NAMESPACE):
-            resource = safe_extract_text(ext_id_elem, '{%s}resource' % DB_NAMESPACE, NS_MAP)
-            identifier = safe_extract_text(ext_id_elem, '{%s}identifier' % DB_NAMESPACE, NS_MAP)
-            if resource and identifier:
-                external_identifiers.append({'resource': resource, 'identifier': identifier})
-    drug_data['external_identifiers'] = external_identifiers
+def _extrair_ids_externos(elem, drug_data):
+    external_identifiers = drug_data['external_identifiers']
+    for ext_id_elem in elem:
+        if ext_id_elem.tag == TAG_EXTERNAL_IDENTIFIER:
+            ext_id = _primeiros_textos(ext_id_elem, CAMPOS_ID_EXTERNO)
+            if ext_id['resource'] and ext_id['identifier']:
+                external_identifiers.append(ext_id)
 
-    return drug_data
 
+# Handlers dos filhos compostos de <drug>: tag -> função(elemento, drug_data)
+HANDLERS_DRUG = {
+    TAG_CATEGORIES: _extrair_categorias,
+    _tag('drug-interactions'): _extrair_interacoes,
+    _tag('targets'): _extrair_alvos,
+    _tag('dosages'): _extrair_dosagens,
+    _tag('products'): _extrair_produtos,
+    _tag('classification'): _extrair_classificacao,
+    _tag('external-identifiers'): _extrair_ids_externos,
+}
 
-print(f"Iniciando o parse, identificação e extração de dados de antibióticos: {xml_file_path}")
 
-if not os.path.exists(xml_file_path):
-    print(f"Erro: Arquivo não encontrado em {xml_file_path}")
-else:
-    count_drugs = 0
-    count_antibiotics = 0
-    antibiotic_data = []  # Lista para armazenar os dados dos antibióticos encontrados
+def extract_antibiotic_data(drug_element):
+    """Extrai os dados relevantes de um elemento <drug>.
+
+    Percorre os filhos diretos do <drug> uma única vez e envia cada um ao handler do seu
+    campo. Tal como com find(), só a primeira ocorrência de cada tag é considerada.
+    """
+    drug_data = {chave: [] if chave in CHAVES_LISTA else None for chave in CHAVES_DRUG}
+    vistos = set()
+    primary_id = None
+    any_id_elem = None
+
+    for child in drug_element:
+        tag = child.tag
+
+        # Encontrar o drugbank-id primário (ou, na falta dele, o primeiro disponível)
+        if tag == TAG_DRUGBANK_ID:
+            if any_id_elem is None:
+                any_id_elem = child
+            if primary_id is None and child.get('primary') == 'true':
+                primary_id = _texto(child) or ''
+            continue
+
+        if tag in vistos:
+            continue
+
+        chave = CAMPOS_TEXTO_DRUG.get(tag)
+        if chave is not None:
+            vistos.add(tag)
+            drug_data[chave] = _texto(child)
+            continue
+
+        lista = LISTAS_TEXTO_DRUG.get(tag)
+        if lista is not None:
+            vistos.add(tag)
+            tag_item, chave = lista
+            drug_data[chave] = [item.text.strip() for item in child if item.tag == tag_item and item.text]
+            continue
+
+        handler = HANDLERS_DRUG.get(tag)
+        if handler is not None:
+            vistos.add(tag)
+            handler(child, drug_data)
+
+    drug_data['drugbank_id'] = primary_id or (_texto(any_id_elem) if any_id_elem is not None else None)
+    return drug_data
 
+
+class ClassificadorCategorias:
+    """
+    Atribui a cada <drug> as classes terapêuticas cujas palavras-chave aparecem nas suas categorias.
+
+    Todas as palavras-chave de todas as classes formam uma única expressão regular compilada,
+    percorrida uma vez por categoria. Em cada posição a expressão encontra a palavra-chave
+    mais longa; como cada palavra-chave também herda as classes das palavras-chave contidas
+    nela (ex.: 'Antibiotics' contém 'Antibiotic'), nenhuma classe se perde. O resultado de
+    cada texto de categoria fica em cache: o DrugBank tem poucos milhares de categorias distintas.
+    """
+
+    def __init__(self, classes):
+        self.classes = list(classes)
+        palavras = {}
+        for classe, termos in classes.items():
+            for termo in termos:
+                palavras.setdefault(termo.casefold(), set()).add(classe)
+        self._classes_da_palavra = {
+            palavra: frozenset().union(*(classes_termo for outra, classes_termo in palavras.items() if outra in palavra))
+            for palavra in palavras
+        }
+        alternativas = "|".join(re.escape(palavra) for palavra in sorted(palavras, key=len, reverse=True))
+        self._padrao = re.compile(f"(?=({alternativas}))", re.IGNORECASE)
+        self._cache = {}
+
+    def classes_da_categoria(self, texto):
+        """Classes (frozenset) cujas palavras-chave aparecem no texto de uma categoria."""
+        classes = self._cache.get(texto)
+        if classes is None:
+            classes = frozenset().union(*(self._classes_da_palavra[m.group(1).casefold()]
+                                          for m in self._padrao.finditer(texto)))
+            self._cache[texto] = classes
+        return classes
+
+    def classificar(self, drug_element):
+        """Classes do elemento <drug> (frozenset vazio se não pertencer a nenhuma)."""
+        encontradas = frozenset()
+        categories_elem = drug_element.find(TAG_CATEGORIES)
+        if categories_elem is None:
+            return encontradas
+        for category_elem in categories_elem.iterfind(TAG_CATEGORY):
+            cat_name_elem = category_elem.find(TAG_CATEGORY)
+            if cat_name_elem is not None and cat_name_elem.text:
+                encontradas |= self.classes_da_categoria(cat_name_elem.text.strip())
+                if len(encontradas) == len(self.classes):
+                    break  # Já pertence a todas as classes, não precisa verificar as outras categorias
+        return encontradas
+
+
+_classificador_antibioticos = ClassificadorCategorias({'antibiotics': ANTIBIOTIC_KEYWORDS})
+
+
+def is_antibiotic(drug_element):
+    """Verifica se alguma categoria do elemento <drug> corresponde a um dos ANTIBIOTIC_KEYWORDS."""
+    return bool(_classificador_antibioticos.classificar(drug_element))
+
+
+def iterar_drugs(xml_file_path, estatisticas):
+    """Percorre os elementos <drug> do XML, libertando a memória de cada um depois de processado."""
+    context = etree.iterparse(xml_file_path, events=('end',), tag=TAG_DRUG)
+    for event, elem in context:
+        estatisticas['drugs'] += 1
+        yield elem
+
+        # --- Gerenciamento de Memória ---
+        # Crucial para liberar a memória após processar cada elemento <drug>
+        elem.clear()
+        while elem.getprevious() is not None:
+            del elem.getprevious().getparent()[0]
+        # --- Fim Gerenciamento de Memória ---
+
+
+def _extrair_lote(lote_xml):
+    """Executado nos processos do pool: reconstrói cada <drug> serializado e extrai os seus dados."""
+    return [extract_antibiotic_data(etree.fromstring(drug_xml)) for drug_xml in lote_xml]
+
+
+def _classificados(xml_file_path, estatisticas, classificador):
+    """Gera (classes, elemento) para os <drug> que pertencem a pelo menos uma das classes."""
+    contagens = estatisticas.setdefault('classes', collections.Counter())
+    for elem in iterar_drugs(xml_file_path, estatisticas):
+        classes = classificador.classificar(elem)
+        if classes:
+            contagens.update(classes)
+            yield classes, elem
+
+
+def _lotes_serializados(xml_file_path, estatisticas, classificador):
+    """Serializa os <drug> classificados em lotes de tamanho_lote elementos: (classes, xml) de cada lote."""
+    classes_lote, lote = [], []
+    for classes, elem in _classificados(xml_file_path, estatisticas, classificador):
+        classes_lote.append(classes)
+        lote.append(etree.tostring(elem))
+        if len(lote) == tamanho_lote:
+            yield classes_lote, lote
+            classes_lote, lote = [], []
+    if lote:
+        yield classes_lote, lote
+
+
+def extrair_por_classe(xml_file_path, estatisticas, classificador, workers=1):
+    """Gera (classes, dados) de cada <drug> das classes do classificador, pela ordem do arquivo.
+
+    Todas as classes são extraídas no mesmo passe sobre o XML. Com workers > 1, o processo
+    principal só faz o scan dos <drug> e a classificação pelas categorias; a extração corre
+    num pool de processos. Os lotes são consumidos pela ordem de submissão, o que mantém a
+    saída determinística, e o número de lotes pendentes é limitado para a memória não
+    crescer quando o parse é mais rápido que a extração.
+    """
+    if workers <= 1:
+        for classes, elem in _classificados(xml_file_path, estatisticas, classificador):
+            yield classes, extract_antibiotic_data(elem)
+        return
+
+    max_pendentes = workers * 4
+    with multiprocessing.Pool(processes=workers) as pool:
+        pendentes = collections.deque()
+        for classes_lote, lote in _lotes_serializados(xml_file_path, estatisticas, classificador):
+            pendentes.append((classes_lote, pool.apply_async(_extrair_lote, (lote,))))
+            while len(pendentes) >= max_pendentes:
+                classes_lote, resultado = pendentes.popleft()
+                yield from zip(classes_lote, resultado.get())
+        while pendentes:
+            classes_lote, resultado = pendentes.popleft()
+            yield from zip(classes_lote, resultado.get())
+
+
+def extrair_antibioticos(xml_file_path, estatisticas, workers=1):
+    """Gera os dados de cada antibiótico do XML, pela ordem em que aparecem no arquivo."""
+    for _, data in extrair_por_classe(xml_file_path, estatisticas, _classificador_antibioticos, workers):
+        yield data
+
+
+def caminhos_da_classe(classe, output, snapshot):
+    """(JSON Lines, snapshot) de uma classe: --output e --snapshot para os antibióticos,
+    '<classe>_dataset.jsonl' e '<classe>_snapshot' no diretório de dados para as restantes."""
+    if classe == 'antibiotics':
+        return output, snapshot
+    base = os.path.join(configuracao.diretorio_dados, classe)
+    return base + '_dataset.jsonl', base + '_snapshot' if snapshot else ''
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extrai do XML do DrugBank os dados de uma ou mais classes de medicamentos.")
+    parser.add_argument('--workers', type=int, default=num_workers,
+                        help="Número de processos para a extração (1 = sem paralelismo).")
+    parser.add_argument('--xml', default=xml_file_path,
+                        help="Arquivo XML do DrugBank (variável de ambiente DRUGBANK_XML).")
+    parser.add_argument('--classes', nargs='+', choices=list(CLASSES_TERAPEUTICAS), default=classes_extraidas,
+                        help="Classes terapêuticas a extrair, todas no mesmo passe sobre o XML.")
+    parser.add_argument('--output', default=output_json_path,
+                        help="Arquivo JSON Lines de saída dos antibióticos ('-' para stdout).")
+    parser.add_argument('--snapshot', default=snapshot_path,
+                        help="Diretório do snapshot colunar dos antibióticos ('' para não gerar nenhum snapshot).")
+    args = parser.parse_args(argv)
+    xml_path = args.xml
+    classificador = ClassificadorCategorias({classe: CLASSES_TERAPEUTICAS[classe] for classe in args.classes})
+
+    print(f"Iniciando o parse, identificação e extração de dados ({', '.join(classificador.classes)}): {xml_path}",
+          file=sys.stderr)
+    # Verificado antes de abrir as saídas: um caminho errado não pode apagar os datasets anteriores
+    if not os.path.exists(xml_path):
+        print(f"Erro: Arquivo não encontrado em {xml_path}", file=sys.stderr)
+        return 1
+
+    estatisticas = {'drugs': 0}
+    snapshots, trocados = {}, set()
+    jsonl_substituidos = False
     try:
-        context = etree.iterparse(xml_file_path, events=('end',), tag='{%s}drug' % DB_NAMESPACE)
-
-        print("Iterando sobre os elementos <drug>...")
-
-        for event, elem in context:
-            count_drugs += 1
-            is_antibiotic = False
-
-            # --- Lógica para Identificar Antibióticos (da Etapa 2) ---
-            categories_elem = elem.find('{%s}categories' % DB_NAMESPACE)
-            if categories_elem is not None:
-                for category_elem in categories_elem.findall('{%s}category' % DB_NAMESPACE):
-                    cat_name_elem = category_elem.find('{%s}category' % DB_NAMESPACE)
-                    if cat_name_elem is not None and cat_name_elem.text:
-                        category_text = cat_name_elem.text.strip()
-                        if any(keyword.lower() in category_text.lower() for keyword in ANTIBIOTIC_KEYWORDS):
-                            is_antibiotic = True
-                            break  # Encontrou, não precisa verificar as outras categorias deste drug
-
-            # --- Se for um antibiótico, extraia e armazene os dados ---
-            if is_antibiotic:
-                count_antibiotics += 1
-                data = extract_antibiotic_data(elem)
-                antibiotic_data.append(data)
-                print(f"  Extraído dados para {data.get('name', 'N/A')} (ID: {data.get('drugbank_id', 'N/A')})")
-
-            # --- Gerenciamento de Memória ---
-            # Crucial para liberar a memória após processar cada elemento <drug>
-            elem.clear()
-            while elem.getprevious() is not None:
-                del elem.getprevious().getparent()[0]
-            # --- Fim Gerenciamento de Memória ---
-
-        print(f"\nParse concluído. Total de elementos <drug> encontrados: {count_drugs}")
-        print(f"Total de antibióticos identificados e dados extraídos: {count_antibiotics}")
-        print(f"Preparando para salvar {len(antibiotic_data)} registros no arquivo JSON...")
-
-        # --- Salvar os Dados Extraídos ---
-        try:
-            with open(output_json_path, 'w', encoding='utf-8') as f:
-                json.dump(antibiotic_data, f, indent=4, ensure_ascii=False)
-            print(f"Dados salvos com sucesso em {output_json_path}")
-        except Exception as e:
-            print(f"Erro ao salvar o arquivo JSON: {e}")
+        # Cada saída é escrita num temporário e só substitui a anterior se o parse terminar sem erro
+        with contextlib.ExitStack() as stack:
+            saidas = {}
+            for classe in classificador.classes:
+                caminho_json, caminho_snapshot = caminhos_da_classe(classe, args.output, args.snapshot)
+                saidas[classe] = (caminho_json, stack.enter_context(abrir_saida(caminho_json)))
+                snapshots[classe] = (caminho_snapshot, EscritorSnapshot(caminho_snapshot)) if caminho_snapshot else None
+
+            print(f"Iterando sobre os elementos <drug> ({args.workers} worker(s))...")
+
+            # Cada medicamento é escrito assim que é extraído, no dataset de cada uma das suas classes
+            for classes, data in extrair_por_classe(xml_path, estatisticas, classificador, workers=args.workers):
+                for classe in classes:
+                    escrever_registro(saidas[classe][1], data)
+                    if snapshots[classe] is not None:
+                        snapshots[classe][1].adicionar(data)
+                print(f"  Extraído dados para {data.get('name', 'N/A')} (ID: {data.get('drugbank_id', 'N/A')})"
+                      f" [{', '.join(sorted(classes))}]")
+
+            print(f"\nParse concluído. Total de elementos <drug> encontrados: {estatisticas['drugs']}")
+            for classe in classificador.classes:
+                print(f"Total de {classe} identificados e dados extraídos: {estatisticas['classes'][classe]}"
+                      f" -> {saidas[classe][0]}")
+
+            # Os snapshots ficam completos nos seus '.tmp' antes de os JSON Lines substituírem os
+            # anteriores (ao sair do ExitStack): depois disso só faltam as trocas de diretório
+            for classe in classificador.classes:
+                if snapshots[classe] is not None:
+                    snapshots[classe][1].gravar()
+
+        jsonl_substituidos = True
+        for classe in classificador.classes:
+            if snapshots[classe] is not None:
+                snapshots[classe][1].trocar()
+                trocados.add(classe)
+                print(f"Snapshot colunar de {classe} salvo em {snapshots[classe][0]}", file=sys.stderr)
 
     except Exception as e:
-        print(f"Ocorreu um erro durante o parse: {e}")
-        print("Verifique o arquivo XML e a lógica de extração.")
\ No newline at end of file
+        for snapshot in snapshots.values():
+            if snapshot is not None:
+                snapshot[1].descartar()
+        print(f"Ocorreu um erro durante o parse: {e}", file=sys.stderr)
+        if not jsonl_substituidos:
+            print("Verifique o arquivo XML e a lógica de extração. Os arquivos anteriores não foram alterados.",
+                  file=sys.stderr)
+            return 1
+        # Os JSON Lines já são os novos: um snapshot antigo ao lado deles seria lido em vez do
+        # JSON por drugbank_chunks.py, com dados desatualizados
+        for classe, snapshot in snapshots.items():
+            if snapshot is not None and classe not in trocados:
+                shutil.rmtree(snapshot[0], ignore_errors=True)
+                print(f"O snapshot de {classe} em {snapshot[0]} ficou desatualizado e foi apagado.", file=sys.stderr)
+        print("Os JSON Lines foram atualizados; volte a executar a extração para gerar os snapshots.",
+              file=sys.stderr)
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,84 @@
+import contextlib
+import json
+import os
+import sys
+
+# Leitura e escrita em streaming no formato JSON Lines (um registro JSON por linha).
+# Cada etapa do pipeline (json -> chunks -> vetor) processa um registro de cada vez,
+# com memória constante. O caminho '-' representa stdin/stdout, o que permite
+# encadear as etapas com pipes sem arquivos intermédios, por exemplo:
+#   python drugbank_json.py --output - | python drugbank_chunks.py --input - --output - | python drugbank_vetor.py --input -
+
+
+def ler_registros(caminho):
+    """Gera os registros de um arquivo JSON Lines ('-' lê do stdin).
+
+    Arquivos '.json' antigos (uma lista JSON única) continuam a ser aceites, mas nesse
+    caso são carregados inteiros em memória.
+    """
+    if caminho != '-' and caminho.endswith('.json'):
+        with open(caminho, 'r', encoding='utf-8') as f:
+            yield from json.load(f)
+        return
+
+    with contextlib.ExitStack() as stack:
+        if caminho == '-':
+            f = sys.stdin
+        else:
+            f = stack.enter_context(open(caminho, 'r', encoding='utf-8'))
+        for numero_linha, linha in enumerate(f, start=1):
+            linha = linha.strip()
+            if not linha:
+                continue
+            try:
+                yield json.loads(linha)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Linha {numero_linha} de {caminho} não é JSON válido: {e}") from e
+
+
+@contextlib.contextmanager
+def abrir_saida(caminho):
+    """Abre o destino de escrita de um arquivo JSON Lines ('-' escreve no stdout).
+
+    Um arquivo é escrito em '<caminho>.tmp' e só substitui o anterior quando o contexto
+    termina sem erro; se houver uma exceção, o temporário é apagado e o arquivo anterior
+    fica intacto (a etapa seguinte nunca lê uma saída incompleta).
+
+    Quando a saída é o stdout, as mensagens de progresso (print) passam a ir para o
+    stderr enquanto o contexto estiver aberto, para não se misturarem com os dados.
+    """
+    if caminho != '-':
+        temporario = caminho + '.tmp'
+        try:
+            with open(temporario, 'w', encoding='utf-8') as f:
+                yield f
+        except BaseException:
+            if os.path.exists(temporario):
+                os.remove(temporario)
+            raise
+        os.replace(temporario, caminho)
+        return
+
+    saida = sys.stdout
+    sys.stdout = sys.stderr
+    try:
+        yield saida
+    finally:
+        saida.flush()
+        sys.stdout = saida
+
+
+def escrever_registro(f, registro):
+    """Escreve um registro como uma linha JSON."""
+    f.write(json.dumps(registro, ensure_ascii=False))
+    f.write('\n')
+
+
+def escrever_registros(registros, caminho):
+    """Consome um iterável de registros e escreve-os em JSON Lines. Devolve o número de registros."""
+    total = 0
+    with abrir_saida(caminho) as f:
+        for registro in registros:
+            escrever_registro(f, registro)
+            total += 1
+    return total
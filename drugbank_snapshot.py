@@ -0,0 +1,416 @@
+# drugbank_snapshot.py
+# Snapshot binário e colunar do dataset de antibióticos, gerado por drugbank_json.py ao
+# lado do JSON Lines. Em vez de voltar a fazer o parse de todo o JSON, as etapas seguintes
+# (drugbank_chunks.py, grafo_interacoes.py, análises) abrem os arrays por memory-map e só
+# leem as colunas de que precisam.
+#
+# Todos os textos são internados numa tabela única (cada texto distinto é guardado uma só
+# vez, reconhecido pelo seu digest) e as colunas guardam inteiros, com -1 = None e -2 = chave ausente. Arquivos no
+# diretório do snapshot:
+#   esquema.json                  número de registros e campos, pela ordem do dataset
+#   _textos.npy, _textos.inicio.npy  bytes UTF-8 dos textos e o início de cada um (n + 1)
+#   <campo>.estado.npy            int8 por registro: 0 = presente, -1 = None, -2 = ausente
+#   <campo>.npy                   texto: int32 por registro; lista de textos: int32 por item
+#   <campo>.inicio.npy            listas: itens do registro i em [inicio[i], inicio[i + 1])
+#   <campo>.<subcampo>.npy        listas de dicionários: int32 por item; dicionários: por registro
+#
+# O tipo de cada campo ('texto', 'lista' ou 'registro') é deduzido do primeiro valor não
+# nulo, pelo que o snapshot aceita qualquer registro com textos, listas e dicionários de
+# textos, como os produzidos por extract_antibiotic_data.
+
+import array
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+
+from drugbank_jsonl import ler_registros
+
+ARQUIVO_ESQUEMA = 'esquema.json'
+VERSAO = 1
+
+PRESENTE, NULO, AUSENTE = 0, -1, -2
+
+# Valores de cada array guardados em memória antes de serem acrescentados ao arquivo
+tamanho_buffer = 1 << 16
+
+
+def _validar_texto(valor, campo):
+    if not isinstance(valor, str):
+        raise ValueError(f"Valor não suportado no campo '{campo}' do snapshot: {valor!r}")
+    return valor
+
+
+class _ArrayEmDisco:
+    """
+    Array só de acréscimo de EscritorSnapshot, gravado em '<nome>.bin' no diretório
+    temporário: só os últimos valores (até `tamanho_buffer`) ficam em memória.
+    """
+
+    def __init__(self, diretorio, nome, typecode, prefixo=0, valor_prefixo=0):
+        self.caminho = os.path.join(diretorio, f"{nome}.bin")
+        self.tamanho = 0
+        self.ultimo = None
+        self._buffer = array.array(typecode)
+        open(self.caminho, 'wb').close()
+        self.repetir(valor_prefixo, prefixo)
+
+    def append(self, valor):
+        self._buffer.append(valor)
+        self.tamanho += 1
+        self.ultimo = valor
+        if len(self._buffer) >= tamanho_buffer:
+            self._descarregar()
+
+    def repetir(self, valor, vezes):
+        """Acrescenta `vezes` cópias de `valor` (o preenchimento das linhas anteriores a uma coluna)."""
+        while vezes > 0:
+            bloco = min(vezes, tamanho_buffer)
+            self._buffer.extend(array.array(self._buffer.typecode, [valor]) * bloco)
+            self.tamanho += bloco
+            self.ultimo = valor
+            vezes -= bloco
+            self._descarregar()
+
+    def acrescentar_bytes(self, dados):
+        self._buffer.frombytes(dados)
+        self.tamanho += len(dados)
+        if len(self._buffer) >= tamanho_buffer:
+            self._descarregar()
+
+    def _descarregar(self):
+        with open(self.caminho, 'ab') as f:
+            self._buffer.tofile(f)
+        del self._buffer[:]
+
+    def gravar(self, dtype):
+        """Converte o '.bin' num '.npy' ao lado (cabeçalho + cópia em blocos, sem carregar o array)."""
+        self._descarregar()
+        destino = self.caminho[:-len('.bin')] + '.npy'
+        with open(destino, 'wb') as saida:
+            np.lib.format.write_array_header_1_0(saida, {
+                'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)),
+                'fortran_order': False,
+                'shape': (self.tamanho,),
+            })
+            with open(self.caminho, 'rb') as entrada:
+                shutil.copyfileobj(entrada, saida)
+        os.remove(self.caminho)
+
+
+class _Coluna:
+    """Coluna em construção de EscritorSnapshot (arrays só de acréscimo em disco)."""
+
+    def __init__(self, diretorio, nome, linhas_anteriores):
+        self.diretorio = diretorio
+        self.nome = nome
+        self.tipo = None
+        self.itens = None  # listas: 'texto' ou 'registro'
+        # Registros anteriores ao primeiro em que o campo aparece não têm a chave
+        self.estado = self._array('.estado', 'b', linhas_anteriores, AUSENTE)
+        self.ids = None
+        self.inicio = None
+        self.subcampos = {}
+
+    def _array(self, sufixo, typecode, prefixo=0, valor_prefixo=0):
+        return _ArrayEmDisco(self.diretorio, f"{self.nome}{sufixo}", typecode, prefixo, valor_prefixo)
+
+    def _definir_tipo(self, valor):
+        linhas = self.estado.tamanho
+        if isinstance(valor, list):
+            self.tipo = 'lista'
+            self.inicio = self._array('.inicio', 'q', linhas + 1, 0)
+        elif isinstance(valor, dict):
+            self.tipo = 'registro'
+        else:
+            self.tipo = 'texto'
+            self.ids = self._array('', 'i', linhas, NULO)
+
+    def _subcampo(self, nome, tamanho):
+        coluna = self.subcampos.get(nome)
+        if coluna is None:
+            coluna = self.subcampos[nome] = self._array(f".{nome}", 'i', tamanho, AUSENTE)
+        return coluna
+
+    def _adicionar_dicionario(self, valor, tamanho, internar):
+        """Acrescenta uma linha aos subcampos (as chaves em falta ficam AUSENTE)."""
+        for subcampo in valor:
+            self._subcampo(subcampo, tamanho)
+        for subcampo, coluna in self.subcampos.items():
+            if subcampo in valor:
+                texto = valor[subcampo]
+                coluna.append(NULO if texto is None else internar(_validar_texto(texto, self.nome)))
+            else:
+                coluna.append(AUSENTE)
+
+    def adicionar(self, registro, internar):
+        if self.nome not in registro:
+            estado, valor = AUSENTE, None
+        else:
+            valor = registro[self.nome]
+            estado = NULO if valor is None else PRESENTE
+        if estado == PRESENTE and self.tipo is None:
+            self._definir_tipo(valor)
+
+        if self.tipo == 'texto':
+            self.ids.append(internar(_validar_texto(valor, self.nome)) if estado == PRESENTE else NULO)
+        elif self.tipo == 'registro':
+            if not isinstance(valor, dict) and estado == PRESENTE:
+                raise ValueError(f"O campo '{self.nome}' mistura dicionários com outros valores")
+            self._adicionar_dicionario(valor if estado == PRESENTE else {}, self.estado.tamanho, internar)
+        elif self.tipo == 'lista':
+            if estado == PRESENTE:
+                if not isinstance(valor, list):
+                    raise ValueError(f"O campo '{self.nome}' mistura listas com outros valores")
+                total_itens = self.inicio.ultimo
+                for item in valor:
+                    if self.itens is None:
+                        self.itens = 'registro' if isinstance(item, dict) else 'texto'
+                        self.ids = self._array('', 'i') if self.itens == 'texto' else None
+                    if self.itens == 'registro':
+                        self._adicionar_dicionario(item, total_itens, internar)
+                    else:
+                        self.ids.append(internar(_validar_texto(item, self.nome)))
+                    total_itens += 1
+                self.inicio.append(total_itens)
+            else:
+                self.inicio.append(self.inicio.ultimo)
+        self.estado.append(estado)
+
+    def gravar(self):
+        """Converte os arrays da coluna em '.npy' e devolve a sua entrada em esquema.json."""
+        self.estado.gravar(np.int8)
+        entrada = {'nome': self.nome, 'tipo': self.tipo}
+        if self.ids is not None:
+            self.ids.gravar(np.int32)
+        if self.inicio is not None:
+            self.inicio.gravar(np.int64)
+            entrada['itens'] = self.itens
+        if self.subcampos:
+            entrada['subcampos'] = list(self.subcampos)
+            for coluna in self.subcampos.values():
+                coluna.gravar(np.int32)
+        return entrada
+
+
+class EscritorSnapshot:
+    """
+    Constrói um snapshot registro a registro. As colunas e os textos vão sendo gravados em
+    '<diretorio>.tmp' à medida que os registros chegam; em memória fica só um digest de
+    16 bytes por texto distinto (para internar) e os buffers de cada array. gravar()
+    converte o temporário num snapshot completo e trocar() substitui o anterior por ele.
+    """
+
+    def __init__(self, diretorio):
+        self.diretorio = diretorio
+        self.temporario = diretorio.rstrip('/\\') + '.tmp'
+        shutil.rmtree(self.temporario, ignore_errors=True)
+        os.makedirs(self.temporario)
+        self.total = 0
+        self._colunas = {}
+        self._ids_textos = {}  # digest do texto -> id
+        self._textos = _ArrayEmDisco(self.temporario, '_textos', 'B')
+        self._inicio_textos = _ArrayEmDisco(self.temporario, '_textos.inicio', 'q', 1, 0)
+
+    def _internar(self, texto):
+        dados = texto.encode('utf-8')
+        chave = hashlib.blake2b(dados, digest_size=16).digest()
+        texto_id = self._ids_textos.get(chave)
+        if texto_id is None:
+            texto_id = self._ids_textos[chave] = len(self._ids_textos)
+            self._textos.acrescentar_bytes(dados)
+            self._inicio_textos.append(self._textos.tamanho)
+        return texto_id
+
+    def adicionar(self, registro):
+        for campo in registro:
+            if campo not in self._colunas:
+                self._colunas[campo] = _Coluna(self.temporario, campo, self.total)
+        for coluna in self._colunas.values():
+            coluna.adicionar(registro, self._internar)
+        self.total += 1
+
+    def registrar(self, registros):
+        """Adiciona cada registro do stream à medida que passa e volta a gerá-lo, sem o reter."""
+        for registro in registros:
+            self.adicionar(registro)
+            yield registro
+
+    def gravar(self):
+        """Completa o snapshot no diretório temporário (arrays '.npy' e esquema.json)."""
+        self._textos.gravar(np.uint8)
+        self._inicio_textos.gravar(np.int64)
+        esquema = {
+            'versao': VERSAO,
+            'total': self.total,
+            'campos': [coluna.gravar() for coluna in self._colunas.values()],
+        }
+        with open(os.path.join(self.temporario, ARQUIVO_ESQUEMA), 'w', encoding='utf-8') as f:
+            json.dump(esquema, f, ensure_ascii=False, indent=1)
+
+    def trocar(self):
+        """Substitui o snapshot anterior pelo gravado no diretório temporário."""
+        antigo = self.diretorio.rstrip('/\\') + '.old'
+        shutil.rmtree(antigo, ignore_errors=True)
+        if os.path.exists(self.diretorio):
+            os.replace(self.diretorio, antigo)
+        os.replace(self.temporario, self.diretorio)
+        shutil.rmtree(antigo, ignore_errors=True)
+
+    def fechar(self):
+        """Grava o snapshot e troca-o pelo anterior."""
+        self.gravar()
+        self.trocar()
+
+    def descartar(self):
+        """Abandona a construção sem tocar no snapshot existente."""
+        shutil.rmtree(self.temporario, ignore_errors=True)
+
+
+class Snapshot:
+    """
+    Leitura de um snapshot. Os arrays de cada campo só são abertos (por memory-map) quando
+    o campo é usado, e cada texto só é descodificado quando é lido.
+    """
+
+    def __init__(self, diretorio):
+        self.diretorio = diretorio
+        with open(os.path.join(diretorio, ARQUIVO_ESQUEMA), 'r', encoding='utf-8') as f:
+            esquema = json.load(f)
+        if esquema.get('versao') != VERSAO:
+            raise ValueError(f"Versão de snapshot não suportada em {diretorio}: {esquema.get('versao')}")
+        self.total = esquema['total']
+        self.campos = {campo['nome']: campo for campo in esquema['campos']}
+        self._arrays = {}
+        self._textos_lidos = {}
+        self._bytes_textos = self._inicio_textos = None
+
+    def __len__(self):
+        return self.total
+
+    def array(self, nome):
+        """Array '<nome>.npy' do snapshot (ex.: 'drug_interactions.inicio'), aberto por memory-map."""
+        valores = self._arrays.get(nome)
+        if valores is None:
+            valores = self._arrays[nome] = np.load(os.path.join(self.diretorio, f"{nome}.npy"), mmap_mode='r')
+        return valores
+
+    def texto(self, texto_id):
+        """Texto com o id indicado (None para os ids negativos)."""
+        if texto_id < 0:
+            return None
+        texto = self._textos_lidos.get(texto_id)
+        if texto is None:
+            if self._bytes_textos is None:
+                self._bytes_textos = memoryview(self.array('_textos'))
+                self._inicio_textos = self.array('_textos.inicio').tolist()
+            inicio = self._inicio_textos
+            texto = str(self._bytes_textos[inicio[texto_id]:inicio[texto_id + 1]], 'utf-8')
+            self._textos_lidos[texto_id] = texto
+        return texto
+
+    def textos(self, ids):
+        return [self.texto(texto_id) for texto_id in ids.tolist()]
+
+    def coluna(self, campo):
+        """Valores de um campo de texto para todos os registros (None quando nulo ou ausente)."""
+        return self.textos(self.array(campo))
+
+    def contagens(self, campo):
+        """Número de itens de um campo de lista em cada registro (sem descodificar nenhum texto)."""
+        return np.diff(self.array(f"{campo}.inicio"))
+
+    def _dicionario(self, nome, subcampos, linha):
+        resultado = {}
+        for subcampo in subcampos:
+            texto_id = int(self.array(f"{nome}.{subcampo}")[linha])
+            if texto_id != AUSENTE:
+                resultado[subcampo] = self.texto(texto_id)
+        return resultado
+
+    def valor(self, campo, linha):
+        """Valor de um campo num registro, como no dataset; levanta KeyError se a chave não existir."""
+        info = self.campos[campo]
+        estado = int(self.array(f"{campo}.estado")[linha])
+        if estado == AUSENTE:
+            raise KeyError(campo)
+        if estado == NULO:
+            return None
+        if info['tipo'] == 'texto':
+            return self.texto(int(self.array(campo)[linha]))
+        if info['tipo'] == 'registro':
+            return self._dicionario(campo, info.get('subcampos', []), linha)
+
+        inicio = self.array(f"{campo}.inicio")
+        primeiro, fim = int(inicio[linha]), int(inicio[linha + 1])
+        if info.get('itens') == 'texto':
+            return self.textos(self.array(campo)[primeiro:fim])
+        return [self._dicionario(campo, info.get('subcampos', []), item) for item in range(primeiro, fim)]
+
+    def registro(self, linha, campos=None):
+        """Registro `linha` como dicionário, só com os `campos` indicados (todos se None)."""
+        resultado = {}
+        for campo in (self.campos if campos is None else campos):
+            if campo not in self.campos:
+                continue
+            try:
+                resultado[campo] = self.valor(campo, linha)
+            except KeyError:
+                pass
+        return resultado
+
+    def _leitor(self, campo):
+        """(estados, função linha -> valor) de um campo, com os arrays já convertidos em listas
+        Python: ler registros em sequência assim evita indexar o memory-map valor a valor."""
+        info = self.campos[campo]
+        estados = self.array(f"{campo}.estado").tolist()
+        texto = self.texto
+        if info['tipo'] is None:
+            # Campo sempre None ou ausente: não tem arrays de dados, só os estados
+            return estados, lambda linha: None
+        if info['tipo'] == 'texto':
+            ids = self.array(campo).tolist()
+            return estados, lambda linha: texto(ids[linha])
+
+        subcampos = [(subcampo, self.array(f"{campo}.{subcampo}").tolist()) for subcampo in info.get('subcampos', [])]
+
+        def dicionario(i):
+            return {subcampo: texto(ids[i]) for subcampo, ids in subcampos if ids[i] != AUSENTE}
+
+        if info['tipo'] == 'registro':
+            return estados, dicionario
+        inicio = self.array(f"{campo}.inicio").tolist()
+        if info.get('itens') == 'texto':
+            itens = self.array(campo).tolist()
+            return estados, lambda linha: [texto(i) for i in itens[inicio[linha]:inicio[linha + 1]]]
+        return estados, lambda linha: [dicionario(i) for i in range(inicio[linha], inicio[linha + 1])]
+
+    def registros(self, campos=None):
+        """Gera todos os registros, pela ordem original, só com os `campos` indicados."""
+        leitores = [(campo, self._leitor(campo))
+                    for campo in (self.campos if campos is None else campos) if campo in self.campos]
+        for linha in range(self.total):
+            registro = {}
+            for campo, (estados, ler) in leitores:
+                estado = estados[linha]
+                if estado != AUSENTE:
+                    registro[campo] = None if estado == NULO else ler(linha)
+            yield registro
+
+
+def e_snapshot(caminho):
+    return caminho != '-' and os.path.isfile(os.path.join(caminho, ARQUIVO_ESQUEMA))
+
+
+def ler_dataset(caminho, campos=None):
+    """
+    Gera os registros do dataset a partir de um snapshot (diretório) ou de um arquivo JSON
+    Lines. Com um snapshot só são lidos os `campos` indicados.
+    """
+    if e_snapshot(caminho):
+        yield from Snapshot(caminho).registros(campos)
+        return
+    for registro in ler_registros(caminho):
+        yield registro if campos is None else {campo: registro[campo] for campo in campos if campo in registro}
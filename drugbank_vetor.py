@@ -1,105 +1,324 @@
+import argparse
+import hashlib
 import json
 import os
-import chromadb 
-from sentence_transformers import SentenceTransformer
+import sys
+import time
 
+import configuracao
+from divisor_chunks import dividir_chunks, max_tokens_do_modelo
+from drugbank_jsonl import ler_registros
+from indice_bm25 import EscritorBM25
+from rag_cache import escrever_versao_indice, ler_versao_indice
+from vetor_npy import exportar_colecao, info_exportacao
 
-# Caminho para o arquivo JSON contendo os chunks (gerado na etapa anterior)
-chunks_file_path = 'antibiotics_chunks.json'
+
+# Caminho para o arquivo JSON Lines contendo os chunks (gerado na etapa anterior; '-' para stdin)
+chunks_file_path = configuracao.chunks_path
 
 # Nome da coleção no ChromaDB onde os chunks serão armazenados
 chroma_collection_name = 'drugbank_antibiotics'
 
 # Caminho para o diretório onde o ChromaDB vai armazenar os dados
-chroma_db_path = './chroma_db'
+chroma_db_path = configuracao.chroma_db_path
+
+# Modelo de embedding (um bom equilíbrio entre tamanho e desempenho)
+embedding_model_name = 'sentence-transformers/all-MiniLM-L6-v2'
+
+# Número de chunks codificados por cada forward pass do modelo
+encode_batch_size = 64
+
+# Número de chunks lidos, ordenados e enviados ao ChromaDB de cada vez (collection.upsert)
+batch_size = 1024
+
+# 'incremental' só reindexa chunks novos/alterados; 'completo' reconstrói a coleção inteira
+modo_indexacao = 'incremental'
+
+# Sufixos da coleção temporária usada na reconstrução completa e da coleção antiga, que é
+# posta de lado durante a troca e só apagada depois de a nova assumir o nome
+sufixo_reconstrucao = '_rebuild'
+sufixo_antiga = '_old'
+
+# Divide os chunks maiores que a sequência máxima do modelo em partes sobrepostas
+# '{chunk_id}#n' (ver divisor_chunks.py), em vez de deixar o modelo truncá-los
+dividir_chunks_longos = True
+
+# Índice BM25 construído sobre os mesmos chunks, dentro de chroma_db_path (None = não construir)
+bm25_file = 'bm25.sqlite'
+
+# Exportação opcional da coleção para o backend .npy de vetor_npy.py, dentro de chroma_db_path
+# ('float32', 'int8' ou None = não exportar). Um índice .npy já exportado é sempre refeito
+# (com o mesmo dtype) quando a coleção muda, para o backend 'npy' não servir vetores antigos
+exportar_npy = None
+vetor_npy_dir = 'vetores_npy'
+
+
+def metadados_do_chunk(chunk):
+    """Metadados do chunk como o ChromaDB os guarda (sem 'content', 'chunk_id' nem valores None)."""
+    return {k: v for k, v in chunk.items() if k not in ['content', 'chunk_id', 'content_hash'] and v is not None}
+
+
+def calcular_hash(chunk):
+    """Hash do conteúdo e dos metadados de um chunk, usado para detetar alterações entre indexações."""
+    payload = json.dumps([chunk['content'], metadados_do_chunk(chunk)], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def filtrar_chunks(chunks):
+    """Gera apenas os chunks com conteúdo e 'chunk_id'."""
+    for chunk in chunks:
+        chunk_content = chunk.get('content', '')
+        if not chunk_content.strip(): # Pula chunks vazios
+            continue
+
+        if not chunk.get('chunk_id'):
+            print(f"Aviso: Chunk sem 'chunk_id' encontrado. Pulando este chunk. Conteúdo: {chunk_content[:50]}...")
+            continue
+
+        yield chunk
+
+
+def janelas_ordenadas(chunks):
+    """Agrupa o stream de chunks em janelas de batch_size, cada uma ordenada pelo tamanho do conteúdo."""
+    janela = []
+    for chunk in chunks:
+        janela.append(chunk)
+        if len(janela) == batch_size:
+            # Ordenar por tamanho agrupa textos de comprimento semelhante no mesmo batch,
+            # reduzindo o padding desperdiçado em cada forward pass do modelo.
+            janela.sort(key=lambda c: len(c['content']))
+            yield janela
+            janela = []
+    if janela:
+        janela.sort(key=lambda c: len(c['content']))
+        yield janela
+
+
+def indexar_chunks(collection, embedding_model, chunks, selecionar=None):
+    """Gera embeddings em batches e faz upsert no ChromaDB, janela a janela.
+
+    `selecionar`, se indicado, recebe cada janela e devolve os chunks que devem de facto
+    ser embedados. Devolve o número de chunks indexados.
+    """
+    total = 0
+    inicio = time.perf_counter()
+
+    for janela in janelas_ordenadas(filtrar_chunks(chunks)):
+        batch = selecionar(janela) if selecionar else janela
+        if not batch:
+            continue
+        documents = [chunk['content'] for chunk in batch]
+
+        # Um único encode por batch; o resultado é um array float32 (n, dim)
+        # que o ChromaDB aceita diretamente, sem conversão vetor a vetor.
+        embeddings = embedding_model.encode(
+            documents,
+            batch_size=encode_batch_size,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+        )
+
+        # IMPORTANTE: Filtramos valores None dos metadados, pois ChromaDB não os permite.
+        # O hash do chunk fica nos metadados para a próxima indexação incremental.
+        metadatas = [dict(metadados_do_chunk(chunk), content_hash=calcular_hash(chunk)) for chunk in batch]
+        ids = [chunk['chunk_id'] for chunk in batch]
+
+        collection.upsert(
+            embeddings=embeddings,
+            documents=documents,
+            metadatas=metadatas,
+            ids=ids
+        )
+
+        total += len(batch)
+        decorrido = time.perf_counter() - inicio
+        print(f"Indexados {total} chunks ({total / decorrido:.1f} chunks/s)")
+
+    decorrido = time.perf_counter() - inicio
+    if total:
+        print(f"Embedding e indexação de {total} chunks em {decorrido:.1f}s ({total / decorrido:.1f} chunks/s)")
+    return total
+
+
+def ids_existentes(collection):
+    """Devolve os ids de todos os chunks já presentes na coleção."""
+    ids = []
+    offset = 0
+    while True:
+        pagina = collection.get(include=[], limit=batch_size, offset=offset)
+        if not pagina['ids']:
+            break
+        ids.extend(pagina['ids'])
+        offset += len(pagina['ids'])
+    return ids
+
 
-print(f"Lendo chunks do arquivo: {chunks_file_path}")
+def indexacao_incremental(client, embedding_model, chunks):
+    """Atualiza a coleção no lugar: embeda só chunks novos/alterados e remove os que desapareceram."""
+    collection = client.get_or_create_collection(name=chroma_collection_name)
+    print(f"Coleção '{chroma_collection_name}' contém {collection.count()} chunks antes da atualização.")
 
-if not os.path.exists(chunks_file_path):
-    print(f"Erro: Arquivo de chunks não encontrado em {chunks_file_path}")
-else:
+    ids_vistos = set()
+    contagem = {'inalterados': 0}
+
+    def selecionar_alterados(janela):
+        ids = [chunk['chunk_id'] for chunk in janela]
+        ids_vistos.update(ids)
+        existentes = collection.get(ids=ids, include=['metadatas'])
+        hashes = {
+            chunk_id: (metadata or {}).get('content_hash')
+            for chunk_id, metadata in zip(existentes['ids'], existentes['metadatas'])
+        }
+        alterados = [chunk for chunk in janela if hashes.get(chunk['chunk_id']) != calcular_hash(chunk)]
+        contagem['inalterados'] += len(janela) - len(alterados)
+        return alterados
+
+    alterados = indexar_chunks(collection, embedding_model, chunks, selecionar=selecionar_alterados)
+
+    removidos = [chunk_id for chunk_id in ids_existentes(collection) if chunk_id not in ids_vistos]
+    for start in range(0, len(removidos), batch_size):
+        collection.delete(ids=removidos[start:start + batch_size])
+
+    print(f"Chunks novos ou alterados: {alterados} | inalterados: {contagem['inalterados']} | removidos: {len(removidos)}")
+    if alterados or removidos:
+        # Invalida as caches que dependem do conteúdo indexado (ex.: respostas do LLM)
+        escrever_versao_indice(chroma_db_path)
+    return collection
+
+
+def reconstrucao_completa(client, embedding_model, chunks):
+    """Reconstrói a coleção numa coleção temporária e só no fim a troca pela coleção ativa.
+
+    Assim a coleção em uso nunca fica vazia enquanto os embeddings estão a ser gerados.
+    """
+    nome_temporario = chroma_collection_name + sufixo_reconstrucao
+    nome_antiga = chroma_collection_name + sufixo_antiga
+    try:
+        client.delete_collection(name=nome_temporario)
+        print(f"Coleção temporária '{nome_temporario}' de uma execução anterior foi excluída.")
+    except Exception:
+        pass  # Normal: a coleção temporária não existe
+    _recuperar_colecao_antiga(client, nome_antiga)
+
+    print(f"Criando coleção temporária no ChromaDB: {nome_temporario}")
+    collection = client.create_collection(name=nome_temporario)
+    indexar_chunks(collection, embedding_model, chunks)
+
+    # Troca: a coleção antiga é posta de lado (renomeada), a nova assume o seu nome e só
+    # então a antiga é apagada; em nenhum momento deixa de existir uma das duas
+    try:
+        antiga = client.get_collection(name=chroma_collection_name)
+    except Exception:
+        antiga = None  # Normal na primeira execução: a coleção ainda não existe
+    if antiga is not None:
+        antiga.modify(name=nome_antiga)
+    collection.modify(name=chroma_collection_name)
+    escrever_versao_indice(chroma_db_path)
+    if antiga is not None:
+        client.delete_collection(name=nome_antiga)
+        print(f"Coleção '{chroma_collection_name}' antiga foi excluída.")
+    return collection
+
+
+def _recuperar_colecao_antiga(client, nome_antiga):
+    """Trata a coleção antiga deixada por uma troca interrompida: repõe-na se a ativa não
+    existir, senão apaga-a."""
+    try:
+        antiga = client.get_collection(name=nome_antiga)
+    except Exception:
+        return  # Normal: nenhuma troca foi interrompida
     try:
-        # Carregar os chunks do arquivo JSON
-        with open(chunks_file_path, 'r', encoding='utf-8') as f:
-            all_chunks = json.load(f)
+        client.get_collection(name=chroma_collection_name)
+    except Exception:
+        antiga.modify(name=chroma_collection_name)
+        print(f"Coleção '{chroma_collection_name}' reposta a partir de '{nome_antiga}' (troca interrompida).")
+        return
+    client.delete_collection(name=nome_antiga)
+    print(f"Coleção '{nome_antiga}' de uma troca anterior foi excluída.")
+
+
+def main(argv=None):
+    global encode_batch_size, batch_size, modo_indexacao, exportar_npy, chroma_db_path
 
-        print(f"Arquivo de chunks lido com sucesso. Total de chunks: {len(all_chunks)}")
+    parser = argparse.ArgumentParser(description="Gera embeddings dos chunks e indexa-os no ChromaDB.")
+    parser.add_argument('--input', default=chunks_file_path,
+                        help="Arquivo JSON Lines de chunks ('-' para stdin).")
+    parser.add_argument('--chroma-db', default=chroma_db_path,
+                        help="Diretório do ChromaDB (variável de ambiente CHROMA_DB_PATH).")
+    parser.add_argument('--encode-batch-size', type=int, default=encode_batch_size,
+                        help="Número de chunks por forward pass do modelo de embedding.")
+    parser.add_argument('--batch-size', type=int, default=batch_size,
+                        help="Número de chunks por janela ordenada e por chamada a collection.upsert.")
+    parser.add_argument('--modo', choices=['incremental', 'completo'], default=modo_indexacao,
+                        help="'incremental' só reindexa chunks novos/alterados; 'completo' reconstrói a coleção.")
+    parser.add_argument('--exportar-npy', choices=['float32', 'int8'], default=exportar_npy,
+                        help="Exporta também a coleção para o backend .npy (busca exata sem ChromaDB).")
+    args = parser.parse_args(argv)
+    encode_batch_size = args.encode_batch_size
+    batch_size = args.batch_size
+    modo_indexacao = args.modo
+    exportar_npy = args.exportar_npy
+    chroma_db_path = args.chroma_db
+
+    print(f"Lendo chunks do arquivo: {args.input}")
+
+    if args.input != '-' and not os.path.exists(args.input):
+        print(f"Erro: Arquivo de chunks não encontrado em {args.input}")
+        return 1
+
+    try:
+        # Importados só aqui: carregar o ChromaDB e o PyTorch demora vários segundos
+        import chromadb
+        from sentence_transformers import SentenceTransformer
+
+        # Os chunks são lidos em streaming e indexados janela a janela
+        chunks = filtrar_chunks(ler_registros(args.input))
 
         # --- Configurar ChromaDB ---
+        os.makedirs(chroma_db_path, exist_ok=True)
         # Criar um cliente ChromaDB
         client = chromadb.PersistentClient(path=chroma_db_path)
 
-        # Antes de obter/criar a coleção, exclua-a se ela já existe.
-        # Isso garante que você sempre comece com uma coleção vazia e fresca
-        # para refletir as últimas alterações no arquivo de chunks.
-        print(f"Verificando e excluindo coleção existente (se houver): '{chroma_collection_name}'")
-        try:
-            client.delete_collection(name=chroma_collection_name)
-            print(f"Coleção '{chroma_collection_name}' existente foi excluída com sucesso.")
-        except Exception as e:
-            # Esta exceção ocorrerá se a coleção não existir, o que é normal na primeira execução
-            print(f"Coleção '{chroma_collection_name}' não existia ou erro ao excluir (ignorado para criação): {e}")
-
-        # Agora, crie a coleção (ela será nova ou recém-excluída)
-        print(f"Criando nova coleção no ChromaDB: {chroma_collection_name}")
-        collection = client.create_collection(name=chroma_collection_name)
-
         # --- Carregar o Modelo de Embedding ---
-        # Um bom modelo para começar, equilibrando tamanho e desempenho
-        print("Carregando modelo de embedding (sentence-transformers/all-MiniLM-L6-v2)...")
-        embedding_model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
+        print(f"Carregando modelo de embedding ({embedding_model_name})...")
+        embedding_model = SentenceTransformer(embedding_model_name)
         print("Modelo de embedding carregado.")
 
-        # --- Gerar Embeddings e Adicionar ao ChromaDB ---
-        print("Gerando embeddings e adicionando chunks ao ChromaDB...")
-
-        # Listas para armazenar dados em batch 
-        batch_size = 100 # Número de chunks para processar por vez
-        documents = []
-        metadatas = []
-        ids = [] # Agora vamos usar o 'chunk_id' do JSON
-        embeddings = [] # Lista para armazenar os vetores
-
-        for i, chunk in enumerate(all_chunks):
-            chunk_content = chunk.get('content', '')
-            if not chunk_content.strip(): # Pula chunks vazios
-                continue
-
-            chunk_id = chunk.get('chunk_id') # Pega o ID persistente do chunk
-            if not chunk_id:
-                print(f"Aviso: Chunk sem 'chunk_id' encontrado. Pulando este chunk. Conteúdo: {chunk_content[:50]}...")
-                continue
-
-            chunk_embedding = embedding_model.encode(chunk_content) # Gera o vetor!
-
-            # Armazenar dados do chunk para o batch
-            documents.append(chunk_content)
-
-            # Os metadados ajudam a filtrar e contextualizar os resultados da busca
-            # IMPORTANTE: Filtramos valores None dos metadados, pois ChromaDB não os permite
-            chunk_metadata = {k: v for k, v in chunk.items() if k not in ['content', 'chunk_id'] and v is not None}
-            metadatas.append(chunk_metadata)
-
-            # Adicionar o ID persistente do chunk
-            ids.append(chunk_id)
-
-            # Adicionar o embedding gerado
-            embeddings.append(chunk_embedding.tolist()) # ChromaDB espera listas de floats
-
-            # Adicionar ao ChromaDB em batches
-            if (i + 1) % batch_size == 0 or (i + 1) == len(all_chunks):
-                print(f"Adicionando batch de chunks ({len(ids)} chunks, até chunk {i+1})...")
-                collection.add(
-                    embeddings=embeddings,
-                    documents=documents,
-                    metadatas=metadatas,
-                    ids=ids
-                )
-                # Limpar as listas para o próximo batch
-                documents = []
-                metadatas = []
-                ids = []
-                embeddings = []
+        # Chunks longos são divididos antes do BM25, para os dois índices usarem os mesmos ids
+        if dividir_chunks_longos:
+            chunks = dividir_chunks(chunks, embedding_model.tokenizer, max_tokens_do_modelo(embedding_model))
+
+        # O índice BM25 é construído no mesmo passe, com todos os chunks (mesmo os inalterados)
+        escritor_bm25 = EscritorBM25(os.path.join(chroma_db_path, bm25_file)) if bm25_file else None
+        if escritor_bm25 is not None:
+            chunks = escritor_bm25.registrar(chunks)
+
+        bm25_gravado = False
+        try:
+            # --- Gerar Embeddings e Adicionar ao ChromaDB ---
+            print(f"Gerando embeddings (batches de {encode_batch_size}, modo {modo_indexacao}) e indexando chunks no ChromaDB...")
+            if modo_indexacao == 'completo':
+                collection = reconstrucao_completa(client, embedding_model, chunks)
+            else:
+                collection = indexacao_incremental(client, embedding_model, chunks)
+
+            if escritor_bm25 is not None:
+                escritor_bm25.fechar()
+                bm25_gravado = True
+                print(f"Índice BM25 com {escritor_bm25.total_docs} chunks salvo em {escritor_bm25.caminho}")
+        finally:
+            # Uma falha a meio não deixa o '.tmp' do BM25 no disco; o índice anterior fica intacto
+            if escritor_bm25 is not None and not bm25_gravado:
+                escritor_bm25.descartar()
+
+        diretorio_npy = os.path.join(chroma_db_path, vetor_npy_dir)
+        exportado = info_exportacao(diretorio_npy)
+        versao = ler_versao_indice(chroma_db_path)
+        if exportar_npy or (exportado is not None and exportado['versao'] != versao):
+            dtype_npy = exportar_npy or exportado['dtype']
+            exportados = exportar_colecao(collection, diretorio_npy, dtype=dtype_npy,
+                                          tamanho_pagina=batch_size, versao=versao)
+            print(f"Índice .npy ({dtype_npy}) com {exportados} vetores salvo em {diretorio_npy}")
 
         print("\nProcesso de embedding e indexação concluído.")
         print(f"Total de chunks indexados na coleção '{chroma_collection_name}': {collection.count()}")
@@ -107,4 +326,9 @@ else:
 
     except Exception as e:
         print(f"Ocorreu um erro durante o processo de embedding/indexação: {e}")
-        print("Verifique se as bibliotecas estão instaladas e o arquivo de chunks existe.")
\ No newline at end of file
+        print("Verifique se as bibliotecas estão instaladas e o arquivo de chunks existe.")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
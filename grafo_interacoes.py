@@ -0,0 +1,289 @@
+# grafo_interacoes.py
+# Grafo de interações em memória para verificar um regime terapêutico completo (uma
+# prescrição com várias drogas) de uma só vez, em vez de uma pergunta RAG por par.
+#
+# O grafo é construído a partir das listas drug_interactions do dataset gerado por
+# drugbank_json.py. Os DrugBank IDs são internados (ID -> inteiro) e as arestas guardadas
+# em formato CSR: os vizinhos da droga i são vizinhos[inicio[i]:inicio[i + 1]] (ordenados),
+# com o índice da descrição de cada interação em descricoes_aresta. Os alvos moleculares
+# (targets) e as enzimas CYP citadas em metabolism ficam no mesmo formato, para detetar
+# drogas do regime que partilham um alvo ou uma via de metabolização.
+#
+# verificar_regime devolve só o resultado compacto (interações e sinais partilhados), que
+# é enviado ao LLM numa única chamada para a redação da resposta.
+
+import argparse
+import itertools
+import os
+import re
+import sys
+
+import numpy as np
+
+import configuracao
+import instrumentacao
+from drugbank_snapshot import ler_dataset
+from indice_interacoes import normalizar_nome
+
+# Caminhos do dataset gerado por drugbank_json.py: o snapshot colunar é usado se existir
+snapshot_path = configuracao.snapshot_path
+dataset_path = configuracao.dataset_path
+
+# Campos do dataset usados pelo grafo (só estas colunas são lidas de um snapshot)
+CAMPOS_GRAFO = ['drugbank_id', 'name', 'synonyms', 'drug_interactions', 'targets', 'metabolism']
+
+_RE_DRUGBANK_ID = re.compile(r"^DB\d{5}$", re.IGNORECASE)
+_RE_CYP = re.compile(r"\bCYP\s?-?(\d{1,2}[A-Z]\d{0,2})\b", re.IGNORECASE)
+
+
+def enzimas_cyp(texto):
+    """Enzimas do citocromo P450 citadas num texto, normalizadas (ex.: 'CYP3A4')."""
+    return sorted({"CYP" + m.upper() for m in _RE_CYP.findall(texto or '')})
+
+
+def _csr(listas, total, colunas=1):
+    """
+    Converte {nó: [valores]} em (inicio, valores) no formato CSR, sem repetições e com os
+    valores de cada nó ordenados. Com colunas > 1 cada valor é um tuplo e `valores` uma matriz.
+    """
+    inicio = np.zeros(total + 1, dtype=np.int64)
+    for no, valores in listas.items():
+        listas[no] = sorted(set(valores))
+        inicio[no + 1] = len(listas[no])
+    np.cumsum(inicio, out=inicio)
+    valores = np.empty((inicio[-1], colunas), dtype=np.int64)
+    for no, lista in listas.items():
+        valores[inicio[no]:inicio[no + 1]] = np.asarray(lista, dtype=np.int64).reshape(-1, colunas)
+    return inicio, valores if colunas > 1 else valores[:, 0]
+
+
+class GrafoInteracoes:
+    """Grafo de interações, alvos e enzimas CYP das drogas do dataset, com IDs internados."""
+
+    def __init__(self):
+        self.ids = []          # inteiro -> DrugBank ID
+        self._indice = {}      # DrugBank ID -> inteiro
+        self.nomes = []        # inteiro -> nome da droga
+        self.nomes_normalizados = {}  # nome ou sinônimo normalizado -> inteiro
+        self.descricoes = []   # descrições das interações (índices em descricoes_aresta)
+        self.rotulos = []      # nomes dos alvos e das enzimas (índices em alvos/enzimas)
+        self._indice_rotulos = {}
+        self.inicio = self.vizinhos = self.descricoes_aresta = None
+        self.inicio_alvos = self.alvos = None
+        self.inicio_enzimas = self.enzimas = None
+
+    # --- Construção ---
+    def _internar(self, drugbank_id, nome=None):
+        no = self._indice.get(drugbank_id)
+        if no is None:
+            no = self._indice[drugbank_id] = len(self.ids)
+            self.ids.append(drugbank_id)
+            self.nomes.append(nome or drugbank_id)
+        elif nome and self.nomes[no] == drugbank_id:
+            self.nomes[no] = nome
+        if nome:
+            self.nomes_normalizados.setdefault(normalizar_nome(nome), no)
+        return no
+
+    def _rotulo(self, texto):
+        rotulo = self._indice_rotulos.get(texto)
+        if rotulo is None:
+            rotulo = self._indice_rotulos[texto] = len(self.rotulos)
+            self.rotulos.append(texto)
+        return rotulo
+
+    @classmethod
+    def construir(cls, drugs):
+        """Constrói o grafo a partir de um iterável de registros do dataset (um por droga)."""
+        grafo = cls()
+        arestas, alvos, enzimas = {}, {}, {}
+        for drug in drugs:
+            drugbank_id = drug.get('drugbank_id')
+            if not drugbank_id:
+                continue
+            a = grafo._internar(drugbank_id, drug.get('name'))
+            for synonym in drug.get('synonyms') or []:
+                grafo.nomes_normalizados.setdefault(normalizar_nome(synonym), a)
+
+            for interaction in drug.get('drug_interactions') or []:
+                outro_id = interaction.get('drugbank_id')
+                if not outro_id or outro_id == drugbank_id:
+                    continue
+                b = grafo._internar(outro_id, interaction.get('name'))
+                descricao = len(grafo.descricoes)
+                grafo.descricoes.append((interaction.get('description') or '').strip())
+                # Arestas nos dois sentidos: a interação é encontrada a partir de qualquer das drogas
+                arestas.setdefault(a, []).append((b, descricao))
+                arestas.setdefault(b, []).append((a, descricao))
+
+            for target in drug.get('targets') or []:
+                chave = target.get('uniprot_id') or target.get('name')
+                if chave:
+                    rotulo = grafo._rotulo(target.get('name') or chave)
+                    alvos.setdefault(a, []).append(rotulo)
+            for enzima in enzimas_cyp(drug.get('metabolism')):
+                enzimas.setdefault(a, []).append(grafo._rotulo(enzima))
+
+        total = len(grafo.ids)
+        grafo.inicio, pares = _csr(arestas, total, colunas=2)
+        grafo.vizinhos, grafo.descricoes_aresta = pares[:, 0], pares[:, 1]
+        grafo.inicio_alvos, grafo.alvos = _csr(alvos, total)
+        grafo.inicio_enzimas, grafo.enzimas = _csr(enzimas, total)
+        return grafo
+
+    @classmethod
+    def de_arquivo(cls, caminho):
+        """Constrói o grafo a partir de um snapshot ou de um arquivo JSON Lines do dataset ('-' para stdin)."""
+        return cls.construir(ler_dataset(caminho, CAMPOS_GRAFO))
+
+    @property
+    def total_interacoes(self):
+        """Número de interações registadas (cada uma tem uma aresta em cada sentido)."""
+        return len(self.descricoes)
+
+    # --- Consulta ---
+    def resolver(self, medicamento):
+        """Inteiro interno de uma droga indicada pelo DrugBank ID, nome ou sinônimo (None se desconhecida)."""
+        medicamento = medicamento.strip()
+        if _RE_DRUGBANK_ID.match(medicamento):
+            return self._indice.get(medicamento.upper())
+        return self.nomes_normalizados.get(normalizar_nome(medicamento))
+
+    def _partilhados(self, inicio, valores, nos):
+        """[(a, b, [rótulos])] para os pares de `nos` com valores em comum no CSR indicado."""
+        conjuntos = {no: set(valores[inicio[no]:inicio[no + 1]].tolist()) for no in nos}
+        resultado = []
+        for a, b in itertools.combinations(nos, 2):
+            comuns = conjuntos[a] & conjuntos[b]
+            if comuns:
+                resultado.append((self.ids[a], self.ids[b], sorted(self.rotulos[r] for r in comuns)))
+        return resultado
+
+    def verificar_regime(self, medicamentos):
+        """
+        Verifica todas as combinações de um regime num só passe sobre o grafo. Para cada droga
+        só são percorridos os seus vizinhos, filtrados pelas restantes drogas do regime.
+        Devolve um dicionário com 'medicamentos' [(id, nome)], 'nao_encontrados',
+        'interacoes' [(id_a, id_b, descrição)], 'alvos_partilhados' e 'metabolismo_partilhado'
+        [(id_a, id_b, [alvos/enzimas])].
+        """
+        nos, nao_encontrados = [], []
+        for medicamento in medicamentos:
+            no = self.resolver(medicamento)
+            if no is None:
+                nao_encontrados.append(medicamento)
+            elif no not in nos:
+                nos.append(no)
+
+        regime = np.asarray(nos, dtype=np.int64)
+        interacoes = []
+        pares_vistos = set()
+        for no in nos:
+            vizinhos = self.vizinhos[self.inicio[no]:self.inicio[no + 1]]
+            descricoes = self.descricoes_aresta[self.inicio[no]:self.inicio[no + 1]]
+            mascara = np.isin(vizinhos, regime)
+            for outro, descricao in zip(vizinhos[mascara].tolist(), descricoes[mascara].tolist()):
+                # A mesma interação aparece nos dois sentidos (na lista de cada droga, com
+                # descrições equivalentes): cada par do regime é reportado uma só vez
+                par = frozenset((no, outro))
+                if par in pares_vistos:
+                    continue
+                pares_vistos.add(par)
+                interacoes.append((self.ids[no], self.ids[outro], self.descricoes[descricao]))
+
+        return {
+            'medicamentos': [(self.ids[no], self.nomes[no]) for no in nos],
+            'nao_encontrados': nao_encontrados,
+            'interacoes': interacoes,
+            'alvos_partilhados': self._partilhados(self.inicio_alvos, self.alvos, nos),
+            'metabolismo_partilhado': self._partilhados(self.inicio_enzimas, self.enzimas, nos),
+        }
+
+    def formatar_resultado(self, resultado):
+        """Texto compacto do resultado de verificar_regime, usado como contexto do LLM."""
+        nome = dict(resultado['medicamentos'])
+        linhas = ["Regime: " + ", ".join(f"{n} ({i})" for i, n in resultado['medicamentos'])]
+        if resultado['nao_encontrados']:
+            linhas.append("Sem dados no dataset: " + ", ".join(resultado['nao_encontrados']))
+        linhas.append(f"Interações medicamentosas ({len(resultado['interacoes'])}):")
+        for id_a, id_b, descricao in resultado['interacoes']:
+            linhas.append(f"- {nome[id_a]} + {nome[id_b]}: {descricao or 'interação registada sem descrição.'}")
+        if resultado['alvos_partilhados']:
+            linhas.append("Alvos moleculares partilhados:")
+            for id_a, id_b, alvos in resultado['alvos_partilhados']:
+                linhas.append(f"- {nome[id_a]} + {nome[id_b]}: {', '.join(alvos)}")
+        if resultado['metabolismo_partilhado']:
+            linhas.append("Metabolização pelas mesmas enzimas CYP:")
+            for id_a, id_b, enzimas in resultado['metabolismo_partilhado']:
+                linhas.append(f"- {nome[id_a]} + {nome[id_b]}: {', '.join(enzimas)}")
+        return "\n".join(linhas)
+
+
+def regime_com_ollama_stream(grafo, medicamentos, metricas=None):
+    """
+    Verifica o regime no grafo e gera, numa única chamada ao LLM, a resposta sobre todas as
+    suas interações. Usa o mesmo modelo e a mesma mensagem de sistema do RAG (prefixo da
+    KV-cache partilhado). Se `metricas` for um dicionário, recebe também 'resultado_regime'.
+    """
+    import ollama_cliente
+    import ollama_rag
+
+    with instrumentacao.etapa('grafo_regime', n=len(medicamentos)):
+        resultado = grafo.verificar_regime(medicamentos)
+    if metricas is not None:
+        metricas['resultado_regime'] = resultado
+    if len(resultado['medicamentos']) < 2:
+        yield ollama_rag.resposta_sem_contexto
+        return
+
+    pergunta = "Quais as interações e os riscos de usar em conjunto: " + ", ".join(n for _, n in resultado['medicamentos']) + "?"
+    user_prompt = f"Contexto:\n{grafo.formatar_resultado(resultado)}\n\nPergunta do Médico: {pergunta}\n\nResposta:"
+    mensagens = ollama_cliente.mensagens_chat(ollama_rag.system_prompt_rag, user_prompt)
+    yield from ollama_cliente.chat_stream(ollama_rag.llm_model_name, mensagens, metricas)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Verifica as interações de um regime com várias drogas.")
+    parser.add_argument('medicamentos', nargs='+',
+                        help="Drogas do regime (DrugBank ID, nome ou sinônimo).")
+    parser.add_argument('--input', default=snapshot_path if os.path.isdir(snapshot_path) else dataset_path,
+                        help="Snapshot ou arquivo JSON Lines do dataset gerado por drugbank_json.py.")
+    parser.add_argument('--sem-llm', action='store_true',
+                        help="Mostra só o resultado do grafo, sem pedir a redação ao LLM.")
+    args = parser.parse_args(argv)
+
+    instrumentacao.configurar_logging()
+    if args.input != '-' and not os.path.exists(args.input):
+        print(f"Erro: Dataset não encontrado em {args.input}", file=sys.stderr)
+        return 1
+    try:
+        with instrumentacao.etapa('grafo_construcao'):
+            grafo = GrafoInteracoes.de_arquivo(args.input)
+    except Exception as e:
+        print(f"Ocorreu um erro ao construir o grafo a partir de {args.input}: {e}", file=sys.stderr)
+        return 1
+    print(f"Grafo com {len(grafo.ids)} drogas e {grafo.total_interacoes} interações carregado de {args.input}")
+
+    if args.sem_llm:
+        print(grafo.formatar_resultado(grafo.verificar_regime(args.medicamentos)))
+        return
+
+    import ollama_cliente
+    metricas = {}
+    try:
+        for i, token in enumerate(regime_com_ollama_stream(grafo, args.medicamentos, metricas)):
+            if i == 0:
+                print("\n--- Resposta do LLM (regime) ---")
+            print(token, end="", flush=True)
+    except Exception as e:
+        print()
+        print(f"Erro ao chamar o Ollama: {e}", file=sys.stderr)
+        print("Verifique se o Ollama está rodando e se o modelo especificado está disponível.", file=sys.stderr)
+        return 1
+    print()
+    if metricas.get('total_s') is not None:
+        print(ollama_cliente.formatar_metricas(metricas))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
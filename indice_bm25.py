@@ -0,0 +1,151 @@
+# indice_bm25.py
+# Índice invertido (BM25) sobre os mesmos chunks da coleção do ChromaDB, construído por
+# drugbank_vetor.py e guardado ao lado dela. Complementa a busca densa em tokens exatos
+# que o all-MiniLM-L6-v2 representa mal: IDs DrugBank (DB00537), IDs UniProt, números CAS
+# e nomes comerciais dos chunks 'products' e 'external_identifiers'.
+#
+# Tabelas do SQLite:
+#   docs(doc, chunk_id, comprimento)     um documento por chunk
+#   termos(termo, df)                    frequência documental de cada termo
+#   postings(termo, doc, tf)             frequência do termo em cada documento
+#   meta(chave, valor)                   número de documentos e comprimento médio
+
+import collections
+import math
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+
+# Parâmetros do BM25
+k1 = 1.2
+b = 0.75
+
+# Tokens alfanuméricos, mantendo juntos IDs como 'db00537', '61-33-6' ou '1.2.3'
+_RE_TOKEN = re.compile(r"[a-z0-9]+(?:[\-.][a-z0-9]+)*")
+
+# Palavras muito frequentes (português e inglês) ignoradas nas perguntas
+STOPWORDS = frozenset("""
+a o e é de da do das dos em no na nos nas um uma uns umas com por para que qual quais
+se ao aos à às ou como mais entre sobre sua seu suas seus ele ela há ser the of and or
+in on to for with is are what which does do an by from as at be this that
+""".split())
+
+
+def tokenizar(texto):
+    """Tokens normalizados (sem acentos, casefold) de um texto."""
+    texto = unicodedata.normalize('NFKD', texto)
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return _RE_TOKEN.findall(texto.casefold())
+
+
+class EscritorBM25:
+    """Constrói o índice BM25 a partir do stream de chunks."""
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        # Escreve num arquivo temporário e só substitui o índice anterior em fechar()
+        self._temporario = caminho + '.tmp'
+        if os.path.exists(self._temporario):
+            os.remove(self._temporario)
+        self._db = sqlite3.connect(self._temporario)
+        self._db.executescript(
+            "PRAGMA journal_mode = OFF;"
+            "PRAGMA synchronous = OFF;"
+            "CREATE TABLE docs (doc INTEGER PRIMARY KEY, chunk_id TEXT NOT NULL, comprimento INTEGER NOT NULL);"
+            "CREATE TABLE postings (termo TEXT NOT NULL, doc INTEGER NOT NULL, tf INTEGER NOT NULL);"
+            "CREATE TABLE meta (chave TEXT PRIMARY KEY, valor REAL NOT NULL);"
+        )
+        self.total_docs = 0
+        self._total_tokens = 0
+
+    def adicionar(self, chunk_id, conteudo):
+        """Indexa o conteúdo de um chunk."""
+        tokens = tokenizar(conteudo)
+        doc = self.total_docs
+        self._db.execute("INSERT INTO docs VALUES (?, ?, ?)", (doc, chunk_id, len(tokens)))
+        self._db.executemany("INSERT INTO postings VALUES (?, ?, ?)",
+                             ((termo, doc, tf) for termo, tf in collections.Counter(tokens).items()))
+        self.total_docs += 1
+        self._total_tokens += len(tokens)
+
+    def registrar(self, chunks):
+        """Indexa cada chunk do stream à medida que passa e volta a gerá-lo, sem o reter."""
+        for chunk in chunks:
+            self.adicionar(chunk['chunk_id'], chunk['content'])
+            yield chunk
+
+    def fechar(self):
+        """Cria os índices do SQLite, grava as estatísticas e substitui atomicamente a versão anterior."""
+        media = self._total_tokens / self.total_docs if self.total_docs else 0.0
+        self._db.executemany("INSERT INTO meta VALUES (?, ?)",
+                             [('total_docs', self.total_docs), ('comprimento_medio', media)])
+        self._db.executescript(
+            "CREATE INDEX idx_postings ON postings (termo, doc, tf);"
+            "CREATE TABLE termos AS SELECT termo, COUNT(*) AS df FROM postings GROUP BY termo;"
+            "CREATE UNIQUE INDEX idx_termos ON termos (termo);"
+        )
+        self._db.commit()
+        self._db.close()
+        os.replace(self._temporario, self.caminho)
+
+    def descartar(self):
+        """Abandona a construção sem tocar no índice existente."""
+        self._db.close()
+        if os.path.exists(self._temporario):
+            os.remove(self._temporario)
+
+
+class IndiceBM25:
+    """Consulta BM25 sobre o índice gravado por EscritorBM25."""
+
+    def __init__(self, caminho):
+        self._db = sqlite3.connect(f"file:{caminho}?mode=ro", uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+        meta = dict(self._db.execute("SELECT chave, valor FROM meta"))
+        self.total_docs = int(meta.get('total_docs', 0))
+        self.comprimento_medio = meta.get('comprimento_medio', 0.0) or 1.0
+
+    def buscar(self, texto, n_results=10):
+        """Devolve os n_results chunks com maior pontuação BM25: [(chunk_id, pontuação)]."""
+        termos = [t for t in dict.fromkeys(tokenizar(texto)) if t not in STOPWORDS]
+        if not termos or not self.total_docs:
+            return []
+
+        pontuacoes = collections.defaultdict(float)
+        with self._lock:
+            for termo in termos:
+                linha = self._db.execute("SELECT df FROM termos WHERE termo = ?", (termo,)).fetchone()
+                if linha is None:
+                    continue
+                df = linha[0]
+                idf = math.log(1 + (self.total_docs - df + 0.5) / (df + 0.5))
+                for doc, tf, comprimento in self._db.execute(
+                        "SELECT p.doc, p.tf, d.comprimento FROM postings p JOIN docs d ON d.doc = p.doc"
+                        " WHERE p.termo = ?", (termo,)):
+                    norma = k1 * (1 - b + b * comprimento / self.comprimento_medio)
+                    pontuacoes[doc] += idf * tf * (k1 + 1) / (tf + norma)
+
+            melhores = sorted(pontuacoes.items(), key=lambda item: item[1], reverse=True)[:n_results]
+            if not melhores:
+                return []
+            ids = dict(self._db.execute(
+                f"SELECT doc, chunk_id FROM docs WHERE doc IN ({','.join('?' * len(melhores))})",
+                [doc for doc, _ in melhores]))
+        return [(ids[doc], pontuacao) for doc, pontuacao in melhores]
+
+    def fechar(self):
+        self._db.close()
+
+
+def fusao_rrf(rankings, k=60):
+    """
+    Reciprocal-rank fusion: combina várias listas ordenadas de IDs numa só,
+    somando 1 / (k + posição) de cada ID em cada lista. Devolve [(id, pontuação)] ordenado.
+    """
+    pontuacoes = collections.defaultdict(float)
+    for ranking in rankings:
+        for posicao, item_id in enumerate(ranking, start=1):
+            pontuacoes[item_id] += 1.0 / (k + posicao)
+    return sorted(pontuacoes.items(), key=lambda item: item[1], reverse=True)
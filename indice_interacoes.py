@@ -0,0 +1,137 @@
+# indice_interacoes.py
+# Índice exato de interações medicamentosas por par de drogas, construído por
+# drugbank_chunks.py ao mesmo tempo que os chunks. As perguntas do tipo "a droga X
+# interage com a droga Y?" são respondidas diretamente a partir deste índice, sem
+# passar pela busca vetorial, que muitas vezes não devolve o chunk 'drug_interaction' certo.
+#
+# O índice é um SQLite compacto com duas tabelas:
+#   nomes(nome, drugbank_id)                    nome normalizado (incluindo sinônimos) -> ID
+#   pares(id_a, id_b, chunk_id, conteudo)       uma linha por chunk de interação
+# A deteção dos nomes na pergunta é feita em memória com um dicionário de n-gramas de tokens.
+
+import itertools
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+
+# Número máximo de palavras de um nome de droga considerado na deteção
+max_tokens_nome = 6
+
+_RE_TOKEN = re.compile(r"[\w\-]+")
+
+
+def normalizar_nome(texto):
+    """Normaliza um nome de droga: sem acentos, casefold e espaços colapsados."""
+    texto = unicodedata.normalize('NFKD', texto)
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return " ".join(_RE_TOKEN.findall(texto.casefold()))
+
+
+class EscritorIndicePares:
+    """Constrói o índice de pares a partir dos registros do dataset e dos seus chunks."""
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        # Escreve num arquivo temporário e só substitui o índice anterior em fechar()
+        self._temporario = caminho + '.tmp'
+        if os.path.exists(self._temporario):
+            os.remove(self._temporario)
+        self._db = sqlite3.connect(self._temporario)
+        self._db.executescript(
+            "PRAGMA journal_mode = OFF;"
+            "PRAGMA synchronous = OFF;"
+            "CREATE TABLE nomes (nome TEXT PRIMARY KEY, drugbank_id TEXT NOT NULL) WITHOUT ROWID;"
+            "CREATE TABLE pares (id_a TEXT NOT NULL, id_b TEXT NOT NULL, chunk_id TEXT NOT NULL,"
+            " conteudo TEXT NOT NULL, PRIMARY KEY (id_a, id_b, chunk_id)) WITHOUT ROWID;"
+        )
+        self.total_pares = 0
+
+    def _adicionar_nome(self, nome, drugbank_id):
+        nome = normalizar_nome(nome or '')
+        if nome and drugbank_id:
+            # O primeiro ID registado para um nome prevalece
+            self._db.execute("INSERT OR IGNORE INTO nomes VALUES (?, ?)", (nome, drugbank_id))
+
+    def adicionar(self, drug, chunks):
+        """Regista os nomes/sinônimos da droga e os seus chunks de interação medicamentosa."""
+        drugbank_id = drug.get('drugbank_id')
+        self._adicionar_nome(drug.get('name'), drugbank_id)
+        for synonym in drug.get('synonyms') or []:
+            self._adicionar_nome(synonym, drugbank_id)
+
+        for chunk in chunks:
+            if chunk.get('chunk_type') != 'drug_interaction':
+                continue
+            outro_id = chunk.get('interacting_drug_id')
+            if not drugbank_id or not outro_id:
+                continue
+            self._adicionar_nome(chunk.get('interacting_drug_name'), outro_id)
+            self._db.execute("INSERT OR REPLACE INTO pares VALUES (?, ?, ?, ?)",
+                             (drugbank_id, outro_id, chunk['chunk_id'], chunk['content']))
+            self.total_pares += 1
+
+    def fechar(self):
+        """Grava o índice e substitui atomicamente a versão anterior."""
+        self._db.commit()
+        self._db.close()
+        os.replace(self._temporario, self.caminho)
+
+    def descartar(self):
+        """Abandona o índice em construção; a versão anterior fica intacta."""
+        self._db.close()
+        if os.path.exists(self._temporario):
+            os.remove(self._temporario)
+
+
+class IndicePares:
+    """Consulta do índice de pares: deteção de drogas na pergunta e busca das interações entre elas."""
+
+    def __init__(self, caminho):
+        self._db = sqlite3.connect(f"file:{caminho}?mode=ro", uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+        # Dicionário de nomes em memória para a deteção: tupla de tokens -> drugbank_id
+        self.nomes = {}
+        for nome, drugbank_id in self._db.execute("SELECT nome, drugbank_id FROM nomes"):
+            tokens = tuple(nome.split())
+            if len(tokens) <= max_tokens_nome:
+                self.nomes[tokens] = drugbank_id
+
+    def detetar_medicamentos(self, texto):
+        """
+        Devolve os drugbank_ids dos nomes de drogas encontrados no texto, pela ordem em que aparecem.
+        Em cada posição é escolhido o nome mais longo que corresponde (ex.: 'ácido clavulânico').
+        """
+        tokens = normalizar_nome(texto).split()
+        encontrados = []
+        i = 0
+        while i < len(tokens):
+            for n in range(min(max_tokens_nome, len(tokens) - i), 0, -1):
+                drugbank_id = self.nomes.get(tuple(tokens[i:i + n]))
+                if drugbank_id is not None:
+                    if drugbank_id not in encontrados:
+                        encontrados.append(drugbank_id)
+                    i += n
+                    break
+            else:
+                i += 1
+        return encontrados
+
+    def interacoes(self, id_a, id_b):
+        """Chunks de interação entre duas drogas, em qualquer dos sentidos: [(chunk_id, id_a, id_b, conteudo)]."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT chunk_id, id_a, id_b, conteudo FROM pares"
+                " WHERE (id_a = ? AND id_b = ?) OR (id_a = ? AND id_b = ?)",
+                (id_a, id_b, id_b, id_a)).fetchall()
+
+    def interacoes_na_pergunta(self, texto):
+        """Interações entre todos os pares de drogas mencionadas no texto."""
+        resultados = []
+        for id_a, id_b in itertools.combinations(self.detetar_medicamentos(texto), 2):
+            resultados.extend(self.interacoes(id_a, id_b))
+        return resultados
+
+    def fechar(self):
+        self._db.close()
@@ -0,0 +1,279 @@
+# instrumentacao.py
+# Instrumentação das etapas do pipeline RAG (embedding, caches, recuperação, montagem do
+# prompt, avaliação do prompt e geração no LLM).
+#
+# Cada etapa medida com `etapa(nome)` entra num histograma por nome (p50/p95/p99 sobre as
+# amostras mais recentes) partilhado pelo processo. Opcionalmente, `rastrear()` grava um
+# arquivo por pedido no formato Trace Event do Chrome (abre em chrome://tracing ou
+# https://ui.perfetto.dev), com um evento por etapa na thread onde correu. As respostas
+# em streaming usam `rastrear_stream()`/`arastrear_stream()`, que só ativam o rastreio
+# enquanto o gerador corre e nunca o deixam ativo entre dois eventos.
+
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Amostras guardadas por histograma (as mais antigas são descartadas)
+max_amostras = 10000
+
+PERCENTIS = (50, 95, 99)
+
+
+class Histograma:
+    """Amostras recentes de uma duração (em segundos) e os respetivos percentis."""
+
+    def __init__(self, max_amostras=max_amostras):
+        self._amostras = np.zeros(max_amostras, dtype=np.float64)
+        self._posicao = 0
+        self.total = 0
+        self._lock = threading.Lock()
+
+    def observar(self, segundos):
+        with self._lock:
+            self._amostras[self._posicao] = segundos
+            self._posicao = (self._posicao + 1) % len(self._amostras)
+            self.total += 1
+
+    def resumo(self):
+        """{'n', 'media_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms'} das amostras guardadas."""
+        with self._lock:
+            amostras = self._amostras[:min(self.total, len(self._amostras))].copy()
+            total = self.total
+        if not len(amostras):
+            return {'n': 0}
+        resumo = {'n': total, 'media_ms': float(amostras.mean()) * 1000}
+        for percentil, valor in zip(PERCENTIS, np.percentile(amostras, PERCENTIS)):
+            resumo[f'p{percentil}_ms'] = float(valor) * 1000
+        resumo['max_ms'] = float(amostras.max()) * 1000
+        return resumo
+
+
+class RegistoMetricas:
+    """Histogramas por nome de etapa."""
+
+    def __init__(self):
+        self._histogramas = {}
+        self._lock = threading.Lock()
+
+    def observar(self, nome, segundos):
+        histograma = self._histogramas.get(nome)
+        if histograma is None:
+            with self._lock:
+                histograma = self._histogramas.setdefault(nome, Histograma())
+        histograma.observar(segundos)
+
+    def resumo(self):
+        """Resumo de todos os histogramas, pela ordem em que as etapas apareceram."""
+        with self._lock:
+            histogramas = list(self._histogramas.items())
+        return {nome: histograma.resumo() for nome, histograma in histogramas}
+
+    def formatar(self):
+        """Tabela legível dos percentis de cada etapa."""
+        linhas = [f"{'etapa':<24}{'n':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"]
+        for nome, resumo in self.resumo().items():
+            if resumo['n']:
+                linhas.append(f"{nome:<24}{resumo['n']:>8}{resumo['p50_ms']:>10.1f}{resumo['p95_ms']:>10.1f}"
+                              f"{resumo['p99_ms']:>10.1f}{resumo['max_ms']:>10.1f}")
+        return "\n".join(linhas)
+
+
+# Registo partilhado por todo o processo
+registo = RegistoMetricas()
+
+
+class Rastreio:
+    """Eventos de um pedido no formato Trace Event do Chrome."""
+
+    def __init__(self, nome):
+        self.nome = nome
+        self.id = uuid.uuid4().hex[:12]
+        self.eventos = []
+        self._lock = threading.Lock()
+
+    def adicionar(self, nome, inicio, duracao, **args):
+        """Acrescenta um evento completo ('X') com início e duração em segundos de perf_counter."""
+        evento = {
+            'name': nome,
+            'ph': 'X',
+            'ts': inicio * 1e6,
+            'dur': duracao * 1e6,
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+        }
+        if args:
+            evento['args'] = args
+        with self._lock:
+            self.eventos.append(evento)
+
+    def incorporar(self, outro, **args):
+        """Copia os eventos de outro rastreio (ex.: de um lote partilhado por vários pedidos) para este."""
+        with outro._lock:
+            eventos = [dict(evento, args={**evento.get('args', {}), **args}) for evento in outro.eventos]
+        with self._lock:
+            self.eventos.extend(eventos)
+
+    def gravar(self, diretorio):
+        """Grava o rastreio em <diretorio>/<instante>-<id>.json e devolve o caminho."""
+        os.makedirs(diretorio, exist_ok=True)
+        caminho = os.path.join(diretorio, f"{time.strftime('%Y%m%d-%H%M%S')}-{self.id}.json")
+        with self._lock:
+            eventos = list(self.eventos)
+        with open(caminho, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': eventos, 'displayTimeUnit': 'ms',
+                       'otherData': {'pedido': self.nome}}, f, ensure_ascii=False)
+        return caminho
+
+
+_rastreio_atual = contextvars.ContextVar('rastreio_atual', default=None)
+
+
+def rastreio_atual():
+    """Rastreio ativo no contexto atual, ou None."""
+    return _rastreio_atual.get()
+
+
+@contextlib.contextmanager
+def recolher_etapas(nome='lote'):
+    """
+    Recolhe as etapas do bloco num rastreio à parte, que não é gravado: serve para trabalho
+    partilhado por vários pedidos (um micro-lote), cujas etapas são depois copiadas para o
+    rastreio de cada pedido com Rastreio.incorporar. Os histogramas são atualizados como sempre.
+    """
+    rastreio = Rastreio(nome)
+    token = _rastreio_atual.set(rastreio)
+    try:
+        yield rastreio
+    finally:
+        _rastreio_atual.reset(token)
+
+
+def registar_etapa(nome, duracao, inicio=None, **args):
+    """Regista uma etapa já medida (ex.: durações devolvidas pelo Ollama)."""
+    registo.observar(nome, duracao)
+    rastreio = _rastreio_atual.get()
+    if rastreio is not None:
+        if inicio is None:
+            inicio = time.perf_counter() - duracao
+        rastreio.adicionar(nome, inicio, duracao, **args)
+
+
+@contextlib.contextmanager
+def etapa(nome, **args):
+    """Mede a duração do bloco e regista-a no histograma `nome` e no rastreio do pedido, se houver."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        registar_etapa(nome, time.perf_counter() - inicio, inicio, **args)
+
+
+class _RastreioPedido:
+    """Rastreio de um pedido (None sem diretório), ativado só durante cada passo."""
+
+    def __init__(self, nome, diretorio):
+        self.nome = nome
+        self.diretorio = diretorio
+        self.rastreio = Rastreio(nome) if diretorio else None
+        self.inicio = time.perf_counter()
+
+    @contextlib.contextmanager
+    def passo(self):
+        """Ativa o rastreio no contexto atual durante o bloco (o bloco não pode conter um yield)."""
+        if self.rastreio is None:
+            yield
+            return
+        token = _rastreio_atual.set(self.rastreio)
+        try:
+            yield
+        finally:
+            _rastreio_atual.reset(token)
+
+    def terminar(self, **args):
+        if self.rastreio is None:
+            return
+        self.rastreio.adicionar(self.nome, self.inicio, time.perf_counter() - self.inicio, **args)
+        try:
+            caminho = self.rastreio.gravar(self.diretorio)
+            logger.debug("Rastreio gravado em %s", caminho)
+        except OSError as e:
+            logger.warning("Não foi possível gravar o rastreio: %s", e)
+
+
+@contextlib.contextmanager
+def rastrear(nome, diretorio=None):
+    """
+    Ativa um rastreio para o pedido enquanto o bloco corre e grava-o em `diretorio` no fim.
+    Sem diretório não há rastreio (só os histogramas). Para as etapas executadas noutras
+    threads entrarem no rastreio, a função deve correr com contextvars.copy_context().
+    O bloco não pode conter um yield: para geradores use rastrear_stream/arastrear_stream.
+    """
+    pedido = _RastreioPedido(nome, diretorio)
+    try:
+        with pedido.passo():
+            yield pedido.rastreio
+    finally:
+        pedido.terminar()
+
+
+def rastrear_stream(eventos, nome, diretorio=None, etapa_total=None):
+    """
+    Gera os eventos de `eventos` com o rastreio do pedido ativo só enquanto o gerador corre
+    (de um evento ao seguinte): um consumidor que pare a meio pode fechar o stream noutro
+    contexto. `etapa_total` mede o stream inteiro e só é registada se ele chegar ao fim.
+    """
+    pedido = _RastreioPedido(nome, diretorio)
+    concluido = False
+    try:
+        while True:
+            with pedido.passo():
+                try:
+                    evento = next(eventos)
+                except StopIteration:
+                    concluido = True
+                    break
+            yield evento
+    finally:
+        with pedido.passo():
+            eventos.close()
+            if concluido and etapa_total:
+                registar_etapa(etapa_total, time.perf_counter() - pedido.inicio, pedido.inicio)
+        pedido.terminar(**({} if concluido else {'abortado': True}))
+
+
+async def arastrear_stream(eventos, nome, diretorio=None, etapa_total=None):
+    """Versão de rastrear_stream para geradores assíncronos."""
+    pedido = _RastreioPedido(nome, diretorio)
+    concluido = False
+    try:
+        while True:
+            with pedido.passo():
+                try:
+                    evento = await eventos.__anext__()
+                except StopAsyncIteration:
+                    concluido = True
+                    break
+            yield evento
+    finally:
+        with pedido.passo():
+            await eventos.aclose()
+            if concluido and etapa_total:
+                registar_etapa(etapa_total, time.perf_counter() - pedido.inicio, pedido.inicio)
+        pedido.terminar(**({} if concluido else {'abortado': True}))
+
+
+def configurar_logging(nivel=None):
+    """Configura o logging dos scripts: nível em RAG_LOG_LEVEL (padrão INFO), mensagens sem prefixo."""
+    nivel = nivel or os.environ.get('RAG_LOG_LEVEL', 'INFO')
+    logging.basicConfig(level=nivel.upper(), format='%(message)s')
+    # O cliente HTTP do Ollama regista cada pedido em INFO
+    logging.getLogger('httpx').setLevel(logging.WARNING)
@@ -0,0 +1,179 @@
+# ollama_cliente.py
+# Funções partilhadas por ollama_rag.py, ollama_pure.py e rag_server.py para chamar o
+# Ollama em modo streaming, devolvendo os tokens à medida que chegam e medindo o tempo
+# até ao primeiro token (TTFT) e o tempo total de geração de cada pergunta.
+#
+# Todas as chamadas passam pelo mesmo cliente (ligação HTTP reutilizada), com o mesmo
+# keep_alive e as mesmas opções do modelo: assim o Ollama mantém o modelo carregado entre
+# perguntas e, como a mensagem de sistema é sempre a mesma sequência de bytes no início do
+# prompt, reaproveita a KV-cache desse prefixo em vez de o reavaliar a cada pergunta.
+
+import os
+import time
+
+import instrumentacao
+
+# --- Configurações ---
+# Endereço do servidor Ollama (None = o padrão da biblioteca, http://127.0.0.1:11434)
+ollama_host = os.environ.get('OLLAMA_HOST')
+# Tempo que o Ollama mantém o modelo em memória depois do último pedido (-1 = sempre)
+keep_alive = '30m'
+# Opções do modelo enviadas em todos os pedidos. Devem ser iguais em todas as chamadas:
+# mudar opções como num_ctx obriga o Ollama a recarregar o modelo.
+opcoes_modelo = {}
+
+# Campos da última mensagem do Ollama -> chave nas métricas (durações convertidas de ns para s)
+DURACOES_OLLAMA = {
+    'load_duration': 'load_s',
+    'prompt_eval_duration': 'prompt_eval_s',
+    'eval_duration': 'eval_s',
+    'total_duration': 'ollama_total_s',
+}
+CONTAGENS_OLLAMA = {
+    'prompt_eval_count': 'prompt_eval_tokens',
+    'eval_count': 'eval_tokens',
+}
+
+_cliente = None
+
+
+def obter_cliente():
+    """Cliente síncrono partilhado pelo processo (a ligação HTTP ao Ollama é reutilizada)."""
+    global _cliente
+    if _cliente is None:
+        import ollama
+        _cliente = ollama.Client(host=ollama_host)
+    return _cliente
+
+
+def criar_cliente_async():
+    """Cliente assíncrono com a mesma configuração; deve ser criado e usado no mesmo event loop."""
+    import ollama
+    return ollama.AsyncClient(host=ollama_host)
+
+
+def mensagens_chat(system_prompt, conteudo_usuario):
+    """Mensagens do chat com a mensagem de sistema sempre primeiro, para o prefixo do prompt ser estável."""
+    return [
+        {'role': 'system', 'content': system_prompt},
+        {'role': 'user', 'content': conteudo_usuario},
+    ]
+
+
+def _registrar_token(metricas, inicio):
+    """Atualiza as métricas com a chegada de mais um token."""
+    if metricas.get('ttft_s') is None:
+        metricas['ttft_s'] = time.perf_counter() - inicio
+    metricas['tokens'] = metricas.get('tokens', 0) + 1
+
+
+def _iniciar_metricas(metricas):
+    metricas.update(ttft_s=None, total_s=None, tokens=0)
+    for chave in list(DURACOES_OLLAMA.values()) + list(CONTAGENS_OLLAMA.values()):
+        metricas.pop(chave, None)
+
+
+def _registrar_final(metricas, parte):
+    """Copia para as métricas as durações e contagens que o Ollama envia na última mensagem."""
+    for campo, chave in DURACOES_OLLAMA.items():
+        if parte.get(campo) is not None:
+            metricas[chave] = parte.get(campo) / 1e9
+    for campo, chave in CONTAGENS_OLLAMA.items():
+        if parte.get(campo) is not None:
+            metricas[chave] = parte.get(campo)
+
+
+def _registrar_etapas_llm(metricas, inicio):
+    """Envia para os histogramas (e o rastreio do pedido) as etapas da chamada ao LLM."""
+    fim = inicio + metricas['total_s']
+    instrumentacao.registar_etapa('llm_total', metricas['total_s'], inicio)
+    if metricas.get('ttft_s') is not None:
+        instrumentacao.registar_etapa('llm_ttft', metricas['ttft_s'], inicio)
+    # O Ollama só reporta durações; os inícios no rastreio são aproximados
+    if metricas.get('load_s'):
+        instrumentacao.registar_etapa('llm_carga', metricas['load_s'], inicio)
+    if metricas.get('prompt_eval_s') is not None:
+        instrumentacao.registar_etapa('llm_avaliacao_prompt', metricas['prompt_eval_s'],
+                                      inicio + (metricas.get('load_s') or 0),
+                                      tokens=metricas.get('prompt_eval_tokens'))
+    if metricas.get('eval_s') is not None:
+        instrumentacao.registar_etapa('llm_geracao', metricas['eval_s'], fim - metricas['eval_s'],
+                                      tokens=metricas.get('eval_tokens'))
+
+
+def chat_stream(model, messages, metricas=None):
+    """
+    Gera os pedaços de texto da resposta do LLM à medida que o Ollama os envia.
+    Se `metricas` for um dicionário, é preenchido com 'ttft_s', 'total_s' e 'tokens' e com as
+    durações reportadas pelo Ollama ('load_s', 'prompt_eval_s', 'eval_s', 'prompt_eval_tokens', ...).
+    """
+    metricas = {} if metricas is None else metricas
+    _iniciar_metricas(metricas)
+    inicio = time.perf_counter()
+    try:
+        for parte in obter_cliente().chat(model=model, messages=messages, stream=True,
+                                          keep_alive=keep_alive, options=opcoes_modelo or None):
+            token = parte['message']['content']
+            if token:
+                _registrar_token(metricas, inicio)
+                yield token
+            if parte.get('done'):
+                _registrar_final(metricas, parte)
+    finally:
+        metricas['total_s'] = time.perf_counter() - inicio
+        _registrar_etapas_llm(metricas, inicio)
+
+
+async def achat_stream(cliente, model, messages, metricas=None):
+    """Versão assíncrona de chat_stream, usando um cliente criado com criar_cliente_async()."""
+    metricas = {} if metricas is None else metricas
+    _iniciar_metricas(metricas)
+    inicio = time.perf_counter()
+    try:
+        async for parte in await cliente.chat(model=model, messages=messages, stream=True,
+                                              keep_alive=keep_alive, options=opcoes_modelo or None):
+            token = parte['message']['content']
+            if token:
+                _registrar_token(metricas, inicio)
+                yield token
+            if parte.get('done'):
+                _registrar_final(metricas, parte)
+    finally:
+        metricas['total_s'] = time.perf_counter() - inicio
+        _registrar_etapas_llm(metricas, inicio)
+
+
+def _pedido_pre_carga(model, system_prompt):
+    """Argumentos do chat que carrega o modelo e, se indicado, avalia já o prefixo de sistema."""
+    if system_prompt is None:
+        # Um chat sem mensagens só carrega o modelo no servidor Ollama
+        return dict(model=model, messages=[], keep_alive=keep_alive, options=opcoes_modelo or None)
+    return dict(model=model, messages=mensagens_chat(system_prompt, ''), keep_alive=keep_alive,
+                options=dict(opcoes_modelo, num_predict=1))
+
+
+def pre_carregar(model, system_prompt=None):
+    """Carrega o modelo no Ollama (e aquece a KV-cache do prefixo de sistema) antes da primeira pergunta."""
+    obter_cliente().chat(**_pedido_pre_carga(model, system_prompt))
+
+
+async def apre_carregar(cliente, model, system_prompt=None):
+    """Versão assíncrona de pre_carregar."""
+    await cliente.chat(**_pedido_pre_carga(model, system_prompt))
+
+
+def formatar_metricas(metricas):
+    """Resumo legível do tempo até ao primeiro token e do tempo total de geração."""
+    ttft = metricas.get('ttft_s')
+    ttft_texto = f"{ttft:.2f}s" if ttft is not None else "n/d"
+    texto = (f"Tempo até ao primeiro token: {ttft_texto} | "
+             f"Tempo total de geração: {metricas.get('total_s') or 0:.2f}s | "
+             f"Pedaços recebidos: {metricas.get('tokens', 0)}")
+    if metricas.get('tokens_contexto') is not None:
+        texto += (f" | Tokens de contexto: ~{metricas['tokens_contexto']}"
+                  f" (~{metricas.get('tokens_poupados', 0)} poupados)")
+    if metricas.get('prompt_eval_s') is not None:
+        texto += (f"\nOllama: carga {metricas.get('load_s') or 0:.2f}s | "
+                  f"avaliação do prompt {metricas.get('prompt_eval_tokens', 0)} tokens em {metricas['prompt_eval_s']:.2f}s | "
+                  f"geração {metricas.get('eval_tokens', 0)} tokens em {metricas.get('eval_s') or 0:.2f}s")
+    return texto
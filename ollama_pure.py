@@ -1,44 +1,65 @@
 # ollama_pure.py
 
-import ollama
+import logging
+
+import instrumentacao
+import ollama_cliente
+
+logger = logging.getLogger(__name__)
 
 # --- Configurações ---
 llm_model_name = 'mistral' #'llama2'  ou  'phi', etc. 
 
+# Prompt de sistema mais genérico para o LLM puro
+system_prompt_pure = (
+    "Você é um assistente de inteligência artificial útil e informativo. "
+    "Responda à pergunta do usuário da melhor maneira possível com base no seu conhecimento geral. "
+    "Se não souber a resposta ou a pergunta for muito específica e exigir dados especializados que você não possui, "
+    "diga que não tem essa informação ou que o conhecimento é limitado."
+)
+
+resposta_erro_llm = "Desculpe, houve um erro ao processar sua solicitação com o LLM puro."
+
+
 # --- Função: Consulta ao LLM PURO (SEM RAG) ---
-def pure_ollama_query(query_text: str):
+def pure_ollama_query_stream(query_text: str, metricas=None):
     """
-    Consulta o LLM diretamente sem contexto externo.
+    Versão streaming de pure_ollama_query: gera os pedaços da resposta à medida que chegam.
+    Se `metricas` for um dicionário, recebe o tempo até ao primeiro token e o tempo total de geração.
     """
-    print(f"\n--- Consulta ao LLM PURO (Sem RAG) para: '{query_text}' ---")
-
-    # Prompt de sistema mais genérico para o LLM puro
-    system_prompt_pure = (
-        "Você é um assistente de inteligência artificial útil e informativo. "
-        "Responda à pergunta do usuário da melhor maneira possível com base no seu conhecimento geral. "
-        "Se não souber a resposta ou a pergunta for muito específica e exigir dados especializados que você não possui, "
-        "diga que não tem essa informação ou que o conhecimento é limitado."
-    )
+    logger.debug(f"--- Consulta ao LLM PURO (Sem RAG) para: '{query_text}' ---")
 
+    messages = ollama_cliente.mensagens_chat(system_prompt_pure, query_text)
     try:
-        response = ollama.chat(model=llm_model_name, messages=[
-            {'role': 'system', 'content': system_prompt_pure},
-            {'role': 'user', 'content': query_text},
-        ])
-        llm_response = response['message']['content']
-        print("\n--- Resposta do LLM PURO ---")
-        print(llm_response)
-        return llm_response
+        yield from ollama_cliente.chat_stream(llm_model_name, messages, metricas)
     except Exception as e:
-        print(f"Erro ao chamar o Ollama: {e}")
-        print("Verifique se o Ollama está rodando e se o modelo especificado está disponível.")
-        return "Desculpe, houve um erro ao processar sua solicitação com o LLM puro."
+        logger.error(f"Erro ao chamar o Ollama: {e}")
+        logger.error("Verifique se o Ollama está rodando e se o modelo especificado está disponível.")
+        yield resposta_erro_llm
+
+
+def pure_ollama_query(query_text: str):
+    """
+    Consulta o LLM diretamente sem contexto externo.
+    """
+    metricas = {}
+    llm_response = "".join(pure_ollama_query_stream(query_text, metricas))
+    print("\n--- Resposta do LLM PURO ---")
+    print(llm_response)
+    if metricas.get('total_s') is not None:
+        print(ollama_cliente.formatar_metricas(metricas))
+    return llm_response
 
 # --- Loop de Interação ---
 if __name__ == "__main__":
+    instrumentacao.configurar_logging()
     print("\n--- Teste de LLM Puro (Sem RAG) ---")
     print(f"Modelo LLM utilizado: {llm_model_name}")
     print("Este sistema responde usando apenas o conhecimento inerente ao modelo.")
+    try:
+        ollama_cliente.pre_carregar(llm_model_name, system_prompt_pure)
+    except Exception as e:
+        logger.warning(f"Aviso: não foi possível pré-carregar o modelo no Ollama: {e}")
     print("Digite sua pergunta (ou 'sair' para encerrar).")
 
     while True:
@@ -46,5 +67,13 @@ if __name__ == "__main__":
         if user_query.lower() == 'sair':
             print("Encerrando o teste. Adeus!")
             break
-        
-        pure_ollama_query(user_query)
\ No newline at end of file
+
+        # A resposta é mostrada à medida que o LLM a vai gerando
+        metricas = {}
+        for i, token in enumerate(pure_ollama_query_stream(user_query, metricas)):
+            if i == 0:
+                print("\n--- Resposta do LLM PURO ---")
+            print(token, end="", flush=True)
+        print()
+        if metricas.get('total_s') is not None:
+            print(ollama_cliente.formatar_metricas(metricas))
@@ -1,118 +1,611 @@
 # ollama_rag.py (com cache de query embedding e sem mencionar DrugBank)
 
-import chromadb
-from sentence_transformers import SentenceTransformer
-import ollama
+import argparse
+import atexit
+import concurrent.futures
+import logging
 import os
+import sys
+
+import configuracao
+import contexto
+import divisor_chunks
+import instrumentacao
+import ollama_cliente
+import planeador_consultas
+from indice_bm25 import IndiceBM25, fusao_rrf
+from indice_interacoes import IndicePares
+from rag_cache import CacheEmbeddings, CachePontuacoes, CacheRespostas, ler_versao_indice
+from vetor_npy import ColecaoNpy
+
+logger = logging.getLogger(__name__)
 
 # --- Configurações ---
-chroma_db_path = r'C:\Users\elidi\OneDrive\Ambiente de Trabalho\Python\chroma_db'
+chroma_db_path = configuracao.chroma_db_path
 chroma_collection_name = 'drugbank_antibiotics'
 embedding_model_name = 'sentence-transformers/all-MiniLM-L6-v2'
 llm_model_name = 'mistral'
-n_results_to_retrieve = 15
+n_results_to_retrieve = 8
+
+# --- Backend Vetorial ---
+# 'chroma' usa a coleção do ChromaDB; 'npy' usa o índice exportado por drugbank_vetor.py
+# (--exportar-npy) para vetor_npy.py, dentro de chroma_db_path: busca exata, abertura quase instantânea
+backend_vetorial = os.environ.get('RAG_BACKEND', 'chroma')
+vetor_npy_dir = 'vetores_npy'
+
+# --- Recuperação Híbrida (BM25 + vetorial) ---
+# O índice BM25 é gerado por drugbank_vetor.py dentro de chroma_db_path (None = só busca vetorial).
+# Cada retriever devolve n_candidatos_hibridos chunks, combinados por reciprocal-rank fusion.
+bm25_file = 'bm25.sqlite'
+n_candidatos_hibridos = 20
+rrf_k = 60
+
+# --- Planeador de Consultas ---
+# Classifica a intenção da pergunta e resolve as drogas citadas para buscar com filtros
+# `where` e quotas por chunk_type (ver planeador_consultas.py). False = busca sem filtros.
+usar_planeador = True
+
+# --- Orçamento do Contexto ---
+# Tokens (estimados) disponíveis para os chunks no prompt; chunks repetidos ou quase iguais
+# são descartados e os restantes incluídos por ordem de pontuação até esgotar o orçamento.
+orcamento_contexto_tokens = 1200
+
+# --- Re-ranking com Cross-Encoder ---
+# Opcional (RAG_RERANKER=1): a recuperação devolve n_candidatos_reranker chunks em vez de
+# n_results_to_retrieve, um cross-encoder no CPU pontua os pares (pergunta, chunk) e ficam os
+# n_final_reranker melhores, por essa ordem (ver reordenador.py). As pontuações ficam em cache.
+usar_reranker = os.environ.get('RAG_RERANKER', '0') == '1'
+reranker_model_name = 'cross-encoder/ms-marco-MiniLM-L-6-v2'
+n_candidatos_reranker = 20
+n_final_reranker = 5
+reranker_cache_max_entradas = 65536
 
 # --- Cache de Embeddings de Query ---
-# Este dicionário armazenará {query_text: query_embedding}
-query_embedding_cache = {}
+# Limite de memória, validade das entradas, arquivo SQLite dentro de chroma_db_path (None = só em
+# memória) e número máximo de linhas no SQLite (as mais antigas são apagadas)
+query_cache_max_bytes = 64 * 1024 * 1024
+query_cache_ttl_s = 30 * 24 * 3600
+query_cache_file = 'query_embeddings.sqlite'
+query_cache_max_linhas = 200_000
+
+# --- Índice Exato de Interações por Par ---
+# Gerado por drugbank_chunks.py; as interações conhecidas entre as drogas citadas na pergunta
+# entram no contexto à frente dos chunks recuperados. Se a pergunta só pede a interação, a busca
+# vetorial é dispensada (None = desativado)
+indice_pares_path = configuracao.indice_pares_path
+
+# --- Cache de Respostas ---
+# Reutiliza a resposta do LLM quando uma pergunta semelhante (similaridade de cosseno dos
+# embeddings >= answer_cache_similaridade) recupera exatamente os mesmos chunks
+usar_answer_cache = True
+answer_cache_similaridade = 0.9
+answer_cache_max_entradas = 2048
+# Perguntas diferentes guardadas para os mesmos chunks (as mais antigas são expulsas)
+answer_cache_max_por_chave = 16
+
+# --- Instrumentação ---
+# Diretório onde gravar um rastreio (formato Trace Event do Chrome) por pergunta (None = desativado).
+# As durações de cada etapa vão sempre para os histogramas de instrumentacao.py.
+diretorio_rastreios = os.environ.get('RAG_TRACE_DIR')
+
+# --- Recursos carregados por inicializar() ---
+client = None
+collection = None
+embedding_model = None
+query_embedding_cache = None
+answer_cache = None
+indice_pares = None
+indice_bm25 = None
+executor_recuperacao = None
+reordenador = None
+
+# Prompt de sistema para instruir o LLM como assistente médico
+system_prompt_rag = (
+    "Você é um assistente de informação sobre antibióticos, projetado para auxiliar médicos com base nos dados do dataset."
+    "O contexto fornecido pode estar em inglês, mas deve responder em português, traduzindo e sintetizando as informações de forma clara e precisa. "
+    "As suas respostas devem ser precisas, concisas e estritamente derivadas do 'Contexto' fornecido."
+    "É CRÍTICO que não adicione informações que não estejam explicitamente presentes no contexto, para evitar alucinações. "
+    "NUNCA forneça aconselhamento médico direto, faça diagnósticos ou prescreva tratamentos. A sua função é fornecer informações descritivas sobre os antibióticos. "
+    "Comece a sua resposta afirmando claramente que a informação é baseada nos dados do dataset e que não substitui o julgamento clínico do médico."
+    "Se o contexto fornecido não contiver a informação necessária para responder à pergunta, diga 'Não tenho informações suficientes nos dados do dataset fornecidos!"
+    "para responder a esta pergunta."
+    " Mantenha um tom profissional e objectivo."
+)
+
+resposta_sem_contexto = ("Desculpe, não consegui encontrar informações relevantes sobre este antibiótico "
+                         "com base nos dados do dataset que possuo. Por favor, reformule sua pergunta "
+                         "ou consulte outras fontes confiáveis.")
+
+resposta_erro_llm = "Desculpe, houve um erro ao processar sua solicitação com o LLM."
+
 
 # --- Inicialização ---
+def inicializar():
+    """Conecta ao ChromaDB e carrega o modelo de embedding. Só tem efeito na primeira chamada."""
+    global client, collection, embedding_model, query_embedding_cache, answer_cache, indice_pares
+    global indice_bm25, executor_recuperacao, reordenador
+    if collection is not None and embedding_model is not None:
+        return
 
-print(f"Conectando ao ChromaDB em: {chroma_db_path}")
-try:
-    client = chromadb.PersistentClient(path=chroma_db_path)
-    collection = client.get_collection(name=chroma_collection_name)
-    print(f"Coleção '{chroma_collection_name}' carregada com sucesso. Total de itens: {collection.count()}")
-    if collection.count() == 0:
-        print("Atenção: A coleção está vazia. Certifique-se de ter indexado os dados.")
-except Exception as e:
-    print(f"Erro ao carregar a coleção '{chroma_collection_name}': {e}")
-    print("Certifique-se de que o ChromaDB foi populado corretamente executando o script de indexação.")
-    exit()
-
-print(f"Carregando modelo de embedding: {embedding_model_name}")
-embedding_model = SentenceTransformer(embedding_model_name)
-print("Modelo de embedding carregado.")
+    try:
+        if backend_vetorial == 'npy':
+            diretorio_npy = os.path.join(chroma_db_path, vetor_npy_dir)
+            logger.info(f"Abrindo o índice .npy em: {diretorio_npy}")
+            collection = ColecaoNpy(diretorio_npy, versao_esperada=ler_versao_indice(chroma_db_path))
+        else:
+            # Importado só aqui: o ChromaDB demora a carregar e não é usado pelo backend .npy
+            import chromadb
+            logger.info(f"Conectando ao ChromaDB em: {chroma_db_path}")
+            client = chromadb.PersistentClient(path=chroma_db_path)
+            collection = client.get_collection(name=chroma_collection_name)
+        logger.info(f"Coleção '{chroma_collection_name}' carregada com sucesso. Total de itens: {collection.count()}")
+        if collection.count() == 0:
+            logger.warning("Atenção: A coleção está vazia. Certifique-se de ter indexado os dados.")
+    except Exception as e:
+        logger.error(f"Erro ao carregar a coleção '{chroma_collection_name}': {e}")
+        logger.error("Certifique-se de que o ChromaDB foi populado corretamente executando o script de indexação.")
+        raise
 
-# --- Função: RAG com Ollama (COM RAG) ---
-def rag_with_ollama(query_text: str):
+    from sentence_transformers import SentenceTransformer
+    logger.info(f"Carregando modelo de embedding: {embedding_model_name}")
+    embedding_model = SentenceTransformer(embedding_model_name)
+    logger.info("Modelo de embedding carregado.")
+
+    query_embedding_cache = CacheEmbeddings(
+        embedding_model_name,
+        max_bytes=query_cache_max_bytes,
+        ttl_s=query_cache_ttl_s,
+        caminho_sqlite=os.path.join(chroma_db_path, query_cache_file) if query_cache_file else None,
+        max_linhas_sqlite=query_cache_max_linhas,
+    )
+    # As inserções no SQLite são gravadas em commits agrupados: grava as pendentes à saída
+    atexit.register(query_embedding_cache.fechar)
+    if usar_answer_cache:
+        answer_cache = CacheRespostas(
+            similaridade_minima=answer_cache_similaridade,
+            max_entradas=answer_cache_max_entradas,
+            max_por_chave=answer_cache_max_por_chave,
+            versao_indice=lambda: ler_versao_indice(chroma_db_path),
+        )
+
+    if indice_pares_path and os.path.exists(indice_pares_path):
+        indice_pares = IndicePares(indice_pares_path)
+        logger.info(f"Índice de interações por par carregado ({len(indice_pares.nomes)} nomes de drogas).")
+
+    # Threads para as buscas em paralelo (ChromaDB + BM25, ou uma busca por chunk_type do plano)
+    executor_recuperacao = concurrent.futures.ThreadPoolExecutor(max_workers=4, thread_name_prefix='recuperacao')
+
+    bm25_path = os.path.join(chroma_db_path, bm25_file) if bm25_file else None
+    if bm25_path and os.path.exists(bm25_path):
+        indice_bm25 = IndiceBM25(bm25_path)
+        logger.info(f"Índice BM25 carregado ({indice_bm25.total_docs} chunks); recuperação híbrida ativa.")
+
+    if usar_reranker:
+        from reordenador import Reordenador
+        reordenador = Reordenador(reranker_model_name, cache=CachePontuacoes(
+            max_entradas=reranker_cache_max_entradas,
+            versao_indice=lambda: ler_versao_indice(chroma_db_path),
+        ))
+        logger.info(f"Re-ranking ativo: {n_candidatos_reranker} candidatos -> top {n_final_reranker}.")
+
+
+# --- Etapas do RAG ---
+def embedding_da_query(query_text: str):
+    """Gera (ou reutiliza do cache) o embedding da pergunta."""
+    inicializar()
+
+    with instrumentacao.etapa('cache_embeddings'):
+        query_embedding = query_embedding_cache.obter(query_text)
+    if query_embedding is not None:
+        logger.debug("Usando embedding da query do cache.")
+    else:
+        logger.debug("Gerando novo embedding para a query...")
+        with instrumentacao.etapa('embedding'):
+            query_embedding = embedding_model.encode(query_text)
+        query_embedding_cache.guardar(query_text, query_embedding) # Armazena no cache
+    return query_embedding
+
+
+def embeddings_das_queries(query_texts, batch_size=64):
+    """Embeddings de várias perguntas: as que não estão no cache são geradas num único encode em lote."""
+    inicializar()
+
+    with instrumentacao.etapa('cache_embeddings'):
+        embeddings = [query_embedding_cache.obter(texto) for texto in query_texts]
+    em_falta = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    if em_falta:
+        logger.debug(f"Gerando {len(em_falta)} embeddings de query em lote ({len(query_texts) - len(em_falta)} do cache)...")
+        with instrumentacao.etapa('embedding_lote', n=len(em_falta)):
+            novos = embedding_model.encode([query_texts[i] for i in em_falta], batch_size=batch_size,
+                                           convert_to_numpy=True, show_progress_bar=False)
+        for i, embedding in zip(em_falta, novos):
+            embeddings[i] = embedding
+            query_embedding_cache.guardar(query_texts[i], embedding)
+    return embeddings
+
+
+def recuperar_chunks(query_text: str, query_embedding=None):
     """
-    Executa o processo de Retrieval-Augmented Generation para auxiliar médicos.
-    Inclui cache de embeddings para a query e não menciona "DrugBank".
+    Busca os chunks mais relevantes para a pergunta. O embedding é calculado (com cache)
+    se não for indicado. As partes de um mesmo chunk longo encontradas juntas são unidas
+    num só resultado; com o re-ranking ativo, os candidatos são depois reordenados pelo
+    cross-encoder. Devolve (ids, chunks, metadatas, distances).
     """
-    print(f"\n--- Consulta RAG (Com Contexto do Dataset) para: '{query_text}' ---")
+    inicializar()
+    with instrumentacao.etapa('recuperacao'):
+        return recuperar_chunks_em_lote(
+            [query_text], None if query_embedding is None else [query_embedding])[0]
+
+
+def recuperar_chunks_em_lote(query_texts, query_embeddings=None):
+    """
+    Como recuperar_chunks, para várias perguntas de uma vez: os embeddings em falta são gerados
+    num único encode em lote e as perguntas que seguem a busca sem filtros partilham uma só
+    collection.query com todos os embeddings. Devolve um (ids, chunks, metadatas, distances)
+    por pergunta, pela ordem recebida.
+    """
+    inicializar()
+    # 0. Interações exatas do índice de pares: sozinhas respondem a perguntas só sobre a
+    # interação; nas restantes (ex.: dosagem de A com B) juntam-se aos chunks recuperados
+    pares = [_interacoes_do_indice(query_text) for query_text in query_texts]
+    resultados = [None] * len(query_texts)
+    pendentes = []
+    for i, query_text in enumerate(query_texts):
+        if pares[i] is not None and _so_interacoes(query_text):
+            logger.debug("Pergunta só sobre a interação; busca vetorial dispensada.")
+            resultados[i] = pares[i]
+        else:
+            pendentes.append(i)
+    if not pendentes:
+        return resultados
+
+    # 1. Embeddings das perguntas (com cache), num só encode para as que faltam
+    if query_embeddings is None:
+        query_embeddings = [None] * len(query_texts)
+        if len(pendentes) == 1:
+            query_embeddings[pendentes[0]] = embedding_da_query(query_texts[pendentes[0]])
+        else:
+            for i, embedding in zip(pendentes, embeddings_das_queries([query_texts[i] for i in pendentes])):
+                query_embeddings[i] = embedding
+
+    # 2. Busca planeada: filtros por chunk_type/droga com quotas por tipo. Os filtros mudam
+    # de pergunta para pergunta, mas as buscas de todas são submetidas antes de esperar por elas
+    planeadas = {}
+    if usar_planeador:
+        for i in pendentes:
+            with instrumentacao.etapa('planeador'):
+                plano = planeador_consultas.planear(query_texts[i], indice_pares)
+            if plano is not None:
+                logger.debug(f"Plano de consulta: {planeador_consultas.descrever_plano(plano)}")
+                planeadas[i] = _submeter_busca_planeada(plano, query_embeddings[i])
+    sem_filtros = []
+    for i in pendentes:
+        if i in planeadas:
+            with instrumentacao.etapa('busca_planeada'):
+                resultado = _juntar_busca_planeada(planeadas[i])
+            if resultado[0]:
+                resultados[i] = resultado
+                continue
+            logger.debug("A busca planeada não encontrou chunks; usando a busca sem filtros.")
+        sem_filtros.append(i)
+
+    # 3. Buscar chunks relevantes no ChromaDB (e no BM25, se disponível), numa só consulta
+    if sem_filtros:
+        textos = [query_texts[i] for i in sem_filtros]
+        embeddings = [query_embeddings[i] for i in sem_filtros]
+        if indice_bm25 is not None:
+            with instrumentacao.etapa('busca_hibrida'):
+                encontrados = busca_hibrida_em_lote(textos, embeddings)
+        else:
+            with instrumentacao.etapa('busca_densa'):
+                encontrados = busca_densa_em_lote(embeddings)
+        for i, resultado in zip(sem_filtros, encontrados):
+            resultados[i] = resultado
+
+    for i in pendentes:
+        resultados[i] = divisor_chunks.juntar_partes(*resultados[i])
+        if reordenador is not None:
+            with instrumentacao.etapa('reranking', n=len(resultados[i][0])):
+                resultados[i] = reordenador.reordenar(query_texts[i], *resultados[i], n_final_reranker)
+        if pares[i] is not None:
+            resultados[i] = _juntar_interacoes(pares[i], resultados[i])
+    return resultados
+
+
+def _interacoes_do_indice(query_text):
+    """
+    Interações do índice de pares entre as drogas citadas na pergunta, no formato de
+    recuperar_chunks (distância 0.0). Devolve None se a pergunta não cita uma interação conhecida.
+    """
+    if indice_pares is None:
+        return None
+    with instrumentacao.etapa('indice_pares'):
+        pares = indice_pares.interacoes_na_pergunta(query_text)
+    if not pares:
+        return None
+    logger.debug(f"Encontradas {len(pares)} interações no índice de pares.")
+    return (
+        [chunk_id for chunk_id, _, _, _ in pares],
+        [conteudo for _, _, _, conteudo in pares],
+        [{'chunk_type': 'drug_interaction', 'drugbank_id': id_a, 'interacting_drug_id': id_b}
+         for _, id_a, id_b, _ in pares],
+        [0.0] * len(pares),
+    )
+
+
+def _so_interacoes(query_text):
+    """A pergunta só pede a interação (ex.: 'A interage com B?'): o índice de pares basta."""
+    return planeador_consultas.classificar_intencao(query_text) == ['drug_interaction']
+
+
+def _juntar_interacoes(pares, resultado):
+    """Interações exatas do índice de pares à frente dos chunks recuperados, sem repetir chunk_ids."""
+    vistos = set(pares[0])
+    manter = [i for i, chunk_id in enumerate(resultado[0]) if chunk_id not in vistos]
+    return tuple(list(exatos) + [valores[i] for i in manter] for exatos, valores in zip(pares, resultado))
+
+
+def _n_resultados():
+    """Chunks a pedir à busca: o conjunto de candidatos do re-ranking, quando ativo."""
+    return n_candidatos_reranker if reordenador is not None else n_results_to_retrieve
+
+
+def _por_consulta(results):
+    """Separa o resultado de uma collection.query com vários embeddings em (ids, documentos, metadatas, distâncias) por embedding."""
+    return list(zip(results['ids'], results['documents'], results['metadatas'], results['distances']))
 
-    # 1. Gerar embedding para a pergunta do usuário (com cache)
-    if query_text in query_embedding_cache:
-        query_embedding = query_embedding_cache[query_text]
-        print("Usando embedding da query do cache.")
-    else:
-        print("Gerando novo embedding para a query...")
-        query_embedding = embedding_model.encode(query_text).tolist()
-        query_embedding_cache[query_text] = query_embedding # Armazena no cache
 
-    # 2. Buscar chunks relevantes no ChromaDB
-    print(f"Buscando os {n_results_to_retrieve} chunks mais relevantes no ChromaDB...")
+def busca_densa_em_lote(query_embeddings):
+    """Busca vetorial sem filtros de várias perguntas numa única collection.query."""
+    n_resultados = _n_resultados()
+    logger.debug(f"Buscando os {n_resultados} chunks mais relevantes no ChromaDB para {len(query_embeddings)} pergunta(s)...")
     results = collection.query(
-        query_embeddings=[query_embedding],
-        n_results=n_results_to_retrieve,
+        query_embeddings=list(query_embeddings),
+        n_results=n_resultados,
         include=['documents', 'metadatas', 'distances']
     )
+    return _por_consulta(results)
 
-    retrieved_chunks = results['documents'][0]
-    retrieved_metadatas = results['metadatas'][0]
-    retrieved_distances = results['distances'][0]
 
-    if not retrieved_chunks:
-        print("Nenhum chunk relevante encontrado no ChromaDB.")
-        return ("Desculpe, não consegui encontrar informações relevantes sobre este antibiótico "
-                "com base nos dados do dataset que possuo. Por favor, reformule sua pergunta "
-                "ou consulte outras fontes confiáveis.")
-
-    print(f"Chunks recuperados (top {len(retrieved_chunks)}):")
-    context_parts = []
-    for i, chunk_content in enumerate(retrieved_chunks):
-        metadata = retrieved_metadatas[i]
-        distance = retrieved_distances[i]
-        context_parts.append(f"### Informação do Dataset (Chunk {i+1} - Tipo: {metadata.get('chunk_type', 'N/A')}, ID DrugBank: {metadata.get('drugbank_id', 'N/A')}, Distância: {distance:.4f}):\n{chunk_content}\n")
-        print(f"  - Chunk {i+1} (Tipo: {metadata.get('chunk_type')}, ID DrugBank: {metadata.get('drugbank_id')}, Distância: {distance:.4f}): {chunk_content[:100]}...")
-
-    # 3. Construir o prompt para o LLM com o contexto
-    context = "\n\n".join(context_parts)
-    
-    # Prompt de sistema para instruir o LLM como assistente médico
-    system_prompt_rag = (
-        "Você é um assistente de informação sobre antibióticos, projetado para auxiliar médicos com base nos dados do dataset." 
-        "O contexto fornecido pode estar em inglês, mas deve responder em português, traduzindo e sintetizando as informações de forma clara e precisa. "
-        "As suas respostas devem ser precisas, concisas e estritamente derivadas do 'Contexto' fornecido."
-        "É CRÍTICO que não adicione informações que não estejam explicitamente presentes no contexto, para evitar alucinações. "
-        "NUNCA forneça aconselhamento médico direto, faça diagnósticos ou prescreva tratamentos. A sua função é fornecer informações descritivas sobre os antibióticos. "
-        "Comece a sua resposta afirmando claramente que a informação é baseada nos dados do dataset e que não substitui o julgamento clínico do médico."
-        "Se o contexto fornecido não contiver a informação necessária para responder à pergunta, diga 'Não tenho informações suficientes nos dados do dataset fornecidos!"
-        "para responder a esta pergunta."
-        " Mantenha um tom profissional e objectivo."
+def busca_planeada(plano, query_embedding):
+    """
+    Executa em paralelo uma busca filtrada por chunk_type (e drogas) para cada entrada do plano,
+    limitada à quota desse tipo. Os chunks seguem a ordem do plano (tipo principal primeiro).
+    """
+    return _juntar_busca_planeada(_submeter_busca_planeada(plano, query_embedding))
+
+
+def _submeter_busca_planeada(plano, query_embedding):
+    return [
+        executor_recuperacao.submit(
+            collection.query,
+            query_embeddings=[query_embedding],
+            n_results=quota,
+            where=where,
+            include=['documents', 'metadatas', 'distances'],
+        )
+        for _, quota, where in plano['buscas']
+    ]
+
+
+def _juntar_busca_planeada(futuros):
+    ids, chunks, metadatas, distances = [], [], [], []
+    for futuro in futuros:
+        results = futuro.result()
+        for chunk_id, document, metadata, distance in zip(
+                results['ids'][0], results['documents'][0], results['metadatas'][0], results['distances'][0]):
+            if chunk_id not in ids:
+                ids.append(chunk_id)
+                chunks.append(document)
+                metadatas.append(metadata)
+                distances.append(distance)
+    return ids, chunks, metadatas, distances
+
+
+def busca_hibrida(query_text: str, query_embedding):
+    """
+    Consulta em paralelo o ChromaDB (denso) e o índice BM25 (esparso) e combina os resultados
+    por reciprocal-rank fusion. Chunks encontrados só pelo BM25 não têm distância (None).
+    """
+    return busca_hibrida_em_lote([query_text], [query_embedding])[0]
+
+
+def busca_hibrida_em_lote(query_texts, query_embeddings):
+    """
+    busca_hibrida para várias perguntas: uma só collection.query com todos os embeddings,
+    em paralelo com as buscas BM25 de cada pergunta, e uma só collection.get para os
+    documentos que só o BM25 encontrou.
+    """
+    n_resultados = _n_resultados()
+    logger.debug(f"Buscando {n_candidatos_hibridos} candidatos no ChromaDB e no BM25 para {len(query_texts)} "
+                 f"pergunta(s) (fusão RRF, top {n_resultados})...")
+    futuro_denso = executor_recuperacao.submit(
+        collection.query,
+        query_embeddings=list(query_embeddings),
+        n_results=n_candidatos_hibridos,
+        include=['documents', 'metadatas', 'distances'],
     )
+    futuros_esparsos = [executor_recuperacao.submit(indice_bm25.buscar, query_text, n_candidatos_hibridos)
+                        for query_text in query_texts]
+    densos = _por_consulta(futuro_denso.result())
+
+    encontrados = {}
+    selecionados = []
+    for (ids_densos, documents, metadatas, distances), futuro_esparso in zip(densos, futuros_esparsos):
+        for chunk_id, document, metadata, distance in zip(ids_densos, documents, metadatas, distances):
+            encontrados.setdefault(chunk_id, (document, metadata, distance))
+        esparso = futuro_esparso.result()
+        fundidos = fusao_rrf([ids_densos, [chunk_id for chunk_id, _ in esparso]], k=rrf_k)
+        selecionados.append(([chunk_id for chunk_id, _ in fundidos[:n_resultados]], ids_densos, distances))
+
+    # Documentos dos chunks que só o BM25 encontrou
+    em_falta = list(dict.fromkeys(chunk_id for ids, _, _ in selecionados
+                                  for chunk_id in ids if chunk_id not in encontrados))
+    if em_falta:
+        extra = collection.get(ids=em_falta, include=['documents', 'metadatas'])
+        for chunk_id, document, metadata in zip(extra['ids'], extra['documents'], extra['metadatas']):
+            encontrados[chunk_id] = (document, metadata, None)
+
+    resultados = []
+    for ids, ids_densos, distances in selecionados:
+        # A distância é a da própria pergunta (None se o chunk só veio do BM25 dela)
+        distancia = dict(zip(ids_densos, distances))
+        ids = [chunk_id for chunk_id in ids if chunk_id in encontrados]
+        resultados.append((
+            ids,
+            [encontrados[chunk_id][0] for chunk_id in ids],
+            [encontrados[chunk_id][1] for chunk_id in ids],
+            [distancia.get(chunk_id) for chunk_id in ids],
+        ))
+    return resultados
+
+
+def construir_mensagens(query_text: str, retrieved_chunks, retrieved_metadatas, retrieved_distances, metricas=None):
+    """
+    Constrói as mensagens (sistema + usuário com o contexto) enviadas ao LLM.
+    Se `metricas` for um dicionário, recebe 'tokens_contexto' e 'tokens_poupados'.
+    """
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"Chunks recuperados (top {len(retrieved_chunks)}):")
+        for i, chunk_content in enumerate(retrieved_chunks):
+            metadata = retrieved_metadatas[i]
+            # Chunks encontrados só pelo BM25 não têm distância vetorial
+            distance = f"{retrieved_distances[i]:.4f}" if retrieved_distances[i] is not None else "N/A"
+            logger.debug(f"  - Chunk {i+1} (Tipo: {metadata.get('chunk_type')}, ID DrugBank: {metadata.get('drugbank_id')}, Distância: {distance}): {chunk_content[:100]}...")
+
+    # 3. Construir o prompt para o LLM com o contexto (sem repetições e dentro do orçamento)
+    with instrumentacao.etapa('montagem_prompt'):
+        context, estatisticas = contexto.construir_contexto(
+            retrieved_chunks, retrieved_metadatas, retrieved_distances, orcamento_contexto_tokens,
+            ordenar_por_distancia=reordenador is None)
+        user_prompt = f"Contexto:\n{context}\n\nPergunta do Médico: {query_text}\n\nResposta:"
+    logger.debug(contexto.formatar_estatisticas(estatisticas))
+    if metricas is not None:
+        metricas['tokens_contexto'] = estatisticas['tokens_contexto']
+        metricas['tokens_poupados'] = estatisticas['tokens_poupados']
+
+    # A mensagem de sistema é sempre a mesma: o Ollama reaproveita a KV-cache desse prefixo
+    return ollama_cliente.mensagens_chat(system_prompt_rag, user_prompt)
+
+
+def obter_resposta_em_cache(retrieved_ids, query_embedding, metricas=None):
+    """Procura na cache de respostas uma resposta para o mesmo contexto e uma pergunta semelhante."""
+    if answer_cache is None:
+        return None
+    with instrumentacao.etapa('cache_respostas'):
+        resposta = answer_cache.obter(llm_model_name, retrieved_ids, query_embedding)
+    if resposta is not None:
+        logger.debug("Usando resposta do cache (mesmos chunks recuperados e pergunta semelhante).")
+        if metricas is not None:
+            metricas.update(ttft_s=0.0, total_s=0.0, tokens=0, cache=True)
+    return resposta
+
+
+# --- Função: RAG com Ollama (COM RAG) ---
+def rag_with_ollama_stream(query_text: str, metricas=None):
+    """
+    Versão streaming de rag_with_ollama: gera os pedaços da resposta do LLM à medida que chegam.
+    Se `metricas` for um dicionário, recebe o tempo até ao primeiro token e o tempo total de geração.
+    """
+    return instrumentacao.rastrear_stream(_rag_stream(query_text, metricas), 'rag', diretorio_rastreios,
+                                         etapa_total='rag_total')
+
+
+def _rag_stream(query_text, metricas):
+    logger.debug(f"--- Consulta RAG (Com Contexto do Dataset) para: '{query_text}' ---")
+
+    query_embedding = embedding_da_query(query_text)
+    retrieved_ids, retrieved_chunks, retrieved_metadatas, retrieved_distances = recuperar_chunks(
+        query_text, query_embedding)
+
+    if not retrieved_chunks:
+        logger.debug("Nenhum chunk relevante encontrado no ChromaDB.")
+        yield resposta_sem_contexto
+        return
+
+    resposta_em_cache = obter_resposta_em_cache(retrieved_ids, query_embedding, metricas)
+    if resposta_em_cache is not None:
+        yield resposta_em_cache
+        return
 
-    user_prompt = f"Contexto:\n{context}\n\nPergunta do Médico: {query_text}\n\nResposta:"
+    messages = construir_mensagens(query_text, retrieved_chunks, retrieved_metadatas, retrieved_distances, metricas)
 
     # 4. Chamar o LLM via Ollama
-    print("\nEnviando pergunta e contexto para o LLM (Ollama)...")
+    logger.debug("Enviando pergunta e contexto para o LLM (Ollama)...")
+    partes = []
     try:
-        response = ollama.chat(model=llm_model_name, messages=[
-            {'role': 'system', 'content': system_prompt_rag},
-            {'role': 'user', 'content': user_prompt},
-        ])
-        llm_response = response['message']['content']
-        print("\n--- Resposta do LLM RAG ---")
-        print(llm_response)
-        return llm_response
+        for token in ollama_cliente.chat_stream(llm_model_name, messages, metricas):
+            partes.append(token)
+            yield token
     except Exception as e:
-        print(f"Erro ao chamar o Ollama: {e}")
-        print("Verifique se o Ollama está rodando e se o modelo especificado está disponível.")
-        return "Desculpe, houve um erro ao processar sua solicitação com o LLM."
+        logger.error(f"Erro ao chamar o Ollama: {e}")
+        logger.error("Verifique se o Ollama está rodando e se o modelo especificado está disponível.")
+        yield resposta_erro_llm
+        return
+
+    if answer_cache is not None:
+        answer_cache.guardar(llm_model_name, retrieved_ids, query_embedding, "".join(partes))
+
+
+def rag_with_ollama(query_text: str):
+    """
+    Executa o processo de Retrieval-Augmented Generation para auxiliar médicos.
+    Inclui cache de embeddings para a query e não menciona "DrugBank".
+    """
+    metricas = {}
+    llm_response = "".join(rag_with_ollama_stream(query_text, metricas))
+    print("\n--- Resposta do LLM RAG ---")
+    print(llm_response)
+    if metricas.get('total_s') is not None:
+        print(ollama_cliente.formatar_metricas(metricas))
+    return llm_response
 
 # --- Loop de Interação ---
-if __name__ == "__main__":
+def responder(user_query):
+    """Mostra a resposta RAG à medida que o LLM a vai gerando, seguida das métricas."""
+    metricas = {}
+    for i, token in enumerate(rag_with_ollama_stream(user_query, metricas)):
+        if i == 0:
+            print("\n--- Resposta do LLM RAG ---")
+        print(token, end="", flush=True)
+    print()
+    if metricas.get('total_s') is not None:
+        print(ollama_cliente.formatar_metricas(metricas))
+
+
+def main(argv=None):
+    global backend_vetorial, chroma_db_path, usar_reranker
+
+    parser = argparse.ArgumentParser(description="Responde a perguntas sobre antibióticos com RAG sobre o dataset.")
+    parser.add_argument('pergunta', nargs='?',
+                        help="Pergunta a responder; sem pergunta abre o modo interativo.")
+    parser.add_argument('--backend', choices=['chroma', 'npy'], default=backend_vetorial,
+                        help="Backend vetorial (variável de ambiente RAG_BACKEND).")
+    parser.add_argument('--chroma-db', default=chroma_db_path,
+                        help="Diretório do ChromaDB (variável de ambiente CHROMA_DB_PATH).")
+    parser.add_argument('--reranker', action='store_true', default=usar_reranker,
+                        help="Reordena os candidatos com o cross-encoder (variável de ambiente RAG_RERANKER=1).")
+    args = parser.parse_args(argv)
+    backend_vetorial = args.backend
+    chroma_db_path = args.chroma_db
+    usar_reranker = args.reranker
+
+    instrumentacao.configurar_logging()
+    try:
+        inicializar()
+    except Exception:
+        # O erro já foi registado por inicializar
+        return 1
+    try:
+        ollama_cliente.pre_carregar(llm_model_name, system_prompt_rag)
+        logger.info(f"Modelo LLM '{llm_model_name}' carregado no Ollama.")
+    except Exception as e:
+        logger.warning(f"Aviso: não foi possível pré-carregar o modelo no Ollama: {e}")
+
+    if args.pergunta:
+        responder(args.pergunta)
+        return
+
     print("\n--- Assistente de Informação sobre Antibióticos (RAG com Dataset) ---")
     print(f"Modelo LLM utilizado: {llm_model_name}")
     print("Este sistema fornece informações sobre antibióticos com base nos dados do dataset. ")
@@ -122,7 +615,16 @@ if __name__ == "__main__":
     while True:
         user_query = input("\nSua pergunta: ")
         if user_query.lower() == 'sair':
+            print(f"Cache de embeddings de query: {query_embedding_cache.estatisticas()}")
+            if answer_cache is not None:
+                print(f"Cache de respostas: {answer_cache.estatisticas()}")
+            if reordenador is not None:
+                print(f"Cache de pontuações do re-ranking: {reordenador.cache.estatisticas()}")
+            print(f"Latência por etapa:\n{instrumentacao.registo.formatar()}")
             print("Encerrando o assistente. Adeus!")
             break
-        
-        rag_with_ollama(user_query)
\ No newline at end of file
+        responder(user_query)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,158 @@
+# ollama_stub.py
+# Servidor que imita o endpoint /api/chat do Ollama, para testar ollama_cliente.py,
+# ollama_rag.py e rag_server.py sem um modelo real. Simula:
+#   - carga do modelo na primeira chamada e descarga depois de keep_alive sem pedidos;
+#   - reaproveitamento da KV-cache: só os tokens depois do prefixo comum com o prompt
+#     anterior contam como avaliação do prompt (prompt_eval_count);
+#   - as durações load/prompt_eval/eval na última mensagem, como o Ollama.
+#
+# Uso: python ollama_stub.py --port 11434   (e OLLAMA_HOST=http://127.0.0.1:11434 nos clientes)
+
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# --- Configurações ---
+caracteres_por_token = 4
+segundos_carga = 0.5
+segundos_por_token_prompt = 0.001
+segundos_por_token_gerado = 0.02
+keep_alive_padrao = 300.0
+
+_RE_DURACAO = re.compile(r"^(-?\d+(?:\.\d+)?)(ms|s|m|h)?$")
+_UNIDADES = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600, None: 1}
+
+
+def duracao_keep_alive(valor):
+    """Converte o keep_alive do pedido ('30m', 300, -1, ...) em segundos (None = nunca descarregar)."""
+    if valor is None:
+        return keep_alive_padrao
+    if isinstance(valor, (int, float)):
+        segundos = float(valor)
+    else:
+        m = _RE_DURACAO.match(str(valor).strip())
+        segundos = float(m.group(1)) * _UNIDADES[m.group(2)] if m else keep_alive_padrao
+    return None if segundos < 0 else segundos
+
+
+class EstadoModelo:
+    """Modelo 'carregado' e último prompt avaliado (a KV-cache), partilhados pelos pedidos."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.carregado_ate = {}    # modelo -> instante de descarga (None = nunca)
+        self.ultimo_prompt = {}    # modelo -> texto do último prompt
+
+    def processar(self, modelo, prompt, keep_alive):
+        """Devolve (segundos de carga, tokens do prompt a avaliar) e atualiza o estado."""
+        agora = time.time()
+        with self.lock:
+            expira = self.carregado_ate.get(modelo, 0)
+            carga = 0.0
+            if modelo not in self.carregado_ate or (expira is not None and expira < agora):
+                carga = segundos_carga
+                self.ultimo_prompt.pop(modelo, None)
+
+            anterior = self.ultimo_prompt.get(modelo, '')
+            comum = 0
+            for a, b in zip(anterior, prompt):
+                if a != b:
+                    break
+                comum += 1
+            novos = -(-(len(prompt) - comum) // caracteres_por_token)
+
+            self.ultimo_prompt[modelo] = prompt
+            duracao = duracao_keep_alive(keep_alive)
+            self.carregado_ate[modelo] = None if duracao is None else agora + carga + duracao
+            return carga, novos
+
+
+estado = EstadoModelo()
+
+
+def renderizar_prompt(messages):
+    """Texto do prompt como um template simples o montaria a partir das mensagens."""
+    return "".join(f"<{m.get('role')}>{m.get('content', '')}</{m.get('role')}>" for m in messages)
+
+
+class HandlerStub(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _escrever_pedaco(self, objeto):
+        linha = (json.dumps(objeto, ensure_ascii=False) + '\n').encode('utf-8')
+        self.wfile.write(b'%X\r\n%s\r\n' % (len(linha), linha))
+        self.wfile.flush()
+
+    def do_POST(self):
+        if self.path != '/api/chat':
+            self.send_error(404)
+            return
+        pedido = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        modelo = pedido.get('model')
+        messages = pedido.get('messages') or []
+        opcoes = pedido.get('options') or {}
+
+        carga, tokens_prompt = estado.processar(modelo, renderizar_prompt(messages), pedido.get('keep_alive'))
+        time.sleep(carga + tokens_prompt * segundos_por_token_prompt)
+
+        # Resposta fixa; um chat sem mensagens só carrega o modelo
+        tokens = ['Resposta', ' simulada', ' do', ' stub', '.'] if messages else []
+        if 'num_predict' in opcoes:
+            tokens = tokens[:max(0, int(opcoes['num_predict']))]
+        base = {'model': modelo, 'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())}
+        final = dict(
+            base, message={'role': 'assistant', 'content': ''}, done=True,
+            done_reason='stop' if messages else 'load',
+            load_duration=int(carga * 1e9),
+            prompt_eval_count=tokens_prompt,
+            prompt_eval_duration=int(tokens_prompt * segundos_por_token_prompt * 1e9),
+            eval_count=len(tokens),
+            eval_duration=int(len(tokens) * segundos_por_token_gerado * 1e9),
+        )
+        final['total_duration'] = final['load_duration'] + final['prompt_eval_duration'] + final['eval_duration']
+
+        if pedido.get('stream', True):
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/x-ndjson')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for token in tokens:
+                time.sleep(segundos_por_token_gerado)
+                self._escrever_pedaco(dict(base, message={'role': 'assistant', 'content': token}, done=False))
+            self._escrever_pedaco(final)
+            self.wfile.write(b'0\r\n\r\n')
+        else:
+            time.sleep(len(tokens) * segundos_por_token_gerado)
+            final['message']['content'] = ''.join(tokens)
+            corpo = json.dumps(final, ensure_ascii=False).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor que imita o /api/chat do Ollama para testes locais.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=11434)
+    args = parser.parse_args(argv)
+
+    servidor = ThreadingHTTPServer((args.host, args.port), HandlerStub)
+    print(f"Stub do Ollama a escutar em http://{args.host}:{args.port}")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+
+
+if __name__ == "__main__":
+    main()
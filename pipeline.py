@@ -0,0 +1,50 @@
+# pipeline.py
+# Ponto de entrada único para todas as etapas do projeto:
+#   python pipeline.py extract   XML do DrugBank -> dataset JSON Lines      (drugbank_json.py)
+#   python pipeline.py chunk     dataset -> chunks + índice de pares       (drugbank_chunks.py)
+#   python pipeline.py index     chunks -> ChromaDB, BM25 e .npy           (drugbank_vetor.py)
+#   python pipeline.py query     pergunta única ou modo interativo         (ollama_rag.py)
+#   python pipeline.py serve     servidor HTTP com os recursos carregados  (rag_server.py)
+#   python pipeline.py regime    interações de uma prescrição com várias drogas (grafo_interacoes.py)
+#
+# Os argumentos depois do subcomando são passados ao main() do módulo correspondente
+# (`python pipeline.py index --help` mostra as opções da indexação). Cada módulo só é
+# importado quando o seu subcomando é executado, e as dependências pesadas (lxml,
+# sentence_transformers, chromadb, ollama) só são carregadas dentro das funções que as
+# usam: `chunk` ou `query --help` arrancam sem importar o PyTorch.
+# Os caminhos padrão vêm de configuracao.py (variáveis RAG_DATA_DIR, DRUGBANK_XML, CHROMA_DB_PATH).
+
+import argparse
+import importlib
+import sys
+
+# subcomando -> (módulo, descrição)
+SUBCOMANDOS = {
+    'extract': ('drugbank_json', "Extrai os antibióticos do XML do DrugBank para JSON Lines."),
+    'chunk': ('drugbank_chunks', "Divide o dataset em chunks e constrói o índice de pares."),
+    'index': ('drugbank_vetor', "Gera os embeddings dos chunks e indexa-os."),
+    'query': ('ollama_rag', "Responde a perguntas com RAG (uma pergunta ou modo interativo)."),
+    'serve': ('rag_server', "Inicia o servidor HTTP local de consultas RAG."),
+    'regime': ('grafo_interacoes', "Verifica todas as interações de um regime com várias drogas."),
+}
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    parser = argparse.ArgumentParser(
+        description="Pipeline RAG de antibióticos do DrugBank.",
+        epilog="Use '<subcomando> --help' para ver as opções de cada etapa.",
+    )
+    subparsers = parser.add_subparsers(dest='subcomando', metavar='subcomando', required=True)
+    for nome, (_, descricao) in SUBCOMANDOS.items():
+        # add_help=False: o --help depois do subcomando é tratado pelo módulo da etapa
+        subparsers.add_parser(nome, help=descricao, description=descricao, add_help=False)
+
+    # Só o nome do subcomando é analisado aqui; o resto pertence ao módulo
+    args = parser.parse_args(argv[:1])
+    modulo = importlib.import_module(SUBCOMANDOS[args.subcomando][0])
+    return modulo.main(argv[1:])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
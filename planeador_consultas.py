@@ -0,0 +1,154 @@
+# planeador_consultas.py
+# Planeador de consultas do RAG: antes da busca vetorial, classifica a intenção da pergunta
+# (dosagem, produtos, interações, farmacocinética, ...) e resolve as drogas que ela menciona.
+# O plano resultante indica, para cada chunk_type relevante, quantos chunks recuperar (quota)
+# e o filtro `where` do ChromaDB a aplicar, de modo que cada busca percorre só o subconjunto
+# certo da coleção em vez de competir com centenas de chunks 'drug_interaction' quase iguais.
+
+import re
+import unicodedata
+
+# Intenções reconhecidas: radicais (sem acentos, casefold) procurados no início de palavras
+# da pergunta e quotas de chunks por chunk_type, pela ordem em que entram no contexto.
+INTENCOES = {
+    'dosage': (
+        ['dose', 'dosag', 'posolog', 'mg', 'administr', 'route', 'strength',
+         'forma farmaceutic', 'comprimid', 'capsul', 'injet', 'inject', 'oral', 'intraven'],
+        {'dosage': 5, 'products': 2, 'summary': 1},
+    ),
+    'products': (
+        ['produt', 'product', 'marca', 'brand', 'nome comercia', 'comercializ', 'fabricant',
+         'labeller', 'generic', 'aprovad', 'approv'],
+        {'products': 5, 'dosage': 2, 'summary': 1},
+    ),
+    'drug_interaction': (
+        ['intera', 'combin', 'associa', 'tomar junto', 'together', 'coadministr'],
+        {'drug_interaction': 6, 'summary': 1},
+    ),
+    'food_interaction': (
+        ['aliment', 'comida', 'food', 'refeic', 'meal', 'jejum', 'leite', 'milk', 'alcool', 'alcohol', 'sumo', 'juice'],
+        {'food_interaction': 4, 'pharmacokinetics': 1, 'summary': 1},
+    ),
+    'pharmacokinetics': (
+        ['farmacocinet', 'pharmacokinet', 'absorc', 'absorpt', 'meia-vida', 'meia vida', 'half-life', 'half life',
+         'metaboli', 'eliminac', 'eliminat', 'excrec', 'excret', 'clearance', 'depurac', 'distribuic',
+         'distribution', 'ligacao a proteina', 'protein binding'],
+        {'pharmacokinetics': 4, 'pharmacology': 1, 'summary': 1},
+    ),
+    'pharmacology': (
+        ['mecanismo', 'mechanism', 'farmacodinam', 'pharmacodynam', 'como atua', 'como funciona', 'how does',
+         'indicac', 'indicat', 'indicad', 'para que serve', 'used for', 'tratament', 'treat'],
+        {'pharmacology': 4, 'summary': 2},
+    ),
+    'toxicity': (
+        ['toxic', 'overdose', 'sobredosag', 'efeito advers', 'efeitos advers', 'efeito colater',
+         'efeitos colater', 'side effect', 'adverse', 'ld50', 'seguranc', 'safety'],
+        {'toxicity': 4, 'pharmacology': 1, 'summary': 1},
+    ),
+    'target': (
+        ['alvo', 'target', 'receptor', 'protein', 'enzima', 'enzyme', 'uniprot', 'liga-se', 'binds'],
+        {'target': 5, 'pharmacology': 1},
+    ),
+    'synonyms': (
+        ['sinonim', 'synonym', 'outro nome', 'outros nomes', 'tambem conhecid', 'also known'],
+        {'synonyms': 2, 'summary': 1},
+    ),
+    'classification': (
+        ['class', 'categori', 'category', 'familia', 'grupo quimic', 'kingdom', 'superclass'],
+        {'classification': 3, 'summary': 1},
+    ),
+    'external_identifiers': (
+        ['identificador', 'identifier', 'numero cas', 'cas number', 'pubchem', 'kegg', 'chebi', 'chembl', 'id extern', 'external id'],
+        {'external_identifiers': 2, 'summary': 1},
+    ),
+}
+
+# Quotas quando a pergunta nomeia drogas mas nenhuma intenção específica é reconhecida
+QUOTAS_GERAIS = {'summary': 1, 'pharmacology': 2, 'pharmacokinetics': 1, 'toxicity': 1, 'dosage': 1, 'drug_interaction': 2}
+
+# Máximo de chunks de um plano, somando todas as quotas
+max_chunks_plano = 12
+
+_RE_DRUGBANK_ID = re.compile(r"\bDB\d{5}\b", re.IGNORECASE)
+
+# Um padrão compilado por intenção: qualquer radical no início de uma palavra
+_PADROES_INTENCAO = {
+    intencao: re.compile(r"\b(?:" + "|".join(re.escape(radical) for radical in sorted(radicais, key=len, reverse=True)) + ")")
+    for intencao, (radicais, _) in INTENCOES.items()
+}
+
+
+def _normalizar(texto):
+    texto = unicodedata.normalize('NFKD', texto)
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return " ".join(texto.casefold().split())
+
+
+def classificar_intencao(texto):
+    """Intenções reconhecidas na pergunta, da mais para a menos citada."""
+    texto = _normalizar(texto)
+    contagens = {}
+    for intencao, padrao in _PADROES_INTENCAO.items():
+        n = len(padrao.findall(texto))
+        if n:
+            contagens[intencao] = n
+    return sorted(contagens, key=lambda intencao: contagens[intencao], reverse=True)
+
+
+def resolver_medicamentos(texto, indice_pares=None):
+    """drugbank_ids citados na pergunta: IDs explícitos (DB00537) e nomes/sinônimos do índice de pares."""
+    ids = [m.group(0).upper() for m in _RE_DRUGBANK_ID.finditer(texto)]
+    if indice_pares is not None:
+        ids.extend(indice_pares.detetar_medicamentos(texto))
+    return list(dict.fromkeys(ids))
+
+
+def filtro_where(chunk_type, drugbank_ids):
+    """Filtro `where` do ChromaDB para um chunk_type e, se houver, as drogas do plano."""
+    if not drugbank_ids:
+        return {'chunk_type': chunk_type}
+    if len(drugbank_ids) == 1:
+        filtro_droga = {'drugbank_id': drugbank_ids[0]}
+    else:
+        filtro_droga = {'drugbank_id': {'$in': list(drugbank_ids)}}
+    return {'$and': [{'chunk_type': chunk_type}, filtro_droga]}
+
+
+def planear(texto, indice_pares=None):
+    """
+    Plano de recuperação para a pergunta, ou None se nada foi reconhecido (busca sem filtros).
+    Devolve {'intencoes': [...], 'drugbank_ids': [...], 'buscas': [(chunk_type, quota, where)]}.
+    """
+    intencoes = classificar_intencao(texto)
+    drugbank_ids = resolver_medicamentos(texto, indice_pares)
+    if not intencoes and not drugbank_ids:
+        return None
+
+    # Junta as quotas das intenções reconhecidas: primeiro o chunk_type principal de cada
+    # intenção, depois os complementares; a maior quota de cada chunk_type prevalece
+    tipos_por_intencao = [list(INTENCOES[intencao][1].items()) for intencao in intencoes]
+    principais = [tipos[0] for tipos in tipos_por_intencao]
+    complementares = [item for tipos in tipos_por_intencao for item in tipos[1:]]
+    quotas = {}
+    for chunk_type, quota in principais + complementares:
+        quotas[chunk_type] = max(quotas.get(chunk_type, 0), quota)
+    if not quotas:
+        quotas = dict(QUOTAS_GERAIS)
+
+    buscas = []
+    restantes = max_chunks_plano
+    for chunk_type, quota in quotas.items():
+        quota = min(quota, restantes)
+        if quota <= 0:
+            break
+        buscas.append((chunk_type, quota, filtro_where(chunk_type, drugbank_ids)))
+        restantes -= quota
+
+    return {'intencoes': intencoes, 'drugbank_ids': drugbank_ids, 'buscas': buscas}
+
+
+def descrever_plano(plano):
+    """Resumo legível do plano para os logs."""
+    buscas = ", ".join(f"{chunk_type}={quota}" for chunk_type, quota, _ in plano['buscas'])
+    return (f"intenções: {', '.join(plano['intencoes']) or 'geral'} | "
+            f"drogas: {', '.join(plano['drugbank_ids']) or 'todas'} | quotas: {buscas}")
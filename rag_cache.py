@@ -0,0 +1,368 @@
+# rag_cache.py
+# Caches do pipeline RAG, partilhadas pelo REPL e pelo servidor.
+#
+# CacheEmbeddings: embeddings das perguntas. As chaves são normalizadas (maiúsculas/minúsculas
+# e espaços não contam), a memória é limitada com expulsão LRU e TTL, e um SQLite opcional
+# guarda os embeddings entre reinícios, indexados pelo nome do modelo e pelo hash da pergunta.
+# O SQLite também é limitado: as linhas expiradas e as mais antigas acima de max_linhas_sqlite
+# são apagadas na abertura e periodicamente, e as inserções são gravadas em commits agrupados.
+#
+# CacheRespostas: respostas do LLM para perguntas semelhantes que recuperam o mesmo contexto,
+# invalidada automaticamente quando a coleção é reindexada.
+#
+# CachePontuacoes: pontuações do cross-encoder de re-ranking por (pergunta, chunk_id), para que
+# uma pergunta repetida (ou com candidatos em comum) só pontue os chunks ainda não vistos.
+
+import collections
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+import uuid
+
+import numpy as np
+
+# SQLite da CacheEmbeddings: inserções por commit, intervalo máximo (s) até gravar as pendentes
+# e inserções entre duas limpezas das linhas expiradas ou em excesso
+sqlite_inserts_por_commit = 64
+sqlite_intervalo_commit_s = 5.0
+sqlite_inserts_por_limpeza = 1024
+
+
+def normalizar_query(texto):
+    """Normaliza a pergunta para a chave da cache (Unicode NFKC, casefold, espaços colapsados)."""
+    return " ".join(unicodedata.normalize('NFKC', texto).casefold().split())
+
+
+def hash_query(texto):
+    """Hash SHA-256 da pergunta normalizada."""
+    return hashlib.sha256(normalizar_query(texto).encode('utf-8')).hexdigest()
+
+
+class CacheEmbeddings:
+    """Cache LRU/TTL de embeddings de perguntas, com limite de memória e armazenamento opcional em SQLite."""
+
+    def __init__(self, model_name, max_bytes=64 * 1024 * 1024, ttl_s=None, caminho_sqlite=None,
+                 max_linhas_sqlite=200_000):
+        self.model_name = model_name
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self.max_linhas_sqlite = max_linhas_sqlite
+        self._entradas = collections.OrderedDict()  # hash -> (embedding, instante de criação)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_hits = 0
+
+        self._db = None
+        self._inserts_pendentes = 0
+        self._inserts_desde_limpeza = 0
+        self._ultimo_commit = time.monotonic()
+        if caminho_sqlite:
+            self._db = sqlite3.connect(caminho_sqlite, check_same_thread=False)
+            # WAL + synchronous=NORMAL: um commit não força um fsync do arquivo principal
+            self._db.execute("PRAGMA journal_mode = WAL")
+            self._db.execute("PRAGMA synchronous = NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                " model TEXT NOT NULL, query_hash TEXT NOT NULL, embedding BLOB NOT NULL, criado REAL NOT NULL,"
+                " PRIMARY KEY (model, query_hash)) WITHOUT ROWID"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS query_embeddings_criado ON query_embeddings (criado)")
+            self._limpar_sqlite()
+            self._db.commit()
+
+    def _expirado(self, criado):
+        return self.ttl_s is not None and time.time() - criado > self.ttl_s
+
+    def _limpar_sqlite(self):
+        """Apaga do SQLite as linhas expiradas e, acima de max_linhas_sqlite, as mais antigas."""
+        if self.ttl_s is not None:
+            self._db.execute("DELETE FROM query_embeddings WHERE criado < ?", (time.time() - self.ttl_s,))
+        if self.max_linhas_sqlite is not None:
+            (total,) = self._db.execute("SELECT COUNT(*) FROM query_embeddings").fetchone()
+            if total > self.max_linhas_sqlite:
+                self._db.execute(
+                    "DELETE FROM query_embeddings WHERE (model, query_hash) IN ("
+                    " SELECT model, query_hash FROM query_embeddings ORDER BY criado LIMIT ?)",
+                    (total - self.max_linhas_sqlite,))
+        self._inserts_desde_limpeza = 0
+
+    def _commit(self):
+        self._db.commit()
+        self._inserts_pendentes = 0
+        self._ultimo_commit = time.monotonic()
+
+    def _inserir_memoria(self, chave, embedding, criado):
+        """Insere na memória e expulsa as entradas menos usadas até respeitar max_bytes."""
+        antigo = self._entradas.pop(chave, None)
+        if antigo is not None:
+            self._bytes -= antigo[0].nbytes
+        self._entradas[chave] = (embedding, criado)
+        self._bytes += embedding.nbytes
+        while self._bytes > self.max_bytes and len(self._entradas) > 1:
+            _, (expulso, _) = self._entradas.popitem(last=False)
+            self._bytes -= expulso.nbytes
+            self.evictions += 1
+
+    def obter(self, query_text):
+        """Devolve o embedding guardado para a pergunta (float32) ou None."""
+        chave = hash_query(query_text)
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is not None:
+                if not self._expirado(entrada[1]):
+                    self._entradas.move_to_end(chave)
+                    self.hits += 1
+                    return entrada[0]
+                del self._entradas[chave]
+                self._bytes -= entrada[0].nbytes
+                self.evictions += 1
+
+            if self._db is not None:
+                linha = self._db.execute(
+                    "SELECT embedding, criado FROM query_embeddings WHERE model = ? AND query_hash = ?",
+                    (self.model_name, chave)).fetchone()
+                if linha is not None and not self._expirado(linha[1]):
+                    embedding = np.frombuffer(linha[0], dtype=np.float32)
+                    self._inserir_memoria(chave, embedding, linha[1])
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return embedding
+
+            self.misses += 1
+            return None
+
+    def guardar(self, query_text, embedding):
+        """Guarda o embedding da pergunta na memória e, se configurado, no SQLite."""
+        chave = hash_query(query_text)
+        embedding = np.asarray(embedding, dtype=np.float32)
+        criado = time.time()
+        with self._lock:
+            self._inserir_memoria(chave, embedding, criado)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO query_embeddings (model, query_hash, embedding, criado) VALUES (?, ?, ?, ?)",
+                    (self.model_name, chave, embedding.tobytes(), criado))
+                self._inserts_pendentes += 1
+                self._inserts_desde_limpeza += 1
+                if self._inserts_desde_limpeza >= sqlite_inserts_por_limpeza:
+                    self._limpar_sqlite()
+                    self._commit()
+                elif (self._inserts_pendentes >= sqlite_inserts_por_commit
+                      or time.monotonic() - self._ultimo_commit >= sqlite_intervalo_commit_s):
+                    self._commit()
+
+    def estatisticas(self):
+        """Contadores de utilização da cache."""
+        with self._lock:
+            return {
+                'entradas': len(self._entradas),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'disk_hits': self.disk_hits,
+            }
+
+    def fechar(self):
+        """Grava as inserções pendentes e fecha o SQLite."""
+        with self._lock:
+            if self._db is not None:
+                self._commit()
+                self._db.close()
+                self._db = None
+
+
+# --- Versão do índice ---
+# drugbank_vetor.py grava um identificador novo neste arquivo (dentro de chroma_db_path)
+# sempre que a coleção muda; as caches que dependem do conteúdo indexado comparam-no
+# para se invalidarem automaticamente após uma reindexação.
+arquivo_versao_indice = 'indice_versao.txt'
+
+
+def ler_versao_indice(chroma_db_path):
+    """Identificador da última indexação da coleção, ou None se nunca foi gravado."""
+    try:
+        with open(os.path.join(chroma_db_path, arquivo_versao_indice), 'r', encoding='utf-8') as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def escrever_versao_indice(chroma_db_path):
+    """Grava um novo identificador de versão do índice e devolve-o."""
+    versao = f"{time.time_ns()}-{uuid.uuid4().hex[:8]}"
+    caminho = os.path.join(chroma_db_path, arquivo_versao_indice)
+    temporario = caminho + '.tmp'
+    with open(temporario, 'w', encoding='utf-8') as f:
+        f.write(versao)
+    os.replace(temporario, caminho)
+    return versao
+
+
+class CacheRespostas:
+    """
+    Cache de respostas do LLM indexada pelo modelo e pela lista ordenada de chunk_ids recuperados.
+    Dentro da mesma chave, só há hit se o embedding da pergunta tiver similaridade de cosseno
+    >= `similaridade_minima` com o de uma pergunta já respondida; cada chave guarda no máximo
+    `max_por_chave` perguntas. A cache é esvaziada sempre que `versao_indice()` muda
+    (coleção reindexada).
+    """
+
+    def __init__(self, similaridade_minima=0.9, max_entradas=2048, max_por_chave=16, versao_indice=None):
+        self.similaridade_minima = similaridade_minima
+        self.max_entradas = max_entradas
+        self.max_por_chave = max_por_chave
+        self.versao_indice = versao_indice
+        self._versao = versao_indice() if versao_indice else None
+        self._chaves = collections.OrderedDict()  # (modelo, chunk_ids) -> deque([(embedding normalizado, resposta)])
+        self._total = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidacoes = 0
+
+    @staticmethod
+    def _normalizar(embedding):
+        embedding = np.asarray(embedding, dtype=np.float32)
+        norma = np.linalg.norm(embedding)
+        return embedding / norma if norma else embedding
+
+    def _verificar_versao(self):
+        """Esvazia a cache se o índice foi reconstruído desde a última verificação."""
+        if self.versao_indice is None:
+            return
+        versao = self.versao_indice()
+        if versao != self._versao:
+            if self._total:
+                self.invalidacoes += 1
+            self._chaves.clear()
+            self._total = 0
+            self._versao = versao
+
+    def obter(self, model_name, chunk_ids, query_embedding):
+        """Devolve a resposta guardada para uma pergunta semelhante com o mesmo contexto, ou None."""
+        chave = (model_name, tuple(chunk_ids))
+        consulta = self._normalizar(query_embedding)
+        with self._lock:
+            self._verificar_versao()
+            entradas = self._chaves.get(chave)
+            if entradas:
+                for embedding, resposta in entradas:
+                    if float(np.dot(embedding, consulta)) >= self.similaridade_minima:
+                        self._chaves.move_to_end(chave)
+                        self.hits += 1
+                        return resposta
+            self.misses += 1
+            return None
+
+    def guardar(self, model_name, chunk_ids, query_embedding, resposta):
+        """
+        Guarda a resposta. Expulsa a pergunta mais antiga da chave quando ela passa de
+        max_por_chave, e as chaves menos usadas quando há mais de max_entradas (por fim, se só
+        restar esta chave, as suas perguntas mais antigas).
+        """
+        chave = (model_name, tuple(chunk_ids))
+        with self._lock:
+            self._verificar_versao()
+            entradas = self._chaves.get(chave)
+            if entradas is None:
+                entradas = self._chaves[chave] = collections.deque()
+            entradas.append((self._normalizar(query_embedding), resposta))
+            self._chaves.move_to_end(chave)
+            self._total += 1
+            while self._total > self.max_entradas and len(self._chaves) > 1:
+                _, expulsas = self._chaves.popitem(last=False)
+                self._total -= len(expulsas)
+                self.evictions += len(expulsas)
+            while len(entradas) > 1 and (len(entradas) > self.max_por_chave or self._total > self.max_entradas):
+                entradas.popleft()
+                self._total -= 1
+                self.evictions += 1
+
+    def estatisticas(self):
+        """Contadores de utilização da cache."""
+        with self._lock:
+            return {
+                'entradas': self._total,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidacoes': self.invalidacoes,
+            }
+
+
+class CachePontuacoes:
+    """
+    Cache LRU das pontuações de um cross-encoder, indexada pelo hash da pergunta normalizada
+    e pelo chunk_id. Como as respostas, é esvaziada sempre que `versao_indice()`
+    muda, porque o mesmo chunk_id pode ter outro texto depois de uma reindexação.
+    """
+
+    def __init__(self, max_entradas=65536, versao_indice=None):
+        self.max_entradas = max_entradas
+        self.versao_indice = versao_indice
+        self._versao = versao_indice() if versao_indice else None
+        self._entradas = collections.OrderedDict()  # (hash da pergunta, chunk_id) -> pontuação
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidacoes = 0
+
+    def _verificar_versao(self):
+        if self.versao_indice is None:
+            return
+        versao = self.versao_indice()
+        if versao != self._versao:
+            if self._entradas:
+                self.invalidacoes += 1
+            self._entradas.clear()
+            self._versao = versao
+
+    def obter(self, query_text, chunk_ids):
+        """Pontuações guardadas de cada chunk_id para a pergunta (None nas que faltam)."""
+        consulta = hash_query(query_text)
+        pontuacoes = []
+        with self._lock:
+            self._verificar_versao()
+            for chunk_id in chunk_ids:
+                chave = (consulta, chunk_id)
+                pontuacao = self._entradas.get(chave)
+                if pontuacao is None:
+                    self.misses += 1
+                else:
+                    self._entradas.move_to_end(chave)
+                    self.hits += 1
+                pontuacoes.append(pontuacao)
+        return pontuacoes
+
+    def guardar(self, query_text, chunk_ids, pontuacoes):
+        """Guarda as pontuações dos chunk_ids e expulsa as menos usadas acima de max_entradas."""
+        consulta = hash_query(query_text)
+        with self._lock:
+            self._verificar_versao()
+            for chunk_id, pontuacao in zip(chunk_ids, pontuacoes):
+                chave = (consulta, chunk_id)
+                self._entradas[chave] = float(pontuacao)
+                self._entradas.move_to_end(chave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+                self.evictions += 1
+
+    def estatisticas(self):
+        """Contadores de utilização da cache."""
+        with self._lock:
+            return {
+                'entradas': len(self._entradas),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidacoes': self.invalidacoes,
+            }
@@ -0,0 +1,452 @@
+# rag_server.py
+# Servidor HTTP local (TCP ou Unix socket) que mantém o modelo de embedding, a coleção
+# do ChromaDB e a ligação ao Ollama carregados entre pedidos. O front end é asyncio;
+# as chamadas bloqueantes (encode e collection.query) correm num pool de threads limitado.
+# Os pedidos que chegam quase ao mesmo tempo são recuperados em micro-lotes: um só encode
+# e uma só collection.query com os embeddings de todos (ver AgrupadorRecuperacao).
+#
+#   python rag_server.py --port 8765
+#   curl -s localhost:8765/query -d '{"query": "Interações da amoxicilina com a varfarina?"}'
+#
+# Endpoints:
+#   GET  /health    -> estado do servidor e número de chunks na coleção
+#   GET  /metrics   -> latência por etapa do pipeline (p50/p95/p99, em ms)
+#   POST /retrieve  -> {"query": ...} devolve só os chunks recuperados (sem LLM)
+#   POST /query     -> {"query": ...} devolve a resposta do LLM e os chunks usados
+#                      {"query": ..., "stream": true} devolve NDJSON em chunked encoding:
+#                      um evento {"token": ...} por pedaço gerado e um evento final
+#                      {"done": true, "metricas": ..., "chunks": ...}
+
+import argparse
+import asyncio
+import concurrent.futures
+import contextvars
+import json
+import logging
+
+import instrumentacao
+import ollama_cliente
+import ollama_rag
+
+logger = logging.getLogger(__name__)
+
+# --- Configurações ---
+host = '127.0.0.1'
+port = 8765
+# Número máximo de threads para encode/query (chamadas bloqueantes)
+max_threads_recuperacao = 4
+# Número máximo de pedidos ao LLM em simultâneo
+max_llm_concorrentes = 2
+# Tamanho máximo aceite para o corpo de um pedido (bytes)
+max_tamanho_pedido = 64 * 1024
+# Micro-lotes de recuperação: pedidos que chegam dentro de janela_lote_ms são recuperados juntos,
+# até max_lote_recuperacao por lote (0 ms = cada pedido é recuperado sozinho)
+janela_lote_ms = 5
+max_lote_recuperacao = 32
+
+STATUS_HTTP = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+               413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+
+class ErroPedido(Exception):
+    """Pedido HTTP inválido; `status` é o código devolvido ao cliente."""
+
+    def __init__(self, status, mensagem):
+        super().__init__(mensagem)
+        self.status = status
+
+
+class AgrupadorRecuperacao:
+    """
+    Junta os pedidos de recuperação que chegam dentro de `janela_s` (ou até `max_lote` pedidos)
+    e recupera-os numa única chamada ao pool de threads, com ollama_rag.recuperar_chunks_em_lote.
+    As etapas do lote são copiadas para o rastreio de cada pedido (com o id do lote). Se o lote
+    falhar, cada pedido é recuperado sozinho, para que só os pedidos com erro recebam a exceção.
+    """
+
+    def __init__(self, executor, janela_s, max_lote):
+        self.executor = executor
+        self.janela_s = janela_s
+        self.max_lote = max_lote
+        self._pendentes = []  # (pergunta, futuro do pedido, contexto do pedido)
+        self._temporizador = None
+        self._tarefas = set()
+        self.lotes = 0
+        self.pedidos = 0
+        self.falhas = 0
+
+    async def recuperar(self, query_text):
+        """Espera pelo lote do pedido e devolve (embedding, recuperados), como recuperar_com_embedding."""
+        loop = asyncio.get_running_loop()
+        futuro = loop.create_future()
+        self._pendentes.append((query_text, futuro, contextvars.copy_context()))
+        if len(self._pendentes) >= self.max_lote:
+            self._despachar()
+        elif self._temporizador is None:
+            self._temporizador = loop.call_later(self.janela_s, self._despachar)
+        return await futuro
+
+    def _despachar(self):
+        if self._temporizador is not None:
+            self._temporizador.cancel()
+            self._temporizador = None
+        lote, self._pendentes = self._pendentes, []
+        if lote:
+            tarefa = asyncio.get_running_loop().create_task(self._executar(lote))
+            self._tarefas.add(tarefa)
+            tarefa.add_done_callback(self._tarefas.discard)
+
+    async def _executar(self, lote):
+        self.lotes += 1
+        self.pedidos += len(lote)
+        loop = asyncio.get_running_loop()
+        try:
+            resultados, etapas = await loop.run_in_executor(
+                self.executor, _recuperar_lote_com_embedding, [query_text for query_text, _, _ in lote])
+        except Exception as e:
+            logger.warning(f"Falha na recuperação de um lote de {len(lote)} pedido(s) ({e}); "
+                           "recuperando cada pedido sozinho.")
+            self.falhas += 1
+            await asyncio.gather(*(self._executar_sozinho(*pedido) for pedido in lote))
+            return
+        for (_, futuro, contexto), resultado in zip(lote, resultados):
+            rastreio = contexto.run(instrumentacao.rastreio_atual)
+            if rastreio is not None:
+                rastreio.incorporar(etapas, lote=etapas.id, pedidos_no_lote=len(lote))
+            # O pedido pode ter sido cancelado entretanto (ligação fechada)
+            if not futuro.done():
+                futuro.set_result(resultado)
+
+    async def _executar_sozinho(self, query_text, futuro, contexto):
+        """Recupera um pedido fora do lote, no seu próprio contexto (e rastreio)."""
+        if futuro.done():
+            return
+        loop = asyncio.get_running_loop()
+        try:
+            resultado = await loop.run_in_executor(self.executor, contexto.run, _recuperar_com_embedding, query_text)
+        except Exception as e:
+            if not futuro.done():
+                futuro.set_exception(e)
+            return
+        if not futuro.done():
+            futuro.set_result(resultado)
+
+    def estatisticas(self):
+        """Número de lotes e de pedidos recuperados em lote."""
+        return {'lotes': self.lotes, 'pedidos': self.pedidos, 'lotes_com_falha': self.falhas,
+                'media_por_lote': round(self.pedidos / self.lotes, 2) if self.lotes else 0.0}
+
+
+class ServidorRAG:
+    """Mantém os recursos do RAG carregados e responde aos pedidos HTTP."""
+
+    def __init__(self, threads=max_threads_recuperacao, llm_concorrentes=max_llm_concorrentes,
+                 janela_lote_ms=janela_lote_ms, max_lote=max_lote_recuperacao):
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=threads, thread_name_prefix='rag')
+        self.agrupador = (AgrupadorRecuperacao(self.executor, janela_lote_ms / 1000, max_lote)
+                          if janela_lote_ms > 0 else None)
+        self.llm_semaforo = asyncio.Semaphore(llm_concorrentes)
+        # Um único cliente assíncrono: a ligação HTTP ao Ollama é reutilizada entre pedidos
+        self.llm_cliente = ollama_cliente.criar_cliente_async()
+
+    async def preparar(self):
+        """Carrega o modelo e a coleção, e pede ao Ollama para carregar o LLM em memória."""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, ollama_rag.inicializar)
+        try:
+            # Carrega o modelo e deixa o prefixo de sistema já avaliado na KV-cache
+            await ollama_cliente.apre_carregar(self.llm_cliente, ollama_rag.llm_model_name, ollama_rag.system_prompt_rag)
+            logger.info(f"Modelo LLM '{ollama_rag.llm_model_name}' carregado no Ollama.")
+        except Exception as e:
+            logger.warning(f"Aviso: não foi possível pré-carregar o modelo no Ollama: {e}")
+
+    async def recuperar(self, query_text):
+        """Executa a recuperação (encode + collection.query) no pool de threads."""
+        _, recuperados = await self.recuperar_com_embedding(query_text)
+        return recuperados
+
+    async def recuperar_com_embedding(self, query_text):
+        """Como recuperar, mas devolve também o embedding da pergunta: (embedding, recuperados)."""
+        if self.agrupador is not None:
+            return await self.agrupador.recuperar(query_text)
+        loop = asyncio.get_running_loop()
+        # Copia o contexto para as etapas da thread entrarem no rastreio do pedido
+        contexto = contextvars.copy_context()
+        return await loop.run_in_executor(self.executor, contexto.run, _recuperar_com_embedding, query_text)
+
+    def responder_stream(self, query_text):
+        """
+        RAG completo: recuperação no pool de threads e geração via cliente assíncrono do Ollama.
+        Gera um evento {'token': ...} por pedaço da resposta e um evento final com métricas e chunks.
+        """
+        return instrumentacao.arastrear_stream(self._responder_stream(query_text), 'rag',
+                                               ollama_rag.diretorio_rastreios, etapa_total='rag_total')
+
+    async def _responder_stream(self, query_text):
+        query_embedding, recuperados = await self.recuperar_com_embedding(query_text)
+        ids, chunks, metadatas, distances = recuperados
+        metricas = {}
+
+        resposta_em_cache = ollama_rag.obter_resposta_em_cache(ids, query_embedding, metricas) if chunks else None
+        if not chunks:
+            yield {'token': ollama_rag.resposta_sem_contexto}
+        elif resposta_em_cache is not None:
+            yield {'token': resposta_em_cache}
+        else:
+            messages = ollama_rag.construir_mensagens(query_text, chunks, metadatas, distances, metricas)
+            partes = []
+            async with self.llm_semaforo:
+                try:
+                    async for token in ollama_cliente.achat_stream(
+                            self.llm_cliente, ollama_rag.llm_model_name, messages, metricas):
+                        partes.append(token)
+                        yield {'token': token}
+                except Exception as e:
+                    logger.error(f"Erro ao chamar o Ollama: {e}")
+                    partes = None
+                    yield {'token': ollama_rag.resposta_erro_llm}
+            if partes is not None and ollama_rag.answer_cache is not None:
+                ollama_rag.answer_cache.guardar(ollama_rag.llm_model_name, ids, query_embedding, ''.join(partes))
+
+        yield {'done': True, 'metricas': metricas, 'chunks': formatar_chunks(*recuperados)}
+
+    async def responder(self, query_text):
+        """Igual a responder_stream, mas devolve a resposta completa num único objeto."""
+        partes = []
+        final = {}
+        async for evento in self.responder_stream(query_text):
+            if 'token' in evento:
+                partes.append(evento['token'])
+            else:
+                final = evento
+        return {'query': query_text, 'answer': ''.join(partes),
+                'metricas': final.get('metricas'), 'chunks': final.get('chunks')}
+
+    async def tratar_pedido(self, metodo, caminho, corpo):
+        """
+        Encaminha um pedido para o endpoint correspondente. Devolve (status, payload), onde
+        payload é um dicionário ou, para respostas em streaming, um gerador assíncrono de eventos.
+        """
+        if caminho == '/health':
+            if ollama_rag.collection is None:
+                return 200, {'status': 'a iniciar', 'chunks': 0}
+            return 200, {'status': 'ok', 'chunks': ollama_rag.collection.count(),
+                         'query_cache': ollama_rag.query_embedding_cache.estatisticas(),
+                         'answer_cache': ollama_rag.answer_cache.estatisticas() if ollama_rag.answer_cache else None,
+                         'reranker_cache': (ollama_rag.reordenador.cache.estatisticas()
+                                            if ollama_rag.reordenador else None),
+                         'lotes_recuperacao': self.agrupador.estatisticas() if self.agrupador else None}
+
+        if caminho == '/metrics':
+            return 200, instrumentacao.registo.resumo()
+
+        if caminho not in ('/retrieve', '/query'):
+            raise ErroPedido(404, f"Endpoint desconhecido: {caminho}")
+        if metodo != 'POST':
+            raise ErroPedido(405, "Use POST com um corpo JSON {\"query\": ...}")
+
+        try:
+            pedido = json.loads(corpo or b'{}')
+            query_text = pedido.get('query', '').strip()
+        except (ValueError, AttributeError):
+            raise ErroPedido(400, "O corpo do pedido deve ser um objeto JSON.")
+        if not query_text:
+            raise ErroPedido(400, "Campo 'query' em falta ou vazio.")
+
+        if caminho == '/retrieve':
+            recuperados = await self.recuperar(query_text)
+            return 200, {'query': query_text, 'chunks': formatar_chunks(*recuperados)}
+
+        if pedido.get('stream'):
+            eventos = self.responder_stream(query_text)
+            # O primeiro evento só é gerado depois da recuperação: uma falha até aí (ChromaDB,
+            # encoder) ainda é devolvida como 500, antes do status 200 e dos cabeçalhos do stream
+            primeiro = await eventos.__anext__()
+            return 200, _com_primeiro(primeiro, eventos)
+        return 200, await self.responder(query_text)
+
+    async def tratar_ligacao(self, reader, writer):
+        """Lê pedidos HTTP/1.1 de uma ligação (com keep-alive) e escreve as respostas."""
+        try:
+            while True:
+                try:
+                    pedido = await ler_pedido(reader)
+                except ErroPedido as e:
+                    await escrever_resposta(writer, e.status, {'error': str(e)}, manter=False)
+                    break
+                if pedido is None:
+                    break
+                metodo, caminho, headers, corpo = pedido
+                manter = headers.get('connection', '').lower() != 'close'
+                try:
+                    status, payload = await self.tratar_pedido(metodo, caminho, corpo)
+                except ErroPedido as e:
+                    status, payload = e.status, {'error': str(e)}
+                except Exception as e:
+                    logger.error(f"Erro ao processar pedido {metodo} {caminho}: {e}")
+                    status, payload = 500, {'error': str(e)}
+                if isinstance(payload, dict):
+                    await escrever_resposta(writer, status, payload, manter)
+                else:
+                    await escrever_stream(writer, payload, manter)
+                if not manter:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def fechar(self):
+        self.executor.shutdown(wait=False)
+
+
+def _recuperar_com_embedding(query_text):
+    """Executado no pool de threads: embedding da pergunta (com cache) e busca dos chunks."""
+    query_embedding = ollama_rag.embedding_da_query(query_text)
+    return query_embedding, ollama_rag.recuperar_chunks(query_text, query_embedding)
+
+
+def _recuperar_lote_com_embedding(query_texts):
+    """
+    Executado no pool de threads: embeddings de um lote de perguntas num só encode e busca de
+    todas juntas. Devolve ([(embedding, recuperados)] por pergunta, rastreio com as etapas do lote).
+    """
+    with instrumentacao.recolher_etapas() as etapas, instrumentacao.etapa('recuperacao_lote', n=len(query_texts)):
+        query_embeddings = ollama_rag.embeddings_das_queries(query_texts)
+        resultados = list(zip(query_embeddings, ollama_rag.recuperar_chunks_em_lote(query_texts, query_embeddings)))
+    return resultados, etapas
+
+
+async def _com_primeiro(primeiro, eventos):
+    """Volta a pôr à frente do stream o evento já lido."""
+    try:
+        yield primeiro
+        async for evento in eventos:
+            yield evento
+    finally:
+        await eventos.aclose()
+
+
+def formatar_chunks(ids, chunks, metadatas, distances):
+    """Lista de chunks recuperados, no formato devolvido pela API."""
+    return [
+        {'chunk_id': chunk_id, 'metadata': metadata, 'distance': distance, 'content': content}
+        for chunk_id, content, metadata, distance in zip(ids, chunks, metadatas, distances)
+    ]
+
+
+async def ler_pedido(reader):
+    """Lê um pedido HTTP. Devolve (método, caminho, headers, corpo) ou None se a ligação fechou."""
+    linha = await reader.readline()
+    if not linha:
+        return None
+    try:
+        metodo, caminho, _ = linha.decode('latin-1').split(' ', 2)
+    except ValueError:
+        raise ErroPedido(400, "Linha de pedido HTTP inválida.")
+
+    headers = {}
+    while True:
+        linha = await reader.readline()
+        if linha in (b'\r\n', b'\n', b''):
+            break
+        nome, _, valor = linha.decode('latin-1').partition(':')
+        headers[nome.strip().lower()] = valor.strip()
+
+    tamanho = int(headers.get('content-length', 0) or 0)
+    if tamanho > max_tamanho_pedido:
+        raise ErroPedido(413, f"Pedido maior que {max_tamanho_pedido} bytes.")
+    corpo = await reader.readexactly(tamanho) if tamanho else b''
+    return metodo.upper(), caminho.split('?', 1)[0], headers, corpo
+
+
+async def escrever_resposta(writer, status, payload, manter=True):
+    """Escreve uma resposta HTTP com corpo JSON."""
+    corpo = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    cabecalho = (
+        f"HTTP/1.1 {status} {STATUS_HTTP.get(status, '')}\r\n"
+        "Content-Type: application/json; charset=utf-8\r\n"
+        f"Content-Length: {len(corpo)}\r\n"
+        f"Connection: {'keep-alive' if manter else 'close'}\r\n\r\n"
+    )
+    writer.write(cabecalho.encode('latin-1') + corpo)
+    await writer.drain()
+
+
+async def escrever_stream(writer, eventos, manter=True):
+    """
+    Escreve uma resposta HTTP em chunked encoding, com um evento JSON por linha (NDJSON).
+    Um erro do gerador depois de enviado o status 200 é comunicado num evento final
+    {"error": ...}, e o stream é sempre terminado corretamente.
+    """
+    cabecalho = (
+        "HTTP/1.1 200 OK\r\n"
+        "Content-Type: application/x-ndjson; charset=utf-8\r\n"
+        "Transfer-Encoding: chunked\r\n"
+        f"Connection: {'keep-alive' if manter else 'close'}\r\n\r\n"
+    )
+    writer.write(cabecalho.encode('latin-1'))
+    try:
+        async for evento in eventos:
+            await _escrever_evento(writer, evento)
+    except ConnectionError:
+        raise
+    except Exception as e:
+        logger.error(f"Erro durante a resposta em streaming: {e}")
+        await _escrever_evento(writer, {'error': str(e)})
+    finally:
+        # Um cliente que desliga a meio não deixa o gerador por fechar (nem o LLM a gerar)
+        await eventos.aclose()
+    writer.write(b"0\r\n\r\n")
+    await writer.drain()
+
+
+async def _escrever_evento(writer, evento):
+    linha = (json.dumps(evento, ensure_ascii=False) + '\n').encode('utf-8')
+    writer.write(f"{len(linha):X}\r\n".encode('latin-1') + linha + b"\r\n")
+    await writer.drain()
+
+
+async def servir(args):
+    servidor = ServidorRAG(threads=args.threads, llm_concorrentes=args.llm_concorrentes,
+                           janela_lote_ms=args.janela_lote_ms, max_lote=args.max_lote)
+    await servidor.preparar()
+
+    if args.unix_socket:
+        server = await asyncio.start_unix_server(servidor.tratar_ligacao, path=args.unix_socket)
+        logger.info(f"Servidor RAG à escuta em unix:{args.unix_socket}")
+    else:
+        server = await asyncio.start_server(servidor.tratar_ligacao, host=args.host, port=args.port)
+        logger.info(f"Servidor RAG à escuta em http://{args.host}:{args.port}")
+
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        servidor.fechar()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor HTTP local para consultas RAG com recursos sempre carregados.")
+    parser.add_argument('--host', default=host)
+    parser.add_argument('--port', type=int, default=port)
+    parser.add_argument('--unix-socket', help="Escutar num Unix socket em vez de TCP.")
+    parser.add_argument('--threads', type=int, default=max_threads_recuperacao,
+                        help="Threads para as chamadas bloqueantes de encode/query.")
+    parser.add_argument('--llm-concorrentes', type=int, default=max_llm_concorrentes,
+                        help="Pedidos simultâneos máximos ao Ollama.")
+    parser.add_argument('--janela-lote-ms', type=float, default=janela_lote_ms,
+                        help="Janela para agrupar pedidos de recuperação num lote (0 = sem lotes).")
+    parser.add_argument('--max-lote', type=int, default=max_lote_recuperacao,
+                        help="Pedidos máximos por lote de recuperação.")
+    args = parser.parse_args(argv)
+    instrumentacao.configurar_logging()
+
+    try:
+        asyncio.run(servir(args))
+    except KeyboardInterrupt:
+        logger.info("Servidor encerrado.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# reordenador.py
+# Re-ranking dos chunks recuperados com um cross-encoder.
+#
+# O bi-encoder (all-MiniLM-L6-v2) compara embeddings calculados separadamente para a
+# pergunta e para o chunk; um cross-encoder lê os dois textos juntos e ordena muito
+# melhor, mas é caro demais para toda a coleção. Por isso a recuperação devolve um
+# conjunto maior de candidatos baratos (ex.: 20) e o cross-encoder só pontua esses pares
+# (pergunta, chunk), em lotes no CPU, ficando os n melhores (ex.: 4-6) para o contexto.
+#   - o modelo é carregado uma vez, em Reordenador();
+#   - as pontuações ficam numa CachePontuacoes por (hash da pergunta, chunk_id): uma
+#     pergunta repetida, ou com candidatos em comum, só pontua os chunks ainda não vistos.
+
+import logging
+
+import instrumentacao
+
+logger = logging.getLogger(__name__)
+
+# Pares (pergunta, chunk) por lote do cross-encoder
+tamanho_lote = 32
+
+
+class Reordenador:
+    """Cross-encoder carregado uma vez, com as pontuações em cache."""
+
+    def __init__(self, model_name, cache=None, device='cpu'):
+        # Importado só aqui: o re-ranking é opcional e o sentence_transformers demora a carregar
+        from sentence_transformers import CrossEncoder
+        logger.info(f"Carregando cross-encoder de re-ranking: {model_name}")
+        self.model_name = model_name
+        self.modelo = CrossEncoder(model_name, device=device)
+        self.cache = cache
+
+    def pontuar(self, query_text, chunk_ids, documentos):
+        """Pontuação de cada (pergunta, documento); só os pares fora da cache vão ao modelo, num único predict."""
+        if self.cache is not None:
+            pontuacoes = self.cache.obter(query_text, chunk_ids)
+        else:
+            pontuacoes = [None] * len(chunk_ids)
+        em_falta = [i for i, pontuacao in enumerate(pontuacoes) if pontuacao is None]
+        if em_falta:
+            with instrumentacao.etapa('cross_encoder', n=len(em_falta)):
+                novas = self.modelo.predict([(query_text, documentos[i]) for i in em_falta],
+                                            batch_size=tamanho_lote, show_progress_bar=False)
+            novas = [float(pontuacao) for pontuacao in novas]
+            for i, pontuacao in zip(em_falta, novas):
+                pontuacoes[i] = pontuacao
+            if self.cache is not None:
+                self.cache.guardar(query_text, [chunk_ids[i] for i in em_falta], novas)
+        return pontuacoes
+
+    def reordenar(self, query_text, ids, documentos, metadatas, distancias, top_n):
+        """
+        Ordena os candidatos pela pontuação do cross-encoder e fica com os `top_n` melhores.
+        Recebe e devolve (ids, documentos, metadatas, distancias), como recuperar_chunks;
+        as distâncias vetoriais acompanham os seus chunks.
+        """
+        if not ids:
+            return ids, documentos, metadatas, distancias
+        pontuacoes = self.pontuar(query_text, ids, documentos)
+        # sorted é estável: empates mantêm a ordem da recuperação
+        ordem = sorted(range(len(ids)), key=lambda i: -pontuacoes[i])[:top_n]
+        logger.debug(f"Re-ranking: {len(ids)} candidatos -> top {len(ordem)} "
+                     f"(pontuações {', '.join(f'{pontuacoes[i]:.3f}' for i in ordem)})")
+        return (
+            [ids[i] for i in ordem],
+            [documentos[i] for i in ordem],
+            [metadatas[i] for i in ordem],
+            [distancias[i] for i in ordem],
+        )
@@ -0,0 +1,50 @@
+# test_drugbank_snapshot.py
+# Ida e volta do snapshot colunar: os registros lidos do snapshot são iguais aos escritos.
+#   python -m pytest -q test_drugbank_snapshot.py
+
+import drugbank_snapshot
+from drugbank_snapshot import EscritorSnapshot, Snapshot, ler_dataset
+
+
+def _gravar(diretorio, registros):
+    escritor = EscritorSnapshot(str(diretorio))
+    for registro in registros:
+        escritor.adicionar(registro)
+    escritor.fechar()
+    return str(diretorio)
+
+
+def test_ida_e_volta(tmp_path):
+    registros = [
+        {'drugbank_id': 'DB00001', 'name': 'Alfa', 'synonyms': ['A', 'Alpha'],
+         'targets': [{'name': 'PBP', 'uniprot_id': None}], 'classification': {'kingdom': 'Orgânico'}},
+        {'drugbank_id': 'DB00002', 'name': None, 'synonyms': [],
+         'targets': [{'name': 'DHFR'}], 'classification': {}},
+        {'drugbank_id': 'DB00003'},
+    ]
+    caminho = _gravar(tmp_path / 'snap', registros)
+    assert list(Snapshot(caminho).registros()) == registros
+    assert [Snapshot(caminho).registro(i) for i in range(3)] == registros
+
+
+def test_campo_sempre_nulo(tmp_path):
+    # Um campo None em todos os registros não tem tipo nem arrays de dados
+    registros = [
+        {'drugbank_id': 'DB00001', 'clearance': None, 'metabolism': None},
+        {'drugbank_id': 'DB00002', 'clearance': None},
+    ]
+    caminho = _gravar(tmp_path / 'snap', registros)
+    assert list(Snapshot(caminho).registros()) == registros
+    assert list(ler_dataset(caminho, ['clearance'])) == [{'clearance': None}, {'clearance': None}]
+    assert Snapshot(caminho).registro(1, ['metabolism', 'clearance']) == {'clearance': None}
+
+
+def test_buffers_descarregados(tmp_path, monkeypatch):
+    # Com buffers minúsculos cada array é acrescentado ao arquivo várias vezes
+    monkeypatch.setattr(drugbank_snapshot, 'tamanho_buffer', 3)
+    registros = [{'drugbank_id': f'DB{i:05d}', 'synonyms': [f's{i}', f's{i % 2}'] * (i % 3),
+                  'targets': [{'name': f't{i % 4}'}]} for i in range(20)]
+    registros[7]['classification'] = {'kingdom': 'Orgânico'}
+    caminho = _gravar(tmp_path / 'snap', registros)
+    assert list(Snapshot(caminho).registros()) == registros
+    assert not (tmp_path / 'snap.tmp').exists()
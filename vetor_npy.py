@@ -0,0 +1,303 @@
+# vetor_npy.py
+# Backend vetorial embutido, alternativo ao ChromaDB para coleções pequenas (dezenas de
+# milhares de vetores de 384 dimensões). Os embeddings normalizados ficam num .npy aberto
+# por memory-map (float32, ou int8 com uma escala por vetor) e os documentos/metadados numa
+# tabela SQLite ao lado. A busca é exata: um produto matriz-vetor do NumPy e argpartition
+# para o top-k. Abrir o índice é quase instantâneo e vários processos que o abram partilham
+# as mesmas páginas do arquivo na cache do sistema operativo.
+#
+# Arquivos no diretório do índice:
+#   vetores.npy        (n, dim) float32 normalizados, ou int8 quantizados
+#   escalas.npy        (n,) float32, só para int8: vetor ≈ vetores[i] * escalas[i]
+#   metadados.sqlite   metadados(linha, chunk_id, chunk_type, drugbank_id, documento, metadata)
+#   versao_indice.txt  versão do índice do ChromaDB exportada (ver rag_cache.escrever_versao_indice)
+#
+# ColecaoNpy expõe query(), get() e count() com a mesma forma de resultado do ChromaDB,
+# com distância L2 ao quadrado (a métrica padrão do ChromaDB) entre vetores normalizados.
+
+import json
+import os
+import shutil
+import sqlite3
+import threading
+
+import numpy as np
+
+# Linhas por bloco no produto matriz-vetor (limita a memória temporária da conversão do int8)
+linhas_por_bloco = 8192
+
+# Metadados com coluna própria e índice no SQLite (usados pelos filtros do planeador)
+COLUNAS_INDEXADAS = ('chunk_type', 'drugbank_id')
+
+ARQUIVO_VETORES = 'vetores.npy'
+ARQUIVO_ESCALAS = 'escalas.npy'
+ARQUIVO_METADADOS = 'metadados.sqlite'
+ARQUIVO_VERSAO = 'versao_indice.txt'
+
+
+def normalizar_linhas(matriz):
+    matriz = np.asarray(matriz, dtype=np.float32)
+    normas = np.linalg.norm(matriz, axis=-1, keepdims=True)
+    normas[normas == 0] = 1.0
+    return matriz / normas
+
+
+def quantizar_int8(matriz):
+    """Quantização simétrica por vetor: devolve (int8, escalas float32)."""
+    escalas = np.abs(matriz).max(axis=1) / 127.0
+    escalas[escalas == 0] = 1.0
+    quantizada = np.rint(matriz / escalas[:, None]).astype(np.int8)
+    return quantizada, escalas.astype(np.float32)
+
+
+def info_exportacao(diretorio):
+    """{'dtype', 'versao'} do índice .npy em `diretorio`, ou None se não houver nenhum."""
+    if not os.path.isfile(os.path.join(diretorio, ARQUIVO_VETORES)):
+        return None
+    try:
+        with open(os.path.join(diretorio, ARQUIVO_VERSAO), 'r', encoding='utf-8') as f:
+            versao = f.read().strip() or None
+    except OSError:
+        versao = None
+    dtype = 'int8' if os.path.exists(os.path.join(diretorio, ARQUIVO_ESCALAS)) else 'float32'
+    return {'dtype': dtype, 'versao': versao}
+
+
+def exportar_colecao(collection, diretorio, dtype='float32', tamanho_pagina=1024, versao=None):
+    """
+    Copia os embeddings, documentos e metadados de uma coleção do ChromaDB para um índice
+    .npy em `diretorio`. O índice é escrito num diretório temporário e só depois substitui o anterior.
+    `versao` (a versão do índice da coleção) fica gravada com ele. Devolve o número de vetores exportados.
+    """
+    if dtype not in ('float32', 'int8'):
+        raise ValueError(f"dtype não suportado: {dtype} (use 'float32' ou 'int8')")
+
+    temporario = diretorio.rstrip('/\\') + '.tmp'
+    shutil.rmtree(temporario, ignore_errors=True)
+    os.makedirs(temporario)
+
+    total = collection.count()
+    db = sqlite3.connect(os.path.join(temporario, ARQUIVO_METADADOS))
+    db.executescript(
+        "PRAGMA journal_mode = OFF;"
+        "PRAGMA synchronous = OFF;"
+        "CREATE TABLE metadados (linha INTEGER PRIMARY KEY, chunk_id TEXT NOT NULL, chunk_type TEXT,"
+        " drugbank_id TEXT, documento TEXT, metadata TEXT NOT NULL);"
+    )
+
+    vetores = escalas = None
+    linha = 0
+    while linha < total:
+        pagina = collection.get(include=['embeddings', 'documents', 'metadatas'],
+                                limit=tamanho_pagina, offset=linha)
+        if not pagina['ids']:
+            break
+        embeddings = normalizar_linhas(pagina['embeddings'])
+        if vetores is None:
+            vetores = np.lib.format.open_memmap(os.path.join(temporario, ARQUIVO_VETORES), mode='w+',
+                                                dtype=np.dtype(dtype), shape=(total, embeddings.shape[1]))
+            if dtype == 'int8':
+                escalas = np.lib.format.open_memmap(os.path.join(temporario, ARQUIVO_ESCALAS), mode='w+',
+                                                    dtype=np.float32, shape=(total,))
+
+        fim = linha + len(pagina['ids'])
+        if dtype == 'int8':
+            vetores[linha:fim], escalas[linha:fim] = quantizar_int8(embeddings)
+        else:
+            vetores[linha:fim] = embeddings
+
+        linhas = []
+        for i, (chunk_id, documento, metadata) in enumerate(
+                zip(pagina['ids'], pagina['documents'], pagina['metadatas'])):
+            metadata = {k: v for k, v in (metadata or {}).items() if k != 'content_hash'}
+            linhas.append((linha + i, chunk_id, metadata.get('chunk_type'), metadata.get('drugbank_id'),
+                           documento, json.dumps(metadata, ensure_ascii=False)))
+        db.executemany("INSERT INTO metadados VALUES (?, ?, ?, ?, ?, ?)", linhas)
+        linha = fim
+
+    if vetores is None:
+        db.close()
+        shutil.rmtree(temporario)
+        raise ValueError("A coleção está vazia; nada a exportar.")
+    vetores.flush()
+    if escalas is not None:
+        escalas.flush()
+    del vetores, escalas
+
+    db.executescript(
+        "CREATE UNIQUE INDEX idx_chunk_id ON metadados (chunk_id);"
+        + "".join(f"CREATE INDEX idx_{coluna} ON metadados ({coluna});" for coluna in COLUNAS_INDEXADAS)
+    )
+    db.commit()
+    db.close()
+    if versao is not None:
+        with open(os.path.join(temporario, ARQUIVO_VERSAO), 'w', encoding='utf-8') as f:
+            f.write(versao)
+
+    # Troca o índice anterior pelo novo
+    antigo = diretorio.rstrip('/\\') + '.old'
+    shutil.rmtree(antigo, ignore_errors=True)
+    if os.path.exists(diretorio):
+        os.replace(diretorio, antigo)
+    os.replace(temporario, diretorio)
+    shutil.rmtree(antigo, ignore_errors=True)
+    return linha
+
+
+def _expressao_campo(campo):
+    if campo in COLUNAS_INDEXADAS:
+        return campo, ()
+    return "json_extract(metadata, ?)", (f'$.{campo}',)
+
+
+def filtro_sql(where):
+    """Traduz um filtro `where` do ChromaDB ($and, $or, $eq, $ne, $in, $nin) numa condição SQL."""
+    condicoes, parametros = [], []
+    for chave, valor in where.items():
+        if chave in ('$and', '$or'):
+            partes = [filtro_sql(sub) for sub in valor]
+            juncao = ' AND ' if chave == '$and' else ' OR '
+            condicoes.append('(' + juncao.join(sql for sql, _ in partes) + ')')
+            for _, params in partes:
+                parametros.extend(params)
+            continue
+
+        expressao, params = _expressao_campo(chave)
+        operadores = valor if isinstance(valor, dict) else {'$eq': valor}
+        for operador, operando in operadores.items():
+            if operador in ('$eq', '$ne'):
+                condicoes.append(f"{expressao} {'=' if operador == '$eq' else '!='} ?")
+                parametros.extend(params + (operando,))
+            elif operador in ('$in', '$nin'):
+                marcadores = ','.join('?' * len(operando))
+                condicoes.append(f"{expressao} {'IN' if operador == '$in' else 'NOT IN'} ({marcadores})")
+                parametros.extend(params + tuple(operando))
+            else:
+                raise ValueError(f"Operador de filtro não suportado: {operador}")
+    return ' AND '.join(condicoes) or '1', parametros
+
+
+class ColecaoNpy:
+    """
+    Índice .npy com a interface de consulta de uma coleção do ChromaDB. Com `versao_esperada`,
+    recusa (ValueError) um índice exportado de outra versão da coleção.
+    """
+
+    def __init__(self, diretorio, versao_esperada=None):
+        self.diretorio = diretorio
+        if versao_esperada is not None:
+            info = info_exportacao(diretorio)
+            versao = info['versao'] if info else None
+            if versao != versao_esperada:
+                raise ValueError(f"O índice .npy em {diretorio} está desatualizado (versão {versao}, coleção "
+                                 f"{versao_esperada}); volte a exportá-lo com drugbank_vetor.py --exportar-npy")
+        self.vetores = np.load(os.path.join(diretorio, ARQUIVO_VETORES), mmap_mode='r')
+        caminho_escalas = os.path.join(diretorio, ARQUIVO_ESCALAS)
+        self.escalas = np.load(caminho_escalas, mmap_mode='r') if os.path.exists(caminho_escalas) else None
+        self._db = sqlite3.connect(f"file:{os.path.join(diretorio, ARQUIVO_METADADOS)}?mode=ro",
+                                   uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+
+    def count(self):
+        return len(self.vetores)
+
+    def _linhas_filtradas(self, where):
+        condicao, parametros = filtro_sql(where)
+        with self._lock:
+            linhas = self._db.execute(f"SELECT linha FROM metadados WHERE {condicao} ORDER BY linha",
+                                      parametros).fetchall()
+        return np.fromiter((linha for linha, in linhas), dtype=np.int64, count=len(linhas))
+
+    def _pontuar(self, vetores, escalas, consultas):
+        """Produtos internos (n_consultas, n_linhas) entre as consultas e um bloco de vetores."""
+        if escalas is None:
+            return consultas @ vetores.T
+        return (consultas @ vetores.astype(np.float32).T) * escalas
+
+    def pontuacoes(self, consultas, linhas=None):
+        """Similaridade de cosseno entre as consultas normalizadas e as linhas indicadas (todas se None)."""
+        if linhas is not None:
+            escalas = self.escalas[linhas] if self.escalas is not None else None
+            return self._pontuar(self.vetores[linhas], escalas, consultas)
+
+        resultado = np.empty((len(consultas), len(self.vetores)), dtype=np.float32)
+        for inicio in range(0, len(self.vetores), linhas_por_bloco):
+            fim = inicio + linhas_por_bloco
+            escalas = self.escalas[inicio:fim] if self.escalas is not None else None
+            resultado[:, inicio:fim] = self._pontuar(self.vetores[inicio:fim], escalas, consultas)
+        return resultado
+
+    def _registros(self, linhas):
+        """(chunk_id, documento, metadata) das linhas indicadas, pela mesma ordem."""
+        if not len(linhas):
+            return []
+        linhas = [int(linha) for linha in linhas]
+        with self._lock:
+            encontrados = {
+                linha: (chunk_id, documento, json.loads(metadata))
+                for linha, chunk_id, documento, metadata in self._db.execute(
+                    f"SELECT linha, chunk_id, documento, metadata FROM metadados"
+                    f" WHERE linha IN ({','.join('?' * len(linhas))})", linhas)
+            }
+        return [encontrados[linha] for linha in linhas]
+
+    def query(self, query_embeddings, n_results=10, where=None, include=('documents', 'metadatas', 'distances')):
+        """Top-k exato por similaridade de cosseno; devolve o mesmo formato que collection.query."""
+        consultas = normalizar_linhas(np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32)))
+        linhas = self._linhas_filtradas(where) if where else None
+        resultados = {'ids': [], 'documents': [], 'metadatas': [], 'distances': []}
+
+        candidatos = len(linhas) if linhas is not None else len(self.vetores)
+        k = min(n_results, candidatos)
+        pontuacoes = self.pontuacoes(consultas, linhas) if k else None
+        for i in range(len(consultas)):
+            if not k:
+                melhores = np.empty(0, dtype=np.int64)
+                similaridades = np.empty(0, dtype=np.float32)
+            else:
+                linha_pontuacoes = pontuacoes[i]
+                melhores = np.argpartition(-linha_pontuacoes, k - 1)[:k]
+                melhores = melhores[np.argsort(-linha_pontuacoes[melhores])]
+                similaridades = linha_pontuacoes[melhores]
+                if linhas is not None:
+                    melhores = linhas[melhores]
+
+            registros = self._registros(melhores)
+            resultados['ids'].append([chunk_id for chunk_id, _, _ in registros])
+            resultados['documents'].append([documento for _, documento, _ in registros])
+            resultados['metadatas'].append([metadata for _, _, metadata in registros])
+            # Distância L2 ao quadrado entre vetores unitários, como o ChromaDB
+            resultados['distances'].append([float(2.0 - 2.0 * s) for s in similaridades])
+
+        return {chave: valor for chave, valor in resultados.items() if chave == 'ids' or chave in include}
+
+    def get(self, ids=None, where=None, limit=None, offset=0, include=('documents', 'metadatas')):
+        """Documentos e metadados por chunk_id e/ou filtro, no formato de collection.get."""
+        if ids is not None and not len(ids):
+            return {'ids': [], 'documents': [], 'metadatas': []}
+        condicoes, parametros = [], []
+        if ids is not None:
+            condicoes.append(f"chunk_id IN ({','.join('?' * len(ids))})")
+            parametros.extend(ids)
+        if where:
+            condicao, params = filtro_sql(where)
+            condicoes.append(condicao)
+            parametros.extend(params)
+        sql = "SELECT chunk_id, documento, metadata FROM metadados"
+        if condicoes:
+            sql += " WHERE " + " AND ".join(condicoes)
+        sql += " ORDER BY linha"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)} OFFSET {int(offset)}"
+        with self._lock:
+            linhas = self._db.execute(sql, parametros).fetchall()
+
+        resultado = {'ids': [chunk_id for chunk_id, _, _ in linhas]}
+        if 'documents' in include:
+            resultado['documents'] = [documento for _, documento, _ in linhas]
+        if 'metadatas' in include:
+            resultado['metadatas'] = [json.loads(metadata) for _, _, metadata in linhas]
+        return resultado
+
+    def fechar(self):
+        self._db.close()